@@ -0,0 +1,245 @@
+"""
+Micro-benchmarks for the CPU-bound parts of the pipeline.
+
+Run from the backend directory, e.g. ``python benchmark.py validation --rows 10000``.
+"""
+
+import argparse
+import contextlib
+import filecmp
+import io
+import os
+import tempfile
+import timeit
+
+
+def synthetic_units(rows: int) -> list[dict]:
+    return [
+        {
+            "Service Unit": f"Unit {i}",
+            "Company": f"Company {i % 30}",
+            "Is Group": "0",
+            "Service Unit Type": "Inpatient Service Unit"
+            if i % 4 == 0
+            else "Outpatient Service Unit",
+            "Is MCH": i % 2,
+            "Warehouse": f"Main Pharmacy - W{i % 30}",
+            "Parent Service Unit": f"Outpatient Service Unit - W{i % 30}",
+            "ID": i,
+            "beds": 3 if i % 4 == 0 else None,
+            "service_points": [
+                {"point_name": "Triage", "service_stage": "1"},
+                {"point_name": "ANC", "service_stage": "2"},
+            ],
+        }
+        for i in range(rows)
+    ]
+
+
+def bench_validation(rows: int, repeat: int):
+    from workflow.service_units.schema import ServiceUnitRow, ServiceUnitRowList
+
+    units = synthetic_units(rows)
+    per_row = min(
+        timeit.repeat(
+            lambda: [ServiceUnitRow.model_validate(u) for u in units],
+            number=1,
+            repeat=repeat,
+        )
+    )
+    bulk = min(
+        timeit.repeat(
+            lambda: ServiceUnitRowList.validate_python(units), number=1, repeat=repeat
+        )
+    )
+    print(f"ServiceUnitRow validation, {rows} rows (best of {repeat}):")
+    print(f"  per-row models: {per_row * 1000:8.1f} ms")
+    print(f"  TypeAdapter:    {bulk * 1000:8.1f} ms  ({per_row / bulk:.1f}x)")
+
+
+def synthetic_organized(rows: int) -> dict:
+    units = synthetic_units(rows)
+    inpatient = [unit for unit in units if unit["beds"]]
+    for unit in inpatient:
+        unit["service_points"] = []
+    return {
+        "parent_service_units": [
+            {
+                "service_unit": f"Outpatient Service Unit - W{i}",
+                "parent_service_unit": f"All Healthcare Service Units - W{i}",
+                "company": f"Company {i}",
+                "type": "Outpatient",
+            }
+            for i in range(30)
+        ],
+        "outpatient_units": [unit for unit in units if not unit["beds"]],
+        "inpatient_units": inpatient,
+    }
+
+
+def bench_service_units(rows: int, repeat: int):
+    from workflow.service_units.frame import FrameServiceUnitService
+    from workflow.service_units.service import ServiceUnitService
+
+    organized = synthetic_organized(rows)
+
+    def run(service_class, folder: str):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return service_class().process_all_unit_types(organized, folder)
+
+    timings = {}
+    outputs = {}
+    for name, service_class in (
+        ("rows", ServiceUnitService),
+        ("frame", FrameServiceUnitService),
+    ):
+        folder = tempfile.mkdtemp()
+        outputs[name] = (folder, run(service_class, folder))
+        timings[name] = min(
+            timeit.repeat(
+                lambda service_class=service_class: run(
+                    service_class, tempfile.mkdtemp()
+                ),
+                number=1,
+                repeat=repeat,
+            )
+        )
+
+    # Same tables in the same order, so compare files pairwise
+    (rows_dir, rows_files), (frame_dir, frame_files) = outputs.values()
+    identical = len(rows_files) == len(frame_files) and all(
+        filecmp.cmp(
+            os.path.join(rows_dir, a), os.path.join(frame_dir, b), shallow=False
+        )
+        for a, b in zip(rows_files, frame_files)
+    )
+
+    print(f"process_all_unit_types, {rows} units (best of {repeat}):")
+    print(f"  row engine:   {timings['rows'] * 1000:8.1f} ms")
+    print(
+        f"  frame engine: {timings['frame'] * 1000:8.1f} ms  "
+        f"({timings['rows'] / timings['frame']:.1f}x)"
+    )
+    print(f"  byte-identical output: {identical}")
+
+
+def synthetic_users(rows: int) -> list[dict]:
+    roles = ["Nurse", "Lab Technician", "Physician", "Pharmacist"]
+    return [
+        {
+            "first_name": f"User {i}",
+            "email": f"user{i}@example.com",
+            "phone_number": 700000000 + i,
+            "national_id": str(10000 + i),
+            "gender": "Female" if i % 2 else "Male",
+            "department": "Nursing",
+            "service_units": [f"Unit {j}" for j in range(i % 5)],
+            "warehouses": ["Main Pharmacy - W", "All Warehouses - W"][: i % 3],
+            "company": f"Company {i % 30}",
+            "role": roles[i % 4],
+            "status": "Active",
+            "hwr_id": f"HWR{i}" if i % 3 else None,
+        }
+        for i in range(rows)
+    ]
+
+
+# Inputs where an action ends up with no rows or users fail a row schema; the
+# engines must agree on these too
+USER_EDGE_CASES = {
+    "specialized roles only": [
+        {
+            "email": "a@example.com",
+            "first_name": "A",
+            "role": "Pharmacist",
+            "company": "C",
+            "national_id": "1",
+            "service_units": ["OPD"],
+        },
+        {
+            "email": "b@example.com",
+            "first_name": "B",
+            "role": "Lab Technician",
+            "company": "C",
+            "national_id": "2",
+            "service_units": ["OPD"],
+        },
+    ],
+    "null fields": [
+        {"email": "c@example.com", "first_name": None, "service_units": ["OPD"]},
+        {"email": "d@example.com", "first_name": "D", "service_units": None},
+    ],
+    "no users": [],
+}
+
+
+def bench_users(rows: int, repeat: int):
+    import asyncio
+
+    from workflow.users.frame import FrameUserService
+    from workflow.users.service import UserService
+
+    def run(service_class, users: list[dict], folder: str) -> list[str]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = asyncio.run(
+                service_class().create_users_from_validation(users, folder)
+            )
+        return result["files_created"]
+
+    def identical(users: list[dict]) -> bool:
+        rows_dir, frame_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+        rows_files = run(UserService, users, rows_dir)
+        frame_files = run(FrameUserService, users, frame_dir)
+        return len(rows_files) == len(frame_files) and all(
+            filecmp.cmp(
+                os.path.join(rows_dir, a), os.path.join(frame_dir, b), shallow=False
+            )
+            for a, b in zip(rows_files, frame_files)
+        )
+
+    users = synthetic_users(rows)
+    timings = {
+        name: min(
+            timeit.repeat(
+                lambda service_class=service_class: run(
+                    service_class, users, tempfile.mkdtemp()
+                ),
+                number=1,
+                repeat=repeat,
+            )
+        )
+        for name, service_class in (
+            ("rows", UserService),
+            ("frame", FrameUserService),
+        )
+    }
+
+    print(f"create_users_from_validation, {rows} users (best of {repeat}):")
+    print(f"  row engine:   {timings['rows'] * 1000:8.1f} ms")
+    print(
+        f"  frame engine: {timings['frame'] * 1000:8.1f} ms  "
+        f"({timings['rows'] / timings['frame']:.1f}x)"
+    )
+    print(f"  byte-identical output: {identical(users)}")
+    for name, case in USER_EDGE_CASES.items():
+        print(f"  byte-identical output, {name}: {identical(case)}")
+
+
+BENCHMARKS = {
+    "service_units": bench_service_units,
+    "users": bench_users,
+    "validation": bench_validation,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args.rows, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,43 @@
-import json
+import asyncio
+import logging
 import os
-import pathlib
-import shutil
-import time
-from enum import Enum
+from typing import Annotated
 
-import boto3
 import modal
-from fastapi import Depends, status
+from fastapi import Depends, Request, status
 from fastapi.exceptions import HTTPException
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from google import genai
 from pydantic import BaseModel
 
+from workflow.admission import (
+    AdmissionConfig,
+    AdmissionController,
+    AdmissionRejected,
+    AutoscaleConfig,
+    QueueAutoscaler,
+)
+from workflow.budget import TokenBudget
+from workflow.coldstart import process_uptime
+from workflow.context import WARM_MODULES, WorkflowContext
+from workflow.lazy import IMPORT_SECONDS, boto3, botocore_config, genai
+from workflow.llm import RequestPolicy
+from workflow.pipeline import PipelineConfig, WorkflowPipeline, WorkflowType
+from workflow.storage import DownloadCache, S3Storage
+from workflow.users.cache import ValidationCache, validation_fingerprint
+from workflow.utils import OutputFormat, OutputPackaging
+
 app = modal.App("workflow-automation")
 
 image = (
     modal.Image.debian_slim()
     .apt_install(["wget", "curl"])
     .pip_install_from_requirements("requirements.txt")
+    # WORKFLOW_PROFILE_IMPORTS=1 at deploy time logs `-X importtime` output
+    .env(
+        {"PYTHONPROFILEIMPORTTIME": "1"}
+        if os.environ.get("WORKFLOW_PROFILE_IMPORTS") == "1"
+        else {}
+    )
     .add_local_python_source("workflow")
 )
 
@@ -26,282 +45,245 @@ modal_volume = modal.Volume.from_name(
     "workflow-automation-volume", create_if_missing=True
 )
 
+# Queue depth of every WorkflowServer container, so autoscaler settings are
+# derived from the whole app's load rather than one container's
+autoscaler_state = modal.Dict.from_name(
+    "workflow-automation-autoscaler", create_if_missing=True
+)
+
 workflow_automation_secrets = secrets = [
     modal.Secret.from_name("workflow-auto-secrets")
 ]
 
 auth_scheme = HTTPBearer()
+BearerToken = Annotated[HTTPAuthorizationCredentials, Depends(auth_scheme)]
+
 
+def service_unavailable(rejection: AdmissionRejected) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=rejection.reason,
+        headers={"Retry-After": str(rejection.retry_after)},
+    )
+
+
+def update_autoscaler(**settings):
+    """
+    Apply autoscaler settings to the deployed WorkflowServer. They are
+    app-wide; QueueAutoscaler only calls this from the container holding its
+    leader lease.
+    """
+    modal.Cls.from_name(app.name, "WorkflowServer")().update_autoscaler(**settings)
 
-class WorkflowType(Enum):
-    users = "users"
-    service_units = "service_units"
+
+def verify_token(token: HTTPAuthorizationCredentials):
+    if token.credentials != os.environ["AUTH_TOKEN"]:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
 
 
 class WorkFlowPayload(BaseModel):
     payload: str
     workflow_type: WorkflowType
     folder_id: str
+    output_format: OutputFormat = OutputFormat.csv
+    output_packaging: OutputPackaging = OutputPackaging.files
 
 
 MODEL_NAME = "gemini-2.5-flash"
 
+# Requests spend most of their time waiting on Gemini and S3, so one container
+# runs several at once and queues a bounded number more; beyond that requests
+# get a 503 with Retry-After. Read at deploy time to tune per environment.
+ADMISSION = AdmissionConfig.from_env()
+MAX_CONCURRENT_INPUTS = ADMISSION.max_running
+# Modal min/buffer containers and scaledown window, plus how far the observed
+# queue depth may raise them
+AUTOSCALE = AutoscaleConfig.from_env()
+MAX_CONCURRENT_LLM_REQUESTS = int(
+    os.environ.get("WORKFLOW_MAX_CONCURRENT_LLM_REQUESTS", "8")
+)
+# Threads for file parsing/writing and S3 transfers, shared by all inputs
+WORKER_THREADS = int(
+    os.environ.get("WORKFLOW_WORKER_THREADS", str(MAX_CONCURRENT_INPUTS * 4))
+)
+
+# Per-row validation results reused across resubmitted staff sheets
+# (0 disables the cache)
+VALIDATION_CACHE_PATH = "/workflow_vol/cache/validation_cache"
+VALIDATION_CACHE_SIZE = int(os.environ.get("WORKFLOW_VALIDATION_CACHE_SIZE", "50000"))
+
+# DEBUG adds whole CSVs and model payloads to the logs
+LOG_LEVEL = os.environ.get("WORKFLOW_LOG_LEVEL", "INFO")
+
+# Seconds from container process start to the first request being served;
+# exceeding it is logged (0 disables the check)
+COLD_START_BUDGET = float(os.environ.get("WORKFLOW_COLD_START_BUDGET", "0"))
+
+# Downloaded user sheets kept on the volume, keyed by S3 ETag (0 disables)
+DOWNLOAD_CACHE_DIR = "/workflow_vol/cache/downloads"
+DOWNLOAD_CACHE_BYTES = int(
+    os.environ.get("WORKFLOW_DOWNLOAD_CACHE_BYTES", str(2 * 1024**3))
+)
+
 
 @app.cls(
     image=image,
     gpu="L4",  # not doing heavy AI tasks
     volumes={"/workflow_vol": modal_volume},
     secrets=[modal.Secret.from_name("workflow-auto-secrets")],
-    scaledown_window=15,
+    **AUTOSCALE.modal_options(),
+)
+# Modal scales out to keep each container at MAX_CONCURRENT_INPUTS, and routes
+# more inputs than running + queued to a busy one so the overflow reaches the
+# admission controller and gets a 503 with Retry-After, rather than waiting in
+# Modal's queue
+@modal.concurrent(
+    max_inputs=ADMISSION.modal_max_inputs(),
+    target_inputs=MAX_CONCURRENT_INPUTS,
 )
 class WorkflowServer:
     @modal.enter()
     def load_models(self):
+        logging.basicConfig(level=LOG_LEVEL)
+
+        # Everything a request needs is built once here, so per-request setup
+        # is only the job's own scratch directory and service instance
+        config = PipelineConfig.from_env()
+        self.context = WorkflowContext.create(
+            max_workers=WORKER_THREADS,
+            modules=WARM_MODULES
+            + (
+                ("workflow.service_units.frame",)
+                if config.service_unit_engine == "frame"
+                else ()
+            )
+            + (("workflow.users.frame",) if config.user_engine == "frame" else ()),
+        )
+
         print("Creating gemini client...")
-        self.gemini_client = genai.Client(api_key=os.environ["GEMINI_API_KEY"])
+        self.gemini_client = self.context.timed(
+            "gemini_client",
+            lambda: genai.Client(api_key=os.environ["GEMINI_API_KEY"]),
+        )
         print("Created gemini client...")
 
-    def _extract_json_payload(self, text: str) -> str:
-        """
-        Best-effort helper to extract a JSON object/array from an LLM response.
-        Handles accidental markdown fences or explanations around the JSON.
-        """
-        if not text:
-            return ""
-
-        text = text.strip()
-
-        # Quick path: already looks like pure JSON
-        if (text.startswith("{") and text.endswith("}")) or (
-            text.startswith("[") and text.endswith("]")
-        ):
-            return text
-
-        # Strip common markdown fences if present
-        if text.startswith("```"):
-            # Remove the first fence (and optional language tag)
-            parts = text.split("```")
-            if len(parts) >= 3:
-                # Join everything between the first and last fence
-                inner = "```".join(parts[1:-1]).strip()
-                text = inner or text
-
-        # Fallback: find first JSON bracket and last matching
-        start_candidates = [i for i in (text.find("{"), text.find("[")) if i != -1]
-        if not start_candidates:
-            return text
-
-        start = min(start_candidates)
-        # Try object first, then array
-        end_obj = text.rfind("}")
-        end_arr = text.rfind("]")
-        end = max(end_obj, end_arr)
-
-        if end == -1 or end <= start:
-            return text
-
-        return text[start : end + 1]
-
-    def process_data(self, prompt: str):
-        response = self.gemini_client.models.generate_content(
-            model=MODEL_NAME,
-            contents=prompt,
+        # Shared by all concurrent inputs; boto3 clients are thread-safe and the
+        # pool is sized so parallel uploads don't queue for a connection
+        self.s3_client = self.context.timed(
+            "s3_client",
+            lambda: boto3.client(
+                "s3", config=botocore_config.Config(max_pool_connections=WORKER_THREADS)
+            ),
         )
-
-        if not response.text:
-            print("AI returned empty response")
-            raise HTTPException(status_code=500, detail="AI returned an empty response")
-
-        return response.text
-
-    def upload_files(self, files: list[str], base_dir: str, folder_name: str):
-        s3_client = boto3.client("s3")
-        for file in files:
-            file_path = f"{base_dir}/{file}"
-            output_s3_key = f"{folder_name}/{file}"
-            s3_client.upload_file(
-                file_path, os.environ["S3_BUCKET_NAME"], output_s3_key
-            )
-
-    def download_file(self, file_name: str, base_dir: str, folder_name: str):
-        s3_key = f"{folder_name}/{file_name}"
-        file_path = f"{base_dir}/{file_name}"
-        s3_client = boto3.client("s3")
-        s3_client.download_file(os.environ["S3_BUCKET_NAME"], s3_key, str(file_path))
-
-        return file_path
-
-    def _extract_and_organize_data(self, csv_text: str) -> dict:
-        from workflow.service_units.prompts import (
-            EXTRACT_SERVICE_UNITS_PROMPT,
-            ORGANIZE_SERVICE_UNITS_PROMPT,
+        self.llm_semaphore = asyncio.Semaphore(MAX_CONCURRENT_LLM_REQUESTS)
+        self.token_budget = TokenBudget.from_env()
+        self.llm_policy = RequestPolicy.from_env(
+            self.gemini_client, MODEL_NAME, semaphore=self.llm_semaphore
         )
-
-        # Extract service units
-        extracted_data_str = self.process_data(
-            prompt=EXTRACT_SERVICE_UNITS_PROMPT.format(csv_text=csv_text)
+        self.autoscaler = QueueAutoscaler(
+            AUTOSCALE,
+            MAX_CONCURRENT_INPUTS,
+            apply=update_autoscaler,
+            shared=autoscaler_state,
+            container_id=os.environ.get("MODAL_TASK_ID"),
         )
-        extracted_data_clean = self._extract_json_payload(extracted_data_str)
-        if not extracted_data_clean:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="AI returned empty response while extracting service units",
-            )
-
-        extracted_data = json.loads(extracted_data_clean)
-
-        if not extracted_data or not isinstance(extracted_data, list):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Generated invalid input - expected list of service units",
-            )
-
-        print("Extracted data:", json.dumps(extracted_data, indent=2))
-
-        # Sleep to avoid Gemini rate limits
-        print("Cool down before making ai request....")
-        time.sleep(5)
-        print("Performing ai request....")
-
-        # Organize service units
-        organized_prompt = ORGANIZE_SERVICE_UNITS_PROMPT.format(
-            service_units_json=json.dumps(extracted_data)
+        self.admission = AdmissionController(
+            ADMISSION,
+            quota_retry_after=self.llm_policy.quota_retry_after,
+            autoscaler=self.autoscaler,
         )
-
-        # Simple retry loop in case the model returns empty/invalid JSON the first time
-        last_error: str | None = None
-        organized_data = None
-        for attempt in range(3):
-            organized_data_str = self.process_data(prompt=organized_prompt)
-            organized_data_clean = self._extract_json_payload(organized_data_str)
-
-            if not organized_data_clean:
-                last_error = "AI returned empty response while organizing service units"
-                time.sleep(2)
-                continue
-
-            try:
-                organized_data = json.loads(organized_data_clean)
-                break
-            except json.JSONDecodeError as e:
-                last_error = (
-                    f"AI returned invalid JSON while organizing service units: {e}"
-                )
-                time.sleep(2)
-
-        if organized_data is None:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=last_error
-                or "AI failed to organize service units after multiple attempts",
-            )
-
-        print("Organized service units:", json.dumps(organized_data, indent=2))
-        return organized_data
-
-    def process_service_units(self, payload: str, base_dir: str, folder_name: str):
-        from workflow.service_units.schema import ServiceUnitInput
-        from workflow.service_units.service import ServiceUnitService
-
-        service_unit_service = ServiceUnitService()
-        service_units_data = json.loads(payload)
-
-        # Generate skeleton CSV
-        filepath = service_unit_service.generate_service_unit_skeleton(
-            [ServiceUnitInput(**unit_data) for unit_data in service_units_data],
-            base_dir,
+        self.validation_cache = ValidationCache(
+            VALIDATION_CACHE_PATH,
+            max_entries=VALIDATION_CACHE_SIZE,
+            fingerprint=validation_fingerprint(
+                MODEL_NAME, self.llm_policy.fallback_model
+            ),
         )
-
-        if not filepath:
-            raise ValueError("Failed to generate service unit skeleton")
-
-        # Read CSV and extract data using AI
-        with open(filepath, "r", encoding="utf-8") as f:
-            csv_text = f.read()
-            print(csv_text)
-
-        extracted_data = self._extract_and_organize_data(csv_text)
-
-        generated_files = service_unit_service.process_all_unit_types(
-            extracted_data, base_dir
+        if VALIDATION_CACHE_SIZE > 0:
+            self.context.timed("validation_cache", self.validation_cache.preload)
+        self.download_cache = DownloadCache(
+            self.s3_client, DOWNLOAD_CACHE_DIR, max_bytes=DOWNLOAD_CACHE_BYTES
         )
-
-        print("Generated files: ", generated_files)
-
-        print("Uploading files...")
-        self.upload_files(generated_files, base_dir, folder_name)
-        print("Uploaded files...")
-
-    def process_users(self, payload: str, base_dir: str, folder_name: str):
-        import asyncio
-
-        from workflow.users.prompt import VALIDATE_USERS_PROMPT
-        from workflow.users.service import UserService
-        from workflow.utils import read_file_to_csv
-
-        user_service = UserService()
-        user_data = json.loads(payload)
-
-        # download_file
-        file_path = self.download_file(user_data["file_name"], base_dir, folder_name)
-        print("File downloaded ", file_path)
-
-        # Read CSV and extract data using AI
-        csv_data = read_file_to_csv(file_path=file_path)
-        print(csv_data)
-
-        response_data = self.process_data(
-            prompt=VALIDATE_USERS_PROMPT.format(users_json=json.dumps(csv_data))
+        self.storage = S3Storage(
+            self.s3_client,
+            os.environ["S3_BUCKET_NAME"],
+            download_cache=self.download_cache,
+            on_cache_miss=modal_volume.commit,
         )
-
-        print("Validated users ", response_data)
-
-        valid_users_clean = self._extract_json_payload(response_data)
-
-        validated_data = json.loads(valid_users_clean)
-        valid_users = validated_data.get("valid_users", [])
-        # errors = validated_data.get("errors", [])
-
-        result = asyncio.run(
-            user_service.create_users_from_validation(valid_users, base_dir)
+        self.pipeline = WorkflowPipeline(
+            self.llm_policy,
+            self.storage,
+            config=config,
+            token_budget=self.token_budget,
+            validation_cache=self.validation_cache,
+            commit=modal_volume.commit,
+            context=self.context,
+        )
+        self.stream_jobs: set[asyncio.Task] = set()
+        self.first_request_seen = False
+        print(
+            "Container initialized:",
+            {
+                **self.context.report(),
+                "deferred_imports": dict(IMPORT_SECONDS),
+                "process_uptime": process_uptime(),
+            },
         )
-        print(result)
-        generated_files = result["files_created"]
 
-        print("Generated files: ", generated_files)
+    def admit(self):
+        """Reserve a place for a request, or reject it with a 503."""
+        try:
+            return self.admission.admit()
+        except AdmissionRejected as e:
+            print(f"Rejected request: {e.reason} (retry after {e.retry_after}s)")
+            raise service_unavailable(e)
+
+    def note_first_request(self):
+        if self.first_request_seen:
+            return
+        self.first_request_seen = True
 
-        print("Uploading files...")
-        self.upload_files(generated_files, base_dir, folder_name)
-        print("Uploaded files...")
+        uptime = process_uptime()
+        print(f"Cold start: first request {uptime}s after process start")
+        if COLD_START_BUDGET and uptime and uptime > COLD_START_BUDGET:
+            print(f"⚠ Cold start exceeded its budget of {COLD_START_BUDGET}s")
 
     @modal.fastapi_endpoint(method="POST")
-    def process_workflow(
+    async def process_workflow(
         self,
         payload: WorkFlowPayload,
-        token: HTTPAuthorizationCredentials = Depends(auth_scheme),
+        token: BearerToken,
     ):
         print("Processing payload...", payload)
-        if token.credentials != os.environ["AUTH_TOKEN"]:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-
-        # make base_dir
-        base_dir = pathlib.Path(f"/tmp/{payload.folder_id}")
-        base_dir.mkdir(parents=True, exist_ok=True)
-        print("Generated base_dir directory ", str(base_dir))
+        verify_token(token)
+        self.note_first_request()
+        ticket = self.admit()
 
         try:
-            if payload.workflow_type == WorkflowType.service_units:
-                self.process_service_units(
-                    payload.payload, str(base_dir), payload.folder_id
+            async with ticket:
+                manifest = await self.pipeline.run(
+                    payload.workflow_type,
+                    payload.payload,
+                    payload.folder_id,
+                    payload.output_format,
+                    payload.output_packaging,
                 )
-            elif payload.workflow_type == WorkflowType.users:
-                self.process_users(payload.payload, str(base_dir), payload.folder_id)
 
-            return {"status": "success", "message": "Workflow processed successfully"}
+            print("LLM request policy stats:", self.llm_policy.report())
+            print("Admission:", self.admission.report())
+            return {
+                "status": "success",
+                "message": "Workflow processed successfully",
+                "manifest": manifest,
+            }
+
+        except AdmissionRejected as e:
+            print(f"Rejected request: {e.reason} (retry after {e.retry_after}s)")
+            raise service_unavailable(e)
 
         except Exception as e:
             print(f"Error processing workflow: {str(e)}")
@@ -315,12 +297,88 @@ class WorkflowServer:
                 detail=f"Workflow processing failed: {str(e)}",
             )
 
-        finally:
-            # clean up base_dir
-            if base_dir.exists() and base_dir.is_dir():
-                print(f"Cleaning up base dir {base_dir}....")
-                shutil.rmtree(base_dir, ignore_errors=True)
-                print(f"✓ Successfully cleaned up {base_dir}")
+    @modal.fastapi_endpoint(method="POST")
+    async def process_workflow_stream(
+        self,
+        payload: WorkFlowPayload,
+        request: Request,
+        token: BearerToken,
+    ):
+        """
+        Same job as ``process_workflow``, streamed as one progress event per
+        stage. NDJSON by default, server-sent events for
+        ``Accept: text/event-stream``; the last event is "completed" (with the
+        manifest) or "failed".
+        """
+        from fastapi.responses import StreamingResponse
+
+        from workflow.progress import ProgressStream
+
+        print("Streaming payload...", payload)
+        verify_token(token)
+        self.note_first_request()
+        ticket = self.admit()
+
+        progress = ProgressStream()
+
+        async def run():
+            try:
+                async with ticket:
+                    await self.pipeline.run(
+                        payload.workflow_type,
+                        payload.payload,
+                        payload.folder_id,
+                        payload.output_format,
+                        payload.output_packaging,
+                        progress,
+                    )
+                print("LLM request policy stats:", self.llm_policy.report())
+            except AdmissionRejected as e:
+                # Waited too long for a slot; the stream ends with the rejection
+                progress.emit("failed", error=e.reason, retry_after=e.retry_after)
+            except Exception as e:
+                print(f"Error processing workflow: {e}")
+                import traceback
+
+                traceback.print_exc()
+            finally:
+                progress.close()
+
+        # Referenced here so the task isn't garbage collected mid-run
+        job = asyncio.create_task(run())
+        self.stream_jobs.add(job)
+        job.add_done_callback(self.stream_jobs.discard)
+
+        sse = "text/event-stream" in request.headers.get("accept", "")
+
+        async def stream():
+            try:
+                async for chunk in progress.encode(sse):
+                    yield chunk
+            finally:
+                # Modal treats the input as finished once the response ends, so
+                # a job left running after a disconnect could be cut off by a
+                # scale-down while still holding its admission slot. Cancelling
+                # it unwinds the pipeline (work dir cleanup, slot release) here.
+                if not job.done():
+                    print("Client disconnected; cancelling streamed workflow")
+                    job.cancel()
+
+        return StreamingResponse(
+            stream(),
+            media_type="text/event-stream" if sse else "application/x-ndjson",
+            headers={"Cache-Control": "no-cache"},
+        )
+
+    @modal.fastapi_endpoint(method="GET")
+    def metrics(self, token: BearerToken):
+        """Admission queue, autoscaler and model quota state of this container."""
+        verify_token(token)
+        return {
+            "admission": self.admission.report(),
+            "autoscaler": self.autoscaler.report(),
+            "llm": self.llm_policy.report(),
+        }
 
 
 @app.local_entrypoint()
@@ -0,0 +1,62 @@
+from workflow.service_units.compaction import CompactCodec, compact_skeleton_csv
+
+UNITS = [
+    {
+        "Service Unit": "OPD",
+        "Company": "ACME Hospital",
+        "Warehouse": "Main Pharmacy - AH",
+        "Service Unit Capacity": "",
+        "Beds": 0,
+    },
+    {
+        "Service Unit": "Dental",
+        "Company": "BETA Medical Center",
+        "Warehouse": "Main Pharmacy - BA",
+        "Service Unit Capacity": "",
+        "Beds": 2,
+    },
+]
+
+
+def codec_key(codec: CompactCodec, name: str) -> str:
+    return next(key for key, field in codec.keys.items() if field == name)
+
+
+def test_decode_restores_encoded_units():
+    codec = CompactCodec()
+    encoded = codec.encode(UNITS)
+
+    # Empty columns are dropped and repeated strings become lookup indexes
+    assert "Service Unit Capacity" not in encoded["keys"].values()
+    assert encoded["rows"][1][codec_key(codec, "Company")] == 1
+
+    decoded = codec.decode({"outpatient_units": encoded["rows"]})
+    assert decoded == {"outpatient_units": UNITS}
+
+
+def test_decode_expands_plain_named_parent_objects():
+    codec = CompactCodec()
+    codec.encode(UNITS)
+    parent = {"service_unit": "Outpatient Service Unit - BA", "company": 1}
+
+    decoded = codec.decode({"parent_service_units": [parent], "note": "kept"})
+    assert decoded["parent_service_units"] == [
+        {
+            "service_unit": "Outpatient Service Unit - BA",
+            "company": "BETA Medical Center",
+        }
+    ]
+    assert decoded["note"] == "kept"
+
+
+def test_decode_leaves_out_of_range_indexes():
+    codec = CompactCodec()
+    codec.encode(UNITS)
+    row = {codec_key(codec, "Company"): 7}
+
+    assert codec.decode({"units": [row]})["units"][0]["Company"] == 7
+
+
+def test_compact_skeleton_drops_empty_columns():
+    csv_text = "Service Unit,Beds,Is MCH\nOPD,,\nWard,3,\n"
+    assert compact_skeleton_csv(csv_text) == "Service Unit,Beds\nOPD,\nWard,3\n"
@@ -0,0 +1,172 @@
+import asyncio
+import contextlib
+import io
+import os
+import re
+
+import pytest
+from pydantic import ValidationError
+
+from workflow.service_units.frame import FrameServiceUnitService
+from workflow.service_units.service import ServiceUnitService
+from workflow.users.frame import FrameUserService
+from workflow.users.service import UserService
+
+# Generated file names end in a uuid or content hash
+FILE_ID = re.compile(r"_[0-9a-f]{8}-[0-9a-f-]{27}|_[0-9a-f]{16}(?=\.)")
+
+USERS = [
+    {
+        "email": "a@x",
+        "first_name": "A",
+        "role": "Nurse",
+        "company": "ACME Hospital",
+        "warehouses": ["All Warehouses - AH", "Main Pharmacy - AH"],
+        "service_units": ["OPD", "MCH"],
+    },
+    {
+        "email": "b@x",
+        "first_name": "B",
+        "role": "Lab Technician",
+        "company": None,
+        "warehouses": ["Main Pharmacy - AH"],
+    },
+    {
+        "email": "c@x",
+        "first_name": "C",
+        "role": "Pharmacist",
+        "company": "ACME Hospital",
+        "warehouses": "Main Pharmacy - AH",
+    },
+    {
+        "email": "d@x",
+        "first_name": "D",
+        "role": "Nurse",
+        "company": "",
+        "warehouses": [],
+        "service_units": [],
+    },
+    {"email": "e@x", "first_name": "E", "role": "Nurse", "warehouses": None},
+]
+
+UNITS = {
+    "parent_service_units": [
+        {
+            "service_unit": "Outpatient Service Unit - AH",
+            "parent_service_unit": "All Healthcare Service Units - AH",
+            "company": "ACME Hospital",
+            "type": "Outpatient",
+        },
+        {
+            "service_unit": "Inpatient Service Unit - AH",
+            "parent_service_unit": "All Healthcare Service Units - AH",
+            "company": None,
+            "type": "Inpatient",
+        },
+    ],
+    "outpatient_units": [
+        {
+            "service_unit": "OPD",
+            "company": "ACME Hospital",
+            "is_group": 0,
+            "service_unit_type": "Outpatient Service Unit",
+            "is_mch": "true",
+            "warehouse": "Main Facility - AH",
+            "parent_service_unit": "Outpatient Service Unit - AH",
+            "service_points": [
+                {"point_name": "Triage", "service_stage": "1"},
+                {"point_name": "ANC 1", "service_stage": "2"},
+            ],
+        },
+        {
+            "service_unit": "Dental",
+            "company": "ACME Hospital",
+            "is_group": False,
+            "service_unit_type": "Outpatient Service Unit",
+            "warehouse": "Main Facility - AH",
+            "parent_service_unit": "Outpatient Service Unit - AH",
+            "service_points": [],
+        },
+    ],
+    "inpatient_units": [
+        {
+            "service_unit": "Male Ward",
+            "company": "ACME Hospital",
+            "is_group": 0,
+            "service_unit_type": "Inpatient Service Unit",
+            "warehouse": "Main Facility - AH",
+            "parent_service_unit": "Inpatient Service Unit - AH",
+            "beds": "3",
+            "service_points": [],
+        },
+    ],
+    "maternity_wards": [],
+    "inpatient_parent": [],
+}
+
+
+def output_files(folder: str, outputs) -> dict[str, bytes]:
+    files = {}
+    for filename in outputs:
+        with open(os.path.join(folder, filename), "rb") as f:
+            files[FILE_ID.sub("", filename)] = f.read()
+    return files
+
+
+def generate_users(engine, folder: str, users: list[dict], **options) -> dict:
+    os.makedirs(folder, exist_ok=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = asyncio.run(
+            engine(**options).create_users_from_validation(users, folder)
+        )
+    return output_files(folder, result["outputs"])
+
+
+def generate_units(engine, folder: str, organized: dict) -> dict:
+    os.makedirs(folder, exist_ok=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        generated = engine().process_all_unit_types(organized, folder)
+    return output_files(folder, generated)
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{}, {"shard_rows": 3}, {"shard_by_company": True}],
+    ids=["whole", "rows", "company"],
+)
+@pytest.mark.parametrize(
+    "users", [USERS, USERS[2:3], USERS[3:], []], ids=["all", "string", "none", "empty"]
+)
+def test_user_engines_write_identical_files(tmp_path, users, options):
+    rows = generate_users(UserService, str(tmp_path / "rows"), users, **options)
+    frame = generate_users(FrameUserService, str(tmp_path / "frame"), users, **options)
+    assert rows == frame
+
+
+def test_string_warehouses_keep_company_permission(tmp_path):
+    files = generate_users(FrameUserService, str(tmp_path), USERS[2:3])
+    permissions = files["create_user_permission.csv"].decode().splitlines()
+    assert permissions[1] == ",c@x,Company,ACME Hospital,1"
+
+
+@pytest.mark.parametrize(
+    "organized",
+    [
+        UNITS,
+        {**UNITS, "outpatient_units": []},
+        {"parent_service_units": UNITS["parent_service_units"]},
+        {},
+    ],
+    ids=["all", "no-outpatient", "parents", "empty"],
+)
+def test_service_unit_engines_write_identical_files(tmp_path, organized):
+    rows = generate_units(ServiceUnitService, str(tmp_path / "rows"), organized)
+    frame = generate_units(FrameServiceUnitService, str(tmp_path / "frame"), organized)
+    assert rows == frame
+
+
+@pytest.mark.parametrize("engine", [ServiceUnitService, FrameServiceUnitService])
+def test_service_unit_engines_reject_null_unit_company(tmp_path, engine):
+    unit = {**UNITS["outpatient_units"][0], "company": None}
+    with pytest.raises(ValidationError):
+        generate_units(engine, str(tmp_path), {"outpatient_units": [unit]})
@@ -0,0 +1,52 @@
+import csv
+
+from openpyxl import load_workbook
+
+from workflow import utils
+from workflow.utils import OutputPackaging, package_outputs
+
+
+def write_csv(path, rows):
+    with open(path, "w", newline="") as f:
+        csv.writer(f).writerows(rows)
+
+
+def sheets(path):
+    workbook = load_workbook(path)
+    return {
+        sheet.title: [[cell.value for cell in row] for row in sheet.iter_rows()]
+        for sheet in workbook
+    }
+
+
+def test_xlsx_keeps_user_data_as_text(tmp_path):
+    write_csv(
+        tmp_path / "units.csv",
+        [
+            ["ID", "Mobile No", "Rate", "Is Group", "Beds"],
+            ["12345678", "254712345678", "12.50", "1", "5"],
+            ["007", "0712345678", "3", "0", ""],
+        ],
+    )
+    [artifact] = package_outputs(
+        ["units.csv"], str(tmp_path), OutputPackaging.xlsx, "bundle"
+    )
+
+    assert sheets(tmp_path / artifact)["units"][1:] == [
+        ["12345678", "254712345678", "12.50", 1, 5],
+        ["007", "0712345678", "3", 0, None],
+    ]
+
+
+def test_xlsx_continues_long_tables_on_new_sheets(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "XLSX_MAX_ROWS", 2)
+    write_csv(tmp_path / "units.csv", [["Beds"], ["1"], ["2"], ["3"]])
+    [artifact] = package_outputs(
+        ["units.csv"], str(tmp_path), OutputPackaging.xlsx, "bundle"
+    )
+
+    assert sheets(tmp_path / artifact) == {
+        "units": [["Beds"], [1]],
+        "units_2": [["Beds"], [2]],
+        "units_3": [["Beds"], [3]],
+    }
@@ -0,0 +1,23 @@
+import asyncio
+import os
+
+import pytest
+
+from workflow.llm import RecordedLLM
+from workflow.pipeline import WorkflowType
+from workflow.runner import build_pipeline
+
+
+def test_failed_job_leaves_no_work_directories(tmp_path):
+    work_dir = tmp_path / "work"
+    pipeline = build_pipeline(
+        llm=RecordedLLM(str(tmp_path / "llm.json")),
+        storage_root=str(tmp_path / "storage"),
+        work_dir=str(work_dir),
+    )
+
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(
+            pipeline.run(WorkflowType.users, '{"file_name": "staff.csv"}', "demo")
+        )
+    assert os.listdir(work_dir) == []
@@ -0,0 +1,104 @@
+import asyncio
+import types
+
+import pytest
+
+from workflow.llm import LLMRequestError, RequestPolicy
+
+
+class FakeClient:
+    """Answers each call per ``plan``: (delay, text), with text None to fail."""
+
+    def __init__(self, plan: list[tuple[float, str | None]]):
+        self.plan = plan
+        self.calls: list[str] = []
+        self.aio = types.SimpleNamespace(models=self)
+
+    async def generate_content(self, model: str, contents: str):
+        delay, text = self.plan[min(len(self.calls), len(self.plan) - 1)]
+        self.calls.append(model)
+        await asyncio.sleep(delay)
+        if text is None:
+            raise RuntimeError("boom")
+        return types.SimpleNamespace(text=text)
+
+
+def generate(policy: RequestPolicy, **kwargs) -> str:
+    return asyncio.run(policy.generate("prompt", **kwargs))
+
+
+def test_outright_failure_is_retried_once():
+    client = FakeClient([(0, None), (0, "ok")])
+    policy = RequestPolicy(client, "m", hedge_delay=None)
+
+    assert generate(policy) == "ok"
+    assert policy.stats["retries"] == 1 and policy.stats["retry_wins"] == 1
+    assert len(client.calls) == 2
+
+
+def test_slow_attempt_is_hedged():
+    client = FakeClient([(0.5, "slow"), (0, "fast")])
+    policy = RequestPolicy(client, "m", hedge_delay=0.05)
+
+    assert generate(policy) == "fast"
+    assert policy.stats["hedges_fired"] == 1 and policy.stats["hedge_wins"] == 1
+
+
+def test_hedging_can_be_turned_off_per_request():
+    client = FakeClient([(0.2, "slow"), (0, "fast")])
+    policy = RequestPolicy(client, "m", hedge_delay=0.05)
+
+    assert generate(policy, hedge=False) == "slow"
+    assert policy.stats["hedges_fired"] == 0
+
+
+def test_failures_fall_back_to_the_light_model():
+    client = FakeClient([(0, None), (0, None), (0, "light")])
+    policy = RequestPolicy(client, "m", "light-m", hedge_delay=None)
+
+    assert generate(policy) == "light"
+    assert client.calls == ["m", "m", "light-m"]
+    assert policy.stats["fallbacks"] == 1
+
+
+def test_quota_errors_are_not_retried():
+    class QuotaClient(FakeClient):
+        async def generate_content(self, model: str, contents: str):
+            self.calls.append(model)
+            raise RuntimeError("429 RESOURCE_EXHAUSTED {'retryDelay': '17s'}")
+
+    client = QuotaClient([])
+    policy = RequestPolicy(client, "m", hedge_delay=None)
+
+    with pytest.raises(LLMRequestError):
+        generate(policy)
+    assert len(client.calls) == 1
+    assert 16 < policy.quota_retry_after() <= 17
+
+
+def test_deadline_starts_once_a_slot_is_held():
+    async def run() -> tuple[str, RequestPolicy]:
+        semaphore = asyncio.Semaphore(1)
+        policy = RequestPolicy(
+            FakeClient([(0.1, "ok")]),
+            "m",
+            deadline=0.2,
+            hedge_delay=None,
+            semaphore=semaphore,
+        )
+        async with semaphore:
+            task = asyncio.create_task(policy.generate("prompt"))
+            await asyncio.sleep(0.3)
+        return await task, policy
+
+    result, policy = asyncio.run(run())
+    assert result == "ok"
+    assert policy.stats["timeouts"] == 0
+
+
+def test_invalid_responses_count_as_failures():
+    client = FakeClient([(0, "not json"), (0, "{}")])
+    policy = RequestPolicy(client, "m", hedge_delay=None)
+
+    assert generate(policy, validate=lambda text: text.startswith("{")) == "{}"
+    assert policy.stats["failed_attempts"] == 1
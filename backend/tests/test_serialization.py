@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from workflow import serialization
+from workflow.serialization import dump_file, dumps, load_file, loads
+
+VALUES = [
+    "Zoë Wanjirũ",
+    {"first_name": "José", "units": ["Maternité", 3, None]},
+    ["日本", "emoji 😀", " "],
+    {"plain": "ascii only", "nested": {"n": 1.5}},
+]
+
+
+@pytest.fixture(autouse=True, params=["orjson", "json"])
+def encoder(request, monkeypatch):
+    if request.param == "json":
+        monkeypatch.setattr(serialization, "orjson", None)
+    elif serialization.orjson is None:
+        pytest.skip("orjson is not installed")
+
+
+@pytest.mark.parametrize("value", VALUES)
+def test_prompt_bodies_match_json_dumps(value):
+    # Prompts carry the same bytes as json.dumps, in its compact form
+    assert dumps(value) == json.dumps(value, separators=(",", ":"))
+    assert dumps(value).isascii()
+    assert loads(dumps(value)) == value
+
+
+@pytest.mark.parametrize("value", VALUES)
+def test_ensure_ascii_false_keeps_characters(value):
+    assert dumps(value, ensure_ascii=False) == json.dumps(
+        value, ensure_ascii=False, separators=(",", ":")
+    )
+
+
+def test_files_are_written_as_utf8(tmp_path):
+    path = tmp_path / "data.json"
+    dump_file({"name": "Zoë"}, str(path))
+    assert path.read_text(encoding="utf-8") == '{"name":"Zoë"}'
+    assert load_file(str(path)) == {"name": "Zoë"}
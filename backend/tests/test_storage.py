@@ -0,0 +1,22 @@
+import asyncio
+import hashlib
+
+from workflow.storage import LocalStorage
+
+
+def test_upload_reports_this_calls_skipped_files(tmp_path):
+    source = tmp_path / "out"
+    source.mkdir()
+    files = [f"file{i}.csv" for i in range(20)]
+    for file in files:
+        (source / file).write_text(file)
+    checksums = {file: hashlib.sha256(file.encode()).hexdigest() for file in files[:10]}
+    storage = LocalStorage(str(tmp_path / "bucket"))
+
+    first = asyncio.run(storage.upload(files, str(source), "folder", checksums))
+    second = asyncio.run(storage.upload(files, str(source), "folder", checksums))
+
+    assert set(first) == set(files) and first.skipped == set()
+    assert second.skipped == set(files[:10])
+    assert second == first
+    assert (storage.uploads, storage.uploads_skipped) == (30, 10)
@@ -0,0 +1,76 @@
+import asyncio
+import csv
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from workflow.users.frame import FrameUserService, pack_parts
+from workflow.users.service import UserService
+
+USERS = [
+    {"email": "a@x", "first_name": "A", "role": "Nurse", "company": None},
+    {"email": "b@x", "first_name": "B", "role": "Nurse", "company": "ACME Hospital"},
+    {"email": "c@x", "first_name": "C", "role": "Nurse", "company": ""},
+]
+
+
+def generate(service: UserService, folder: str, users: list[dict]) -> dict:
+    os.makedirs(folder, exist_ok=True)
+    result = asyncio.run(
+        service.create_users_from_validation(users, folder, "create_user")
+    )
+    files = {}
+    for filename, info in result["outputs"].items():
+        shard = info.get("shard") or {}
+        with open(os.path.join(folder, filename), newline="") as f:
+            files[(shard.get("company"), shard.get("part"))] = list(csv.reader(f))
+    return files
+
+
+@pytest.mark.parametrize("engine", [UserService, FrameUserService])
+def test_null_company_shards_with_no_company(tmp_path, engine):
+    files = generate(engine(shard_by_company=True), str(tmp_path), USERS)
+
+    assert set(files) == {("", 1), ("ACME Hospital", 1)}
+    # Header plus the users without a company
+    assert len(files[("", 1)]) == 3
+
+
+def test_engines_shard_null_company_alike(tmp_path):
+    rows = generate(UserService(shard_by_company=True), str(tmp_path / "rows"), USERS)
+    frame = generate(
+        FrameUserService(shard_by_company=True), str(tmp_path / "frame"), USERS
+    )
+    assert rows == frame
+
+
+def test_pack_parts_keeps_users_whole():
+    sizes = np.array([2, 2, 1, 5, 1])
+    assert pack_parts(sizes, 4).tolist() == [0, 0, 1, 2, 3]
+    # No limit puts everyone in one part
+    assert pack_parts(sizes, 0).tolist() == [0] * 5
+    assert pack_parts(np.array([], dtype=int), 4).tolist() == []
+
+
+def test_shard_rows_never_splits_a_user():
+    rows = pd.DataFrame(
+        {
+            "User": ["a", "a", "b", "c", "c", "c"],
+            "_user": [0, 0, 1, 2, 2, 2],
+            "_company": ["X", "X", "", "X", "X", "X"],
+        }
+    )
+    shards = FrameUserService(shard_rows=3)._shard_rows(rows)
+    assert [(shard, part["User"].tolist()) for shard, part in shards] == [
+        ({"part": 1, "parts": 2}, ["a", "a", "b"]),
+        ({"part": 2, "parts": 2}, ["c", "c", "c"]),
+    ]
+
+    by_company = FrameUserService(shard_by_company=True)._shard_rows(rows)
+    assert [(shard["company"], len(part)) for shard, part in by_company] == [
+        ("X", 5),
+        ("", 1),
+    ]
+    assert all("_user" not in part for _, part in by_company)
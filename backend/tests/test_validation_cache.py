@@ -0,0 +1,76 @@
+import os
+import time
+
+from workflow.users.cache import ValidationCache, validation_fingerprint
+
+
+def test_containers_keep_each_others_entries(tmp_path):
+    first = ValidationCache(str(tmp_path), max_segments=3)
+    second = ValidationCache(str(tmp_path), max_segments=3)
+    first.preload()
+    second.preload()
+    for i in range(5):
+        first.put(f"a{i}", "valid", {"email": f"a{i}@x", "row_index": i})
+        first.save()
+        second.put(f"b{i}", "error", {"error": f"bad {i}"})
+        second.save()
+
+    fresh = ValidationCache(str(tmp_path))
+    assert fresh.preload() == 10
+    assert fresh.get("a4") == {"kind": "valid", "record": {"email": "a4@x"}}
+    assert fresh.get("b0") == {"kind": "error", "record": {"error": "bad 0"}}
+    # Compaction bounds the segment count
+    assert len(os.listdir(tmp_path)) <= 4
+
+
+def test_save_writes_only_new_entries(tmp_path):
+    cache = ValidationCache(str(tmp_path))
+    cache.put("a", "valid", {})
+    cache.save()
+    cache.save()
+    assert len(os.listdir(tmp_path)) == 1
+
+    cache.put("b", "valid", {})
+    cache.save()
+    sizes = sorted(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path))
+    assert len(sizes) == 2 and sizes[0] == sizes[1]
+
+
+def test_fingerprints_do_not_share_results(tmp_path):
+    old = ValidationCache(str(tmp_path), fingerprint=validation_fingerprint("m1"))
+    old.put("row", "valid", {"email": "a@x"})
+    old.save()
+
+    new = ValidationCache(str(tmp_path), fingerprint=validation_fingerprint("m2"))
+    assert new.get("row") is None
+    again = ValidationCache(str(tmp_path), fingerprint=validation_fingerprint("m1"))
+    assert again.get("row") is not None
+
+
+def test_stale_fingerprints_are_pruned(tmp_path):
+    old = ValidationCache(str(tmp_path), fingerprint="old")
+    old.put("row", "valid", {})
+    old.save()
+    past = time.time() - 8 * 24 * 3600
+    os.utime(tmp_path / "old", (past, past))
+
+    ValidationCache(str(tmp_path), fingerprint="new").preload()
+    assert not (tmp_path / "old").exists()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ValidationCache(str(tmp_path), max_entries=2)
+    cache.put("a", "valid", {})
+    cache.put("b", "valid", {})
+    assert cache.get("a") is not None
+    cache.put("c", "valid", {})
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_row_key_ignores_case_and_spacing_of_headers():
+    key = ValidationCache.row_key([" Email ", "First  Name"], ["a@x ", "A  B"])
+    assert key == ValidationCache.row_key(["email", "first name"], ["a@x", "A B"])
+    assert key != ValidationCache.row_key(["email", "first name"], ["a@x", "a b"])
@@ -0,0 +1,436 @@
+"""
+Admission control for ``WorkflowServer`` and the autoscaler settings that
+follow from it.
+
+A container runs at most ``max_running`` jobs and holds up to ``max_queued``
+more until a slot frees. A request that finds the queue full, waits longer
+than ``max_queue_wait``, or arrives while Gemini reports its quota exhausted
+is turned away with ``AdmissionRejected`` and a Retry-After estimate instead
+of piling more work onto the container.
+"""
+
+import asyncio
+import math
+import os
+import time
+import uuid
+from collections.abc import Callable, MutableMapping
+from dataclasses import dataclass
+from typing import Any, Self
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class AdmissionConfig:
+    # Jobs one container runs at once
+    max_running: int = 10
+    # Further requests a container holds until a slot frees (0 = none)
+    max_queued: int = 10
+    # Seconds a request may wait in that queue before it is rejected
+    max_queue_wait: float = 120.0
+    # Lower bound of the Retry-After sent with a rejection
+    min_retry_after: int = 5
+    # Inputs Modal may route to a container beyond running + queued. They are
+    # rejected straight away with a Retry-After instead of waiting in Modal's
+    # own queue, and leave room for metrics reads.
+    reject_headroom: int = 10
+
+    @classmethod
+    def from_env(cls) -> "AdmissionConfig":
+        return cls(
+            max_running=int(
+                os.environ.get("WORKFLOW_MAX_CONCURRENT_INPUTS", cls.max_running)
+            ),
+            max_queued=int(os.environ.get("WORKFLOW_ADMISSION_QUEUE", cls.max_queued)),
+            max_queue_wait=float(
+                os.environ.get("WORKFLOW_ADMISSION_QUEUE_WAIT", cls.max_queue_wait)
+            ),
+            min_retry_after=int(
+                os.environ.get("WORKFLOW_MIN_RETRY_AFTER", cls.min_retry_after)
+            ),
+            reject_headroom=int(
+                os.environ.get("WORKFLOW_REJECT_HEADROOM", cls.reject_headroom)
+            ),
+        )
+
+    def modal_max_inputs(self) -> int:
+        """``max_inputs`` for ``modal.concurrent``, above the admission bound."""
+        return self.max_running + self.max_queued + max(1, self.reject_headroom)
+
+
+@dataclass
+class AutoscaleConfig:
+    # Deploy-time Modal autoscaler settings
+    min_containers: int = 0
+    buffer_containers: int = 0
+    scaledown_window: int = 15
+    # Scaledown window while requests have recently had to queue, so a burst
+    # doesn't scale containers down just before the next one
+    busy_scaledown_window: int = 300
+    # Most buffer containers the observed queue depth may ask for; 0 leaves
+    # the deploy-time settings alone
+    max_buffer_containers: int = 0
+    # Seconds between autoscaler updates made from the queue
+    update_interval: float = 60.0
+
+    @classmethod
+    def from_env(cls) -> "AutoscaleConfig":
+        return cls(
+            min_containers=int(
+                os.environ.get("WORKFLOW_MIN_CONTAINERS", cls.min_containers)
+            ),
+            buffer_containers=int(
+                os.environ.get("WORKFLOW_BUFFER_CONTAINERS", cls.buffer_containers)
+            ),
+            scaledown_window=int(
+                os.environ.get("WORKFLOW_SCALEDOWN_WINDOW", cls.scaledown_window)
+            ),
+            busy_scaledown_window=int(
+                os.environ.get(
+                    "WORKFLOW_BUSY_SCALEDOWN_WINDOW", cls.busy_scaledown_window
+                )
+            ),
+            max_buffer_containers=int(
+                os.environ.get(
+                    "WORKFLOW_MAX_BUFFER_CONTAINERS", cls.max_buffer_containers
+                )
+            ),
+            update_interval=float(
+                os.environ.get("WORKFLOW_AUTOSCALE_INTERVAL", cls.update_interval)
+            ),
+        )
+
+    def modal_options(self) -> dict[str, int]:
+        """Keyword arguments for ``app.cls``."""
+        return {
+            "min_containers": self.min_containers,
+            "buffer_containers": self.buffer_containers,
+            "scaledown_window": self.scaledown_window,
+        }
+
+
+class QueueAutoscaler:
+    """
+    Derives Modal autoscaler settings from the admission queue. While requests
+    have queued within the last ``busy_scaledown_window`` seconds, it asks for
+    one buffer container per ``max_running`` requests at the deepest queue in
+    that time, and for the longer scaledown window. With ``apply`` set (and
+    ``max_buffer_containers`` > 0) the settings are pushed at most every
+    ``update_interval`` seconds, when they change.
+
+    The settings are app-wide. With a ``shared`` mapping (a ``modal.Dict`` in
+    production) each container publishes its queue there, the settings are
+    derived from the queues of all containers, and only the container holding
+    the leader lease (claimed atomically, one per ``3 * update_interval``
+    epoch) applies them. Without one, a container only sees its own
+    queue, which undercounts load spread over several containers, and every
+    container pushes its own view.
+    """
+
+    LEADER_KEY = "leader"
+    QUEUE_PREFIX = "queue:"
+
+    def __init__(
+        self,
+        config: AutoscaleConfig,
+        max_running: int,
+        apply: Callable[..., Any] | None = None,
+        shared: MutableMapping[str, Any] | None = None,
+        container_id: str | None = None,
+    ):
+        self.config = config
+        self.max_running = max(1, max_running)
+        self.apply = apply
+        self.shared = shared
+        self.container_id = container_id or uuid.uuid4().hex
+        self.peak_queued = 0
+        self.last_queued_at: float | None = None
+        self.last_update_at = time.monotonic()
+        self.applied: dict[str, int] = {}
+        # Queue state of all containers as last read from ``shared``
+        self.cluster: dict[str, Any] = {}
+        self.updates: set[asyncio.Task] = set()
+        self.stats = {"updates": 0, "update_errors": 0}
+
+    def observe(self, queued: int):
+        if queued > 0:
+            self.peak_queued = max(self.peak_queued, queued)
+            self.last_queued_at = time.monotonic()
+
+    def busy(self) -> bool:
+        return (
+            self.last_queued_at is not None
+            and time.monotonic() - self.last_queued_at
+            < self.config.busy_scaledown_window
+        )
+
+    def _settings(self, peak_queued: int, busy: bool) -> dict[str, int]:
+        config = self.config
+        buffer = math.ceil(peak_queued / self.max_running) if busy else 0
+        return {
+            "min_containers": config.min_containers,
+            "buffer_containers": max(
+                config.buffer_containers, min(buffer, config.max_buffer_containers)
+            ),
+            "scaledown_window": (
+                config.busy_scaledown_window if busy else config.scaledown_window
+            ),
+        }
+
+    def recommend(self) -> dict[str, int]:
+        """Settings for this container's own queue."""
+        return self._settings(self.peak_queued, self.busy())
+
+    def _share(self, peak_queued: int, last_queued_at: float | None) -> bool:
+        """
+        Publish this container's queue, read everyone's into ``cluster`` and
+        claim the leader lease for the current epoch. Returns whether this container leads.
+        Blocking: ``modal.Dict`` calls go over the network.
+        """
+        shared = self.shared
+        now = time.time()
+        window = self.config.busy_scaledown_window
+        epoch = int(now // max(1.0, 3 * self.config.update_interval))
+        lease_key = f"{self.LEADER_KEY}:{epoch}"
+        shared[f"{self.QUEUE_PREFIX}{self.container_id}"] = {
+            "peak_queued": peak_queued,
+            "last_queued_at": last_queued_at,
+            "seen_at": now,
+        }
+
+        total = 0
+        busy = containers = 0
+        for key, entry in list(shared.items()):
+            if key.startswith(f"{self.LEADER_KEY}:"):
+                if int(key.rpartition(":")[2]) < epoch:
+                    # Lease of a past epoch
+                    shared.pop(key, None)
+                continue
+            if not key.startswith(self.QUEUE_PREFIX):
+                continue
+            queued_at = entry.get("last_queued_at")
+            if queued_at is not None and now - queued_at < window:
+                total += entry["peak_queued"]
+                busy += 1
+            elif now - entry["seen_at"] > window:
+                # Gone or long idle, and its last queue no longer counts
+                shared.pop(key, None)
+                continue
+            containers += 1
+        self.cluster = {
+            "peak_queued": total,
+            "busy_containers": busy,
+            "containers": containers,
+        }
+
+        # One lease key per epoch, claimed by whichever container writes it
+        # first; put(skip_if_exists=True) makes the claim atomic, so two
+        # containers can't both lead an epoch
+        claim = {"id": self.container_id}
+        put = getattr(shared, "put", None)
+        if put is not None:
+            put(lease_key, claim, skip_if_exists=True)
+        else:
+            shared.setdefault(lease_key, claim)
+        return shared.get(lease_key) == claim
+
+    def schedule_update(self):
+        """Push the recommended settings in the background when one is due."""
+        now = time.monotonic()
+        if (
+            self.apply is None
+            or self.config.max_buffer_containers <= 0
+            or now - self.last_update_at < self.config.update_interval
+        ):
+            return
+
+        self.last_update_at = now
+        peak_queued, busy = self.peak_queued, self.busy()
+        last_queued_at = (
+            time.time() - (now - self.last_queued_at)
+            if self.last_queued_at is not None
+            else None
+        )
+        if not busy:
+            self.peak_queued = 0
+        update = asyncio.create_task(self._update(peak_queued, busy, last_queued_at))
+        self.updates.add(update)
+        update.add_done_callback(self.updates.discard)
+
+    async def _update(self, peak_queued: int, busy: bool, last_queued_at: float | None):
+        try:
+            if self.shared is not None:
+                leader = await asyncio.to_thread(
+                    self._share, peak_queued if busy else 0, last_queued_at
+                )
+                if not leader:
+                    # The leader applies settings; forget ours so taking over
+                    # the lease pushes them afresh
+                    self.applied = {}
+                    return
+                peak_queued = self.cluster["peak_queued"]
+                busy = self.cluster["busy_containers"] > 0
+
+            settings = self._settings(peak_queued, busy)
+            if settings == self.applied:
+                return
+            self.applied = settings
+            await asyncio.to_thread(self.apply, **settings)
+            self.stats["updates"] += 1
+            print("Autoscaler updated:", settings)
+        except Exception as e:
+            self.stats["update_errors"] += 1
+            self.applied = {}
+            print(f"⚠ Autoscaler update failed: {e}")
+
+    def report(self) -> dict[str, Any]:
+        return {
+            "config": self.config.modal_options(),
+            "recommended": self.recommend(),
+            "applied": dict(self.applied),
+            "peak_queued": self.peak_queued,
+            "cluster": dict(self.cluster),
+            **self.stats,
+        }
+
+
+class AdmissionController:
+    """
+    Bounded admission for one container. ``admit`` checks capacity without
+    waiting, so a rejection can be returned before any work starts; the slot
+    itself is awaited when the returned ticket is entered::
+
+        async with admission.admit():
+            await run_job()
+    """
+
+    def __init__(
+        self,
+        config: AdmissionConfig,
+        quota_retry_after: Callable[[], float] | None = None,
+        autoscaler: QueueAutoscaler | None = None,
+    ):
+        self.config = config
+        # Seconds until the model quota is expected back; 0 when available
+        self.quota_retry_after = quota_retry_after or (lambda: 0.0)
+        self.autoscaler = autoscaler
+        self.slots = asyncio.Semaphore(config.max_running)
+        # Admitted and not yet finished, whether running or waiting for a slot
+        self.active = 0
+        self.running = 0
+        self.peak_queued = 0
+        # Moving average of job run time, for Retry-After estimates
+        self.job_seconds: float | None = None
+        self.stats = {
+            "admitted": 0,
+            "waited": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected_queue_full": 0,
+            "rejected_queue_timeout": 0,
+            "rejected_quota": 0,
+        }
+
+    def _retry_after(self, seconds: float) -> int:
+        return max(self.config.min_retry_after, math.ceil(seconds))
+
+    def _queue_retry_after(self) -> int:
+        # Time for the jobs ahead to drain through the running slots
+        job_seconds = self.job_seconds or self.config.max_queue_wait
+        ahead = self.active + 1 - self.config.max_running
+        return self._retry_after(job_seconds * ahead / self.config.max_running)
+
+    @property
+    def queued(self) -> int:
+        return max(0, self.active - self.config.max_running)
+
+    def _set_active(self, active: int):
+        self.active = active
+        self.peak_queued = max(self.peak_queued, self.queued)
+        if self.autoscaler:
+            self.autoscaler.observe(self.queued)
+
+    def admit(self) -> "AdmissionTicket":
+        quota_wait = self.quota_retry_after()
+        if quota_wait > 0:
+            self.stats["rejected_quota"] += 1
+            raise AdmissionRejected(
+                "Model quota exhausted", self._retry_after(quota_wait)
+            )
+
+        if self.active >= self.config.max_running + self.config.max_queued:
+            self.stats["rejected_queue_full"] += 1
+            raise AdmissionRejected("Server busy", self._queue_retry_after())
+
+        self.stats["admitted"] += 1
+        if self.active >= self.config.max_running:
+            self.stats["waited"] += 1
+        self._set_active(self.active + 1)
+        return AdmissionTicket(self)
+
+    async def _acquire(self):
+        try:
+            await asyncio.wait_for(
+                self.slots.acquire(), timeout=self.config.max_queue_wait
+            )
+        except TimeoutError:
+            self.stats["rejected_queue_timeout"] += 1
+            self._set_active(self.active - 1)
+            raise AdmissionRejected(
+                "Timed out waiting for a free slot", self._queue_retry_after()
+            ) from None
+        except BaseException:
+            self._set_active(self.active - 1)
+            raise
+        self.running += 1
+
+    def _release(self, seconds: float, failed: bool):
+        self.running -= 1
+        self._set_active(self.active - 1)
+        self.slots.release()
+        self.stats["failed" if failed else "completed"] += 1
+        self.job_seconds = (
+            seconds
+            if self.job_seconds is None
+            else 0.8 * self.job_seconds + 0.2 * seconds
+        )
+        if self.autoscaler:
+            self.autoscaler.schedule_update()
+
+    def report(self) -> dict[str, Any]:
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "peak_queued": self.peak_queued,
+            "max_running": self.config.max_running,
+            "max_queued": self.config.max_queued,
+            "avg_job_seconds": (
+                round(self.job_seconds, 3) if self.job_seconds is not None else None
+            ),
+            "quota_retry_after": round(self.quota_retry_after(), 1),
+            **self.stats,
+        }
+
+
+class AdmissionTicket:
+    """A queued request; entering it waits for a slot, leaving frees it."""
+
+    def __init__(self, controller: AdmissionController):
+        self.controller = controller
+        self.started = 0.0
+
+    async def __aenter__(self) -> Self:
+        await self.controller._acquire()
+        self.started = time.perf_counter()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.controller._release(
+            time.perf_counter() - self.started, failed=exc_type is not None
+        )
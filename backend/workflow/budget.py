@@ -0,0 +1,97 @@
+import json
+import math
+import os
+from dataclasses import dataclass
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+
+# Rough average for Gemini tokenizers on English/CSV/JSON text
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap local token estimate used when the count-tokens API isn't consulted."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+@dataclass
+class TokenBudget:
+    max_input_tokens: int = 200_000
+    max_output_tokens: int = 60_000
+    # Expected output tokens per input data token; JSON output is wordier than CSV
+    output_ratio: float = 2.0
+
+    @classmethod
+    def from_env(cls) -> "TokenBudget":
+        return cls(
+            max_input_tokens=int(
+                os.environ.get("WORKFLOW_MAX_INPUT_TOKENS", cls.max_input_tokens)
+            ),
+            max_output_tokens=int(
+                os.environ.get("WORKFLOW_MAX_OUTPUT_TOKENS", cls.max_output_tokens)
+            ),
+            output_ratio=float(
+                os.environ.get("WORKFLOW_OUTPUT_TOKEN_RATIO", cls.output_ratio)
+            ),
+        )
+
+    def data_token_limit(self, template_tokens: int) -> int:
+        """Largest data payload, in tokens, a single request can carry."""
+        return max(
+            1,
+            min(
+                self.max_input_tokens - template_tokens,
+                int(self.max_output_tokens / self.output_ratio),
+            ),
+        )
+
+
+def pack_batches(
+    chunks: list[T], chunk_tokens: list[int], limit: int, label: str
+) -> list[list[T]]:
+    """Greedily pack chunks, in order, into batches of at most ``limit`` tokens.
+
+    A chunk larger than the limit on its own is sent alone rather than cut.
+    """
+    batches: list[list[T]] = []
+    current: list[T] = []
+    current_tokens = 0
+    for chunk, tokens in zip(chunks, chunk_tokens):
+        if tokens > limit:
+            print(
+                f"⚠ {label}: one chunk needs ~{tokens} tokens, over the "
+                f"{limit} token budget; sending it alone"
+            )
+        if current and current_tokens + tokens > limit:
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(chunk)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+
+    print(
+        f"{label}: split {len(chunks)} chunks into {len(batches)} request(s) "
+        f"(budget {limit} tokens per request)"
+    )
+    return batches
+
+
+def merge_json_batches(results: list[dict[str, Any]]) -> dict[str, Any]:
+    """Concatenate per-batch JSON objects key by key, dropping exact duplicates."""
+    merged: dict[str, Any] = {}
+    seen: dict[str, set[str]] = {}
+    for result in results:
+        for key, value in result.items():
+            if not isinstance(value, list):
+                merged.setdefault(key, value)
+                continue
+            items = merged.setdefault(key, [])
+            keys_seen = seen.setdefault(key, set())
+            for item in value:
+                fingerprint = json.dumps(item, sort_keys=True, default=str)
+                if fingerprint not in keys_seen:
+                    keys_seen.add(fingerprint)
+                    items.append(item)
+    return merged
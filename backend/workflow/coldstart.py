@@ -0,0 +1,218 @@
+"""
+Cold-start profile of the ``WorkflowServer`` startup path, without Modal.
+
+Run from the backend directory, e.g.::
+
+    python -m workflow.coldstart --budget 3
+    python -m workflow.coldstart --budget 3 --workflow-type users \\
+        --payload '{"file_name": "staff.xlsx"}' --folder-id demo \\
+        --storage-root runs --llm-cache runs/llm.json
+
+Each measurement runs in a fresh interpreter:
+
+- the modules ``main.py`` imports, broken down like ``python -X importtime``
+- container init, i.e. what ``load_models`` builds
+- with ``--payload``, the first request: one job on replayed LLM responses
+  (recorded with ``workflow.runner --llm record``) and local storage
+
+The command exits non-zero when the whole cold start exceeds ``--budget``
+(default ``WORKFLOW_COLD_START_BUDGET``, 0 disables the check). In the
+container, set ``WORKFLOW_PROFILE_IMPORTS=1`` at deploy time to get the
+``-X importtime`` log, and the first request logs ``process_uptime``.
+"""
+
+import argparse
+import importlib
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Keep in sync with the module-level imports of main.py
+SERVER_IMPORTS = (
+    "modal",
+    "fastapi",
+    "pydantic",
+    "workflow.admission",
+    "workflow.budget",
+    "workflow.context",
+    "workflow.lazy",
+    "workflow.llm",
+    "workflow.pipeline",
+    "workflow.storage",
+    "workflow.users.cache",
+    "workflow.utils",
+)
+
+
+def process_uptime() -> float | None:
+    """Seconds since this process started, or None where /proc is missing."""
+    try:
+        with open("/proc/self/stat", "r") as f:
+            # Field 22 (starttime, in clock ticks), counted after the "(comm)"
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime", "r") as f:
+            system_uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(system_uptime - start_ticks / os.sysconf("SC_CLK_TCK"), 3)
+
+
+def available_modules(modules: tuple[str, ...] = SERVER_IMPORTS) -> list[str]:
+    def found(module: str) -> bool:
+        try:
+            return importlib.util.find_spec(module) is not None
+        except ModuleNotFoundError:
+            return False
+
+    return [module for module in modules if found(module)]
+
+
+def parse_importtime(log: str) -> list[dict]:
+    """Entries of a ``-X importtime`` log with their nesting depth."""
+    entries = []
+    for line in log.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append(
+            {
+                "module": name.strip(),
+                "depth": depth,
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+            }
+        )
+    return entries
+
+
+def import_breakdown(modules: list[str], top: int = 15) -> dict:
+    """Import cost of ``modules`` in a fresh interpreter."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    entries = parse_importtime(result.stderr)
+    direct = [entry for entry in entries if entry["depth"] == 0]
+    return {
+        "total_ms": round(sum(entry["cumulative_ms"] for entry in direct), 1),
+        "by_import": sorted(direct, key=lambda e: e["cumulative_ms"], reverse=True)[
+            :top
+        ],
+        "slowest_modules": sorted(entries, key=lambda e: e["self_ms"], reverse=True)[
+            :top
+        ],
+    }
+
+
+def _startup(args) -> dict:
+    """Child process: imports, container init and optionally the first request."""
+    started = time.perf_counter()
+    for module in available_modules():
+        importlib.import_module(module)
+    imported = time.perf_counter()
+
+    from workflow.context import WorkflowContext
+    from workflow.lazy import IMPORT_SECONDS, boto3, genai
+
+    context = WorkflowContext.create()
+    context.timed("s3_client", lambda: boto3.client("s3", region_name="us-east-1"))
+    if available_modules(("google.genai",)):
+        context.timed("gemini_client", lambda: genai.Client(api_key="coldstart"))
+    ready = time.perf_counter()
+
+    timings = {
+        "imports": round(imported - started, 4),
+        "init": round(ready - imported, 4),
+        "init_steps": context.report()["steps"],
+    }
+
+    if args.payload:
+        from workflow.llm import RecordedLLM
+        from workflow.pipeline import WorkflowType
+        from workflow.runner import build_pipeline, read_payload, run_workflow
+
+        pipeline = build_pipeline(
+            llm=RecordedLLM(args.llm_cache),
+            storage_root=args.storage_root,
+            context=context,
+        )
+        run_workflow(
+            WorkflowType(args.workflow_type),
+            read_payload(args.payload),
+            args.folder_id,
+            pipeline=pipeline,
+        )
+        timings["first_request"] = round(time.perf_counter() - ready, 4)
+
+    timings["deferred_imports"] = dict(IMPORT_SECONDS)
+    timings["process_uptime"] = process_uptime()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=float(os.environ.get("WORKFLOW_COLD_START_BUDGET", "0")),
+        help="seconds allowed from process start to the first response",
+    )
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--workflow-type", default="users")
+    parser.add_argument("--payload", help="JSON payload, or @path to a file")
+    parser.add_argument("--folder-id", default="local")
+    parser.add_argument("--storage-root", default="runs")
+    parser.add_argument("--llm-cache", default="runs/llm_responses.json")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(_startup(args)))
+        return
+
+    modules = available_modules()
+    missing = sorted(set(SERVER_IMPORTS) - set(modules))
+    if missing:
+        print(f"⚠ Not installed, left out of the profile: {', '.join(missing)}")
+
+    imports = import_breakdown(modules, args.top)
+    print(f"Imports of main.py: {imports['total_ms']:.1f} ms")
+    for entry in imports["by_import"]:
+        print(f"  {entry['cumulative_ms']:9.1f} ms  {entry['module']}")
+    print("Slowest modules (self time):")
+    for entry in imports["slowest_modules"]:
+        print(f"  {entry['self_ms']:9.1f} ms  {entry['module']}")
+
+    started = time.perf_counter()
+    try:
+        child = subprocess.run(
+            [sys.executable, "-m", "workflow.coldstart", "--child", *sys.argv[1:]],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except subprocess.CalledProcessError as e:
+        print(e.stdout + e.stderr)
+        raise SystemExit(f"Startup run failed with exit code {e.returncode}") from None
+    total = time.perf_counter() - started
+
+    timings = json.loads(child.stdout.strip().splitlines()[-1])
+    print("Startup:", json.dumps(timings, indent=2))
+    print(f"Cold start to first response: {total:.2f}s (interpreter included)")
+
+    if args.budget and total > args.budget:
+        raise SystemExit(f"✗ Cold start {total:.2f}s exceeds budget {args.budget}s")
+    if args.budget:
+        print(f"✓ Within cold-start budget of {args.budget}s")
+
+
+if __name__ == "__main__":
+    main()
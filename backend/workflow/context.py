@@ -0,0 +1,119 @@
+import asyncio
+import contextvars
+import functools
+import importlib
+import string
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+
+# Imported at container start rather than on the first request, which also
+# builds their pydantic validators and loads the unit templates
+WARM_MODULES = (
+    "workflow.budget",
+    "workflow.service_units.compaction",
+    "workflow.service_units.service",
+    "workflow.users.service",
+)
+
+
+class PromptTemplate:
+    """
+    A ``str.format`` prompt parsed once into literal text and field names, so
+    rendering is a single join rather than a re-scan of the whole template.
+    Only plain ``{name}`` fields are supported, which is all the prompts use.
+    """
+
+    def __init__(self, template: str):
+        self.parts: list[tuple[str, str | None]] = []
+        for literal, name, spec, conversion in string.Formatter().parse(template):
+            if spec or conversion:
+                raise ValueError(f"Unsupported prompt field: {{{name}!{conversion}}}")
+            self.parts.append((literal, name))
+
+    def format(self, **fields: Any) -> str:
+        # Flat list, so large field values are copied once by the join
+        pieces = []
+        for literal, name in self.parts:
+            pieces.append(literal)
+            if name is not None:
+                pieces.append(str(fields[name]))
+        return "".join(pieces)
+
+
+@dataclass
+class PromptTemplates:
+    extract_service_units: PromptTemplate
+    organize_service_units: PromptTemplate
+    validate_users: PromptTemplate
+    compact_encoding_notes: str
+
+    @classmethod
+    def load(cls) -> "PromptTemplates":
+        from workflow.service_units.prompts import (
+            COMPACT_ENCODING_NOTES,
+            EXTRACT_SERVICE_UNITS_PROMPT,
+            ORGANIZE_SERVICE_UNITS_PROMPT,
+        )
+        from workflow.users.prompt import VALIDATE_USERS_PROMPT
+
+        return cls(
+            extract_service_units=PromptTemplate(EXTRACT_SERVICE_UNITS_PROMPT),
+            organize_service_units=PromptTemplate(ORGANIZE_SERVICE_UNITS_PROMPT),
+            validate_users=PromptTemplate(VALIDATE_USERS_PROMPT),
+            compact_encoding_notes=COMPACT_ENCODING_NOTES,
+        )
+
+
+@dataclass
+class WorkflowContext:
+    """
+    State that lives as long as the container rather than one request: parsed
+    prompts, warmed workflow modules, the worker thread pool and whatever
+    clients the caller builds through ``timed``. ``timings`` records how long
+    each piece took to initialize.
+    """
+
+    prompts: PromptTemplates = field(default_factory=PromptTemplates.load)
+    # None runs blocking work on the event loop's default executor
+    executor: ThreadPoolExecutor | None = None
+    timings: dict[str, float] = field(default_factory=dict)
+
+    @classmethod
+    def create(
+        cls, max_workers: int | None = None, modules: tuple[str, ...] = WARM_MODULES
+    ) -> "WorkflowContext":
+        started = time.perf_counter()
+        context = cls(
+            prompts=PromptTemplates.load(),
+            executor=ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="workflow"
+            ),
+        )
+        context.timings["prompts"] = round(time.perf_counter() - started, 4)
+        for module in modules:
+            context.timed(module, functools.partial(importlib.import_module, module))
+        return context
+
+    def timed(self, name: str, factory: Callable[[], T]) -> T:
+        """Build one piece of container state, recording how long it took."""
+        started = time.perf_counter()
+        result = factory()
+        self.timings[name] = round(time.perf_counter() - started, 4)
+        return result
+
+    async def to_thread(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """``asyncio.to_thread`` on the shared executor."""
+        loop = asyncio.get_running_loop()
+        call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+        return await loop.run_in_executor(self.executor, call)
+
+    def report(self) -> dict[str, Any]:
+        return {
+            "init_seconds": round(sum(self.timings.values()), 4),
+            "steps": dict(self.timings),
+        }
@@ -0,0 +1,56 @@
+"""
+Deferred imports for heavy optional dependencies.
+
+``pandas``, ``boto3`` and ``genai`` below are stand-ins that import the real
+module on first attribute access, so importing the workflow package (or
+``main.py``) stays cheap for code paths that never touch them. How long each
+deferred import took is kept in ``IMPORT_SECONDS`` for cold-start reports.
+"""
+
+import importlib
+import threading
+import time
+import types
+from typing import Any
+
+IMPORT_SECONDS: dict[str, float] = {}
+
+_lock = threading.RLock()
+
+
+class LazyModule(types.ModuleType):
+    """Module stand-in that imports ``name`` when an attribute is first read."""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_module"] = None
+
+    def _load(self) -> types.ModuleType:
+        with _lock:
+            module = self.__dict__["_module"]
+            if module is None:
+                started = time.perf_counter()
+                module = importlib.import_module(self.__name__)
+                IMPORT_SECONDS[self.__name__] = round(time.perf_counter() - started, 4)
+                # Later lookups hit the copied attributes directly
+                self.__dict__.update(module.__dict__)
+                self.__dict__["_module"] = module
+            return module
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._load(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.__dict__["_module"] is not None else "not loaded"
+        return f"<lazy module {self.__name__!r} ({state})>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    return LazyModule(name)
+
+
+pandas = lazy_import("pandas")
+boto3 = lazy_import("boto3")
+boto3_transfer = lazy_import("boto3.s3.transfer")
+botocore_config = lazy_import("botocore.config")
+genai = lazy_import("google.genai")
@@ -0,0 +1,353 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from collections.abc import Callable
+from typing import Any
+
+from workflow.serialization import dump_file, load_file, loads
+
+
+class LLMRequestError(RuntimeError):
+    """Raised when no attempt produced a usable response before giving up."""
+
+
+# Gemini's 429 errors carry a RetryInfo detail such as 'retryDelay': '17s'
+RETRY_DELAY = re.compile(r"retryDelay['\"]?\s*:\s*['\"]?(\d+(?:\.\d+)?)s")
+
+
+def is_quota_error(error: BaseException) -> bool:
+    return getattr(error, "code", None) == 429 or "RESOURCE_EXHAUSTED" in str(error)
+
+
+def extract_json_payload(text: str) -> str:
+    """
+    Best-effort helper to extract a JSON object/array from an LLM response.
+    Handles accidental markdown fences or explanations around the JSON.
+    """
+    if not text:
+        return ""
+
+    text = text.strip()
+
+    # Quick path: already looks like pure JSON
+    if (text.startswith("{") and text.endswith("}")) or (
+        text.startswith("[") and text.endswith("]")
+    ):
+        return text
+
+    # Strip common markdown fences if present
+    if text.startswith("```"):
+        # Remove the first fence (and optional language tag)
+        parts = text.split("```")
+        if len(parts) >= 3:
+            # Join everything between the first and last fence
+            inner = "```".join(parts[1:-1]).strip()
+            text = inner or text
+
+    # Fallback: find first JSON bracket and last matching
+    start_candidates = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not start_candidates:
+        return text
+
+    start = min(start_candidates)
+    # Try object first, then array
+    end_obj = text.rfind("}")
+    end_arr = text.rfind("]")
+    end = max(end_obj, end_arr)
+
+    if end == -1 or end <= start:
+        return text
+
+    return text[start : end + 1]
+
+
+def is_valid_json_response(text: str) -> bool:
+    try:
+        loads(extract_json_payload(text))
+    except (json.JSONDecodeError, TypeError):
+        return False
+    return True
+
+
+class RequestPolicy:
+    """
+    Deadline, hedging and model-fallback policy around Gemini generate calls.
+
+    An attempt that fails outright is retried once straight away. An attempt
+    still running ``hedge_delay`` seconds after it started gets a duplicate
+    (a hedge) fired alongside it and the first valid answer wins. The deadline
+    counts from when the first attempt holds a semaphore slot. If it passes or
+    every attempt fails, the request is retried once on the lighter fallback
+    model.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        model: str,
+        fallback_model: str | None = None,
+        deadline: float = 180.0,
+        hedge_delay: float | None = 45.0,
+        semaphore: asyncio.Semaphore | None = None,
+        quota_cooldown: float = 60.0,
+    ):
+        self.client = client
+        self.model = model
+        self.fallback_model = fallback_model
+        self.deadline = deadline
+        self.hedge_delay = hedge_delay
+        self.semaphore = semaphore or asyncio.Semaphore(8)
+        # How long to treat the quota as exhausted after a 429 that doesn't
+        # say when to retry
+        self.quota_cooldown = quota_cooldown
+        self.quota_exhausted_until = 0.0
+        self.stats: dict[str, int] = {
+            "requests": 0,
+            "retries": 0,
+            "retry_wins": 0,
+            "hedges_fired": 0,
+            "hedge_wins": 0,
+            "fallbacks": 0,
+            "light_model_requests": 0,
+            "timeouts": 0,
+            "failed_attempts": 0,
+            "quota_errors": 0,
+        }
+
+    @classmethod
+    def from_env(
+        cls, client: Any, model: str, semaphore: asyncio.Semaphore | None = None
+    ) -> "RequestPolicy":
+        hedge_delay = float(os.environ.get("WORKFLOW_LLM_HEDGE_DELAY", "45"))
+        return cls(
+            client,
+            model,
+            fallback_model=os.environ.get(
+                "WORKFLOW_LLM_FALLBACK_MODEL", "gemini-2.5-flash-lite"
+            )
+            or None,
+            deadline=float(os.environ.get("WORKFLOW_LLM_DEADLINE", "180")),
+            hedge_delay=hedge_delay if hedge_delay > 0 else None,
+            semaphore=semaphore,
+            quota_cooldown=float(os.environ.get("WORKFLOW_LLM_QUOTA_COOLDOWN", "60")),
+        )
+
+    def _note_failure(self, error: BaseException):
+        self.stats["failed_attempts"] += 1
+        if not is_quota_error(error):
+            return
+        self.stats["quota_errors"] += 1
+        match = RETRY_DELAY.search(str(error))
+        delay = float(match.group(1)) if match else self.quota_cooldown
+        self.quota_exhausted_until = max(
+            self.quota_exhausted_until, time.monotonic() + delay
+        )
+
+    def quota_retry_after(self) -> float:
+        """Seconds until the model quota should be available again (0 if now)."""
+        return max(0.0, self.quota_exhausted_until - time.monotonic())
+
+    async def _attempt(
+        self,
+        model: str,
+        prompt: str,
+        validate: Callable[[str], bool] | None,
+        started: asyncio.Event | None = None,
+    ) -> str:
+        async with self.semaphore:
+            if started is not None:
+                started.set()
+            response = await self.client.aio.models.generate_content(
+                model=model,
+                contents=prompt,
+            )
+
+        if not response.text:
+            raise LLMRequestError("AI returned an empty response")
+        if validate and not validate(response.text):
+            raise LLMRequestError("AI returned an invalid response")
+        return response.text
+
+    async def _hedged(
+        self,
+        model: str,
+        prompt: str,
+        validate: Callable[[str], bool] | None,
+        hedge_delay: float | None,
+    ) -> str:
+        loop = asyncio.get_running_loop()
+        started = asyncio.Event()
+        primary = asyncio.create_task(self._attempt(model, prompt, validate, started))
+        pending = {primary}
+        retry: asyncio.Task | None = None
+        hedge: asyncio.Task | None = None
+        last_error: BaseException | None = None
+
+        try:
+            # Time spent waiting for a semaphore slot doesn't count against the
+            # deadline; the clock starts once the primary is actually sending
+            waiter = asyncio.create_task(started.wait())
+            try:
+                await asyncio.wait(
+                    {primary, waiter}, return_when=asyncio.FIRST_COMPLETED
+                )
+            finally:
+                waiter.cancel()
+            deadline_at = loop.time() + self.deadline
+            # Start of the attempt the hedge delay is measured from
+            attempt_started = loop.time()
+
+            while pending:
+                # Until the hedge fires, only wait for the hedge delay
+                wait_until = deadline_at
+                if hedge is None and hedge_delay is not None:
+                    wait_until = min(deadline_at, attempt_started + hedge_delay)
+                timeout = max(0.0, wait_until - loop.time())
+
+                done, pending = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.stats["hedge_wins"] += 1
+                        elif task is retry:
+                            self.stats["retry_wins"] += 1
+                        return task.result()
+                    last_error = task.exception()
+                    self._note_failure(last_error)
+
+                if loop.time() >= deadline_at:
+                    self.stats["timeouts"] += 1
+                    raise LLMRequestError(
+                        f"AI request exceeded its {self.deadline:.0f}s deadline"
+                    )
+
+                if not pending:
+                    # Every attempt so far failed outright: retry once, unless
+                    # the quota is gone and a retry would fail the same way
+                    if retry is not None or is_quota_error(last_error):
+                        break
+                    self.stats["retries"] += 1
+                    retry = asyncio.create_task(self._attempt(model, prompt, validate))
+                    pending.add(retry)
+                    attempt_started = loop.time()
+                elif (
+                    hedge is None
+                    and hedge_delay is not None
+                    and loop.time() >= attempt_started + hedge_delay
+                ):
+                    # The running attempt is slow: race a duplicate against it
+                    self.stats["hedges_fired"] += 1
+                    hedge = asyncio.create_task(self._attempt(model, prompt, validate))
+                    pending.add(hedge)
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise LLMRequestError(str(last_error or "AI request failed"))
+
+    async def generate(
+        self,
+        prompt: str,
+        validate: Callable[[str], bool] | None = None,
+        simple: bool = False,
+        hedge: bool = True,
+    ) -> str:
+        """
+        Generate a response, preferring the light model for simple prompts.
+        ``hedge=False`` never duplicates a slow attempt, for prompts that are
+        expected to run longer than ``hedge_delay``.
+        """
+        self.stats["requests"] += 1
+        model = self.model
+        if simple and self.fallback_model:
+            self.stats["light_model_requests"] += 1
+            model = self.fallback_model
+        hedge_delay = self.hedge_delay if hedge else None
+
+        try:
+            return await self._hedged(model, prompt, validate, hedge_delay)
+        except LLMRequestError as e:
+            if not self.fallback_model or model == self.fallback_model:
+                raise
+            print(f"AI request on {model} failed ({e}); retrying on fallback model")
+            self.stats["fallbacks"] += 1
+            return await self._hedged(
+                self.fallback_model, prompt, validate, hedge_delay
+            )
+
+    async def count_tokens(self, text: str) -> int | None:
+        response = await self.client.aio.models.count_tokens(
+            model=self.model, contents=text
+        )
+        return response.total_tokens
+
+    def report(self) -> dict[str, Any]:
+        requests = self.stats["requests"] or 1
+        return {
+            **self.stats,
+            "retry_rate": round(self.stats["retries"] / requests, 3),
+            "hedge_rate": round(self.stats["hedges_fired"] / requests, 3),
+            "fallback_rate": round(self.stats["fallbacks"] / requests, 3),
+            "quota_retry_after": round(self.quota_retry_after(), 1),
+        }
+
+
+class RecordedLLM:
+    """
+    Serves model responses from a JSON file keyed by a hash of the prompt.
+
+    With an ``inner`` backend, prompts missing from the file are sent to it and
+    the answers recorded, so a job run once against Gemini can be replayed
+    offline for profiling and load tests. Without one, a miss is an error.
+    """
+
+    def __init__(self, path: str, inner: Any | None = None):
+        self.path = path
+        self.inner = inner
+        self.responses: dict[str, str] = {}
+        self.stats: dict[str, int] = {"requests": 0, "replayed": 0, "recorded": 0}
+        try:
+            self.responses = load_file(path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def prompt_key(prompt: str) -> str:
+        return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+    async def generate(
+        self,
+        prompt: str,
+        validate: Callable[[str], bool] | None = None,
+        simple: bool = False,
+        hedge: bool = True,
+    ) -> str:
+        self.stats["requests"] += 1
+        key = self.prompt_key(prompt)
+        if key in self.responses:
+            self.stats["replayed"] += 1
+            return self.responses[key]
+
+        if self.inner is None:
+            raise LLMRequestError(f"No recorded response for prompt {key[:12]}")
+
+        text = await self.inner.generate(
+            prompt, validate=validate, simple=simple, hedge=hedge
+        )
+        self.responses[key] = text
+        self.stats["recorded"] += 1
+        return text
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        dump_file(self.responses, tmp_path, indent=True)
+        os.replace(tmp_path, self.path)
+
+    def report(self) -> dict[str, Any]:
+        return {**(self.inner.report() if self.inner else {}), **self.stats}
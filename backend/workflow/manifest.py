@@ -0,0 +1,62 @@
+import datetime
+import hashlib
+import json
+import os
+from typing import Any
+
+
+def file_digest(path: str) -> tuple[int, str]:
+    """Byte size and SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+            size += len(block)
+    return size, digest.hexdigest()
+
+
+def build_manifest(
+    run_id: str,
+    workflow_type: str,
+    folder_name: str,
+    outputs: dict[str, dict[str, Any]],
+    digests: dict[str, tuple[int, str]],
+    etags: dict[str, str | None],
+) -> dict[str, Any]:
+    """
+    Describe the objects a run delivered, so consumers can pick up exactly
+    these files instead of listing the whole prefix.
+    """
+    return {
+        "run_id": run_id,
+        "workflow_type": workflow_type,
+        "folder_id": folder_name,
+        "created_at": datetime.datetime.now(datetime.UTC).isoformat(),
+        "manifest_key": f"{folder_name}/{manifest_filename(run_id)}",
+        "files": [
+            {
+                "key": f"{folder_name}/{file}",
+                "action": output["action"],
+                "rows": output["rows"],
+                "bytes": digests[file][0],
+                "etag": etags.get(file),
+                "sha256": digests[file][1],
+                # Which company/part of its action a sharded file holds
+                **({"shard": output["shard"]} if "shard" in output else {}),
+            }
+            for file, output in outputs.items()
+        ],
+    }
+
+
+def manifest_filename(run_id: str) -> str:
+    return f"manifest_{run_id}.json"
+
+
+def write_manifest(manifest: dict[str, Any], folder_name: str) -> str:
+    """Save the manifest next to the outputs and return its file name."""
+    filename = manifest_filename(manifest["run_id"])
+    with open(os.path.join(folder_name, filename), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return filename
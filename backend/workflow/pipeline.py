@@ -0,0 +1,789 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import pathlib
+import shutil
+import uuid
+from collections.abc import Callable
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Protocol, TypeVar
+
+from workflow.budget import TokenBudget, estimate_tokens
+from workflow.context import WorkflowContext
+from workflow.llm import LLMRequestError, extract_json_payload, is_valid_json_response
+from workflow.manifest import build_manifest, file_digest, write_manifest
+from workflow.progress import Progress
+from workflow.serialization import dumps, loads
+from workflow.users.cache import ValidationCache, row_index_of
+from workflow.utils import OutputFormat, OutputPackaging, package_outputs
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class WorkflowType(Enum):
+    users = "users"
+    service_units = "service_units"
+
+
+class LLMBackend(Protocol):
+    """Anything that turns a prompt into model text, e.g. ``RequestPolicy``."""
+
+    async def generate(
+        self,
+        prompt: str,
+        validate: Callable[[str], bool] | None = None,
+        simple: bool = False,
+        hedge: bool = True,
+    ) -> str: ...
+
+    def report(self) -> dict[str, Any]: ...
+
+
+class StorageBackend(Protocol):
+    """Where job inputs are read from and generated files are delivered to."""
+
+    async def download(
+        self, file_name: str, base_dir: str, folder_name: str
+    ) -> str: ...
+
+    async def upload(
+        self,
+        files: list[str],
+        base_dir: str,
+        folder_name: str,
+        checksums: dict[str, str] | None = None,
+    ) -> dict[str, str]:
+        """
+        Deliver files and return each one's ETag, skipping files whose SHA-256
+        in ``checksums`` matches what is already stored under their name. The
+        returned mapping may list those in a ``skipped`` set.
+        """
+        ...
+
+
+@dataclass
+class PipelineConfig:
+    # Send de-duplicated, short-keyed payloads to the model to cut input tokens
+    compact_prompts: bool = True
+    # Facility partitions of one service-unit job sent to the model at once
+    max_concurrent_partitions: int = 4
+    # Batches with at most this many data tokens go to the lighter model
+    # (0 keeps everything on the main model)
+    light_model_max_data_tokens: int = 0
+    # "local" estimates prompt size from its length, "api" asks the backend
+    token_counter: str = "local"
+    # Pause between extracting and organizing service units (Gemini rate limits)
+    organize_cooldown: float = 5.0
+    # "rows" builds service-unit CSVs row by row, "frame" column-wise with pandas
+    service_unit_engine: str = "rows"
+    # The same choice for the user action files
+    user_engine: str = "rows"
+    # Name outputs "<action>_<sha256 prefix>" so re-runs with identical results
+    # map to existing objects and their uploads are skipped
+    content_addressed_outputs: bool = True
+    # Split user action files per company and/or into files of at most this
+    # many rows (0 = no limit), so downstream imports can run in parallel
+    user_shard_by_company: bool = False
+    user_shard_rows: int = 0
+
+    @classmethod
+    def from_env(cls) -> "PipelineConfig":
+        return cls(
+            compact_prompts=os.environ.get("WORKFLOW_COMPACT_PROMPTS", "1") == "1",
+            max_concurrent_partitions=int(
+                os.environ.get(
+                    "WORKFLOW_MAX_CONCURRENT_PARTITIONS", cls.max_concurrent_partitions
+                )
+            ),
+            light_model_max_data_tokens=int(
+                os.environ.get(
+                    "WORKFLOW_LIGHT_MODEL_MAX_DATA_TOKENS",
+                    cls.light_model_max_data_tokens,
+                )
+            ),
+            token_counter=os.environ.get("WORKFLOW_TOKEN_COUNTER", cls.token_counter),
+            organize_cooldown=float(
+                os.environ.get("WORKFLOW_ORGANIZE_COOLDOWN", cls.organize_cooldown)
+            ),
+            service_unit_engine=os.environ.get(
+                "WORKFLOW_SERVICE_UNIT_ENGINE", cls.service_unit_engine
+            ),
+            user_engine=os.environ.get("WORKFLOW_USER_ENGINE", cls.user_engine),
+            content_addressed_outputs=os.environ.get(
+                "WORKFLOW_CONTENT_ADDRESSED_OUTPUTS", "1"
+            )
+            == "1",
+            user_shard_by_company=os.environ.get("WORKFLOW_USER_SHARD_BY_COMPANY", "0")
+            == "1",
+            user_shard_rows=int(
+                os.environ.get("WORKFLOW_USER_SHARD_ROWS", cls.user_shard_rows)
+            ),
+        )
+
+
+class WorkflowPipeline:
+    """
+    The users and service-unit workflows, independent of where they run.
+
+    ``WorkflowServer`` wires it to Gemini and S3 inside a Modal container;
+    ``workflow.runner`` wires it to local or recorded backends.
+    """
+
+    def __init__(
+        self,
+        llm: LLMBackend,
+        storage: StorageBackend,
+        config: PipelineConfig | None = None,
+        token_budget: TokenBudget | None = None,
+        validation_cache: ValidationCache | None = None,
+        commit: Callable[[], None] | None = None,
+        work_dir: str = "/tmp",
+        context: WorkflowContext | None = None,
+    ):
+        self.llm = llm
+        self.storage = storage
+        self.config = config or PipelineConfig()
+        self.token_budget = token_budget or TokenBudget()
+        self.validation_cache = validation_cache
+        # Called after the validation cache is saved (Modal volume commit)
+        self.commit = commit
+        self.work_dir = work_dir
+        # Parsed prompts and the worker pool, shared by every job
+        self.context = context or WorkflowContext()
+
+    async def process_data(
+        self,
+        prompt: str,
+        validate=is_valid_json_response,
+        simple: bool = False,
+        hedge: bool = True,
+    ):
+        try:
+            return await self.llm.generate(
+                prompt, validate=validate, simple=simple, hedge=hedge
+            )
+        except LLMRequestError as e:
+            print(f"AI request failed: {e}")
+            raise
+
+    async def count_tokens(self, text: str) -> int:
+        counter = getattr(self.llm, "count_tokens", None)
+        if self.config.token_counter == "api" and counter:
+            try:
+                tokens = await counter(text)
+                if tokens:
+                    return tokens
+            except Exception as e:
+                print(f"Token count API failed, falling back to estimate: {e}")
+
+        return estimate_tokens(text)
+
+    async def _budget_batches(
+        self,
+        prompt: str,
+        data: str,
+        chunks: list[T],
+        chunk_texts: list[str],
+        overhead: str,
+        label: str,
+    ) -> list[list[T]]:
+        """
+        Pre-flight a prompt whose payload ``data`` is made of ``chunks`` against
+        the token budget and, when it is too large, pack the chunks into
+        request-sized batches. ``overhead`` is repeated in every batch.
+        """
+        from workflow.budget import pack_batches
+
+        prompt_tokens = await self.count_tokens(prompt)
+
+        # Calibrate the cheap per-chunk estimates against the whole-prompt count
+        scale = prompt_tokens / max(1, estimate_tokens(prompt))
+        data_tokens = math.ceil(estimate_tokens(data) * scale)
+        limit = self.token_budget.data_token_limit(prompt_tokens - data_tokens)
+
+        if data_tokens <= limit or len(chunks) <= 1:
+            if data_tokens > limit:
+                print(
+                    f"⚠ {label}: ~{prompt_tokens} prompt tokens exceeds the budget "
+                    "but cannot be split further"
+                )
+            else:
+                print(f"{label}: ~{prompt_tokens} prompt tokens, fits in one request")
+            return [chunks]
+
+        overhead_tokens = math.ceil(estimate_tokens(overhead) * scale)
+        return pack_batches(
+            chunks,
+            [math.ceil(estimate_tokens(text) * scale) for text in chunk_texts],
+            max(1, limit - overhead_tokens),
+            label,
+        )
+
+    async def _split_for_budget(
+        self, header: str, groups: list[str], prompt: str, label: str
+    ) -> list[str]:
+        """
+        Pre-flight a prompt against the token budget and, when it is too large,
+        split its CSV payload into request-sized batches along group boundaries.
+        """
+        batches = await self._budget_batches(
+            prompt, header + "".join(groups), groups, groups, header, label
+        )
+        return [header + "".join(batch) for batch in batches]
+
+    async def _extract_and_organize_data(
+        self, csv_text: str, progress: Progress | None = None
+    ) -> dict:
+        from workflow.budget import merge_json_batches
+        from workflow.service_units.compaction import compact_skeleton_csv
+        from workflow.utils import split_csv_groups
+
+        if self.config.compact_prompts:
+            csv_text = compact_skeleton_csv(csv_text)
+
+        # Facilities (warehouse extensions such as AH, BA) are independent in
+        # every organization rule, so each one is extracted and organized on its
+        # own and the partitions run concurrently
+        header, facilities = split_csv_groups(
+            csv_text,
+            "Warehouse",
+            key=lambda warehouse: (
+                warehouse.split(" - ")[1] if " - " in warehouse else warehouse
+            ),
+        )
+        if not facilities:
+            extracted = await self._extract_service_units(csv_text)
+            await self._organize_cooldown()
+            return await self._organize_service_units(
+                extracted, simple=self._is_simple(csv_text)
+            )
+
+        partition_semaphore = asyncio.Semaphore(self.config.max_concurrent_partitions)
+        progress = progress or Progress()
+        done = 0
+
+        async def extract_partition(facility: str) -> list:
+            # A facility too large for one request is extracted in batches of
+            # rows; extraction is per row, so the results simply concatenate
+            _, rows = split_csv_groups(header + facility)
+            async with partition_semaphore:
+                batches = await self._split_for_budget(
+                    header,
+                    rows,
+                    self.context.prompts.extract_service_units.format(
+                        csv_text=header + facility
+                    ),
+                    "Service unit extraction",
+                )
+                extracted = []
+                for batch in batches:
+                    extracted.extend(await self._extract_service_units(batch))
+            return extracted
+
+        async def organize_partition(facility: str, extracted: list) -> dict:
+            nonlocal done
+            async with partition_semaphore:
+                organized = await self._organize_service_units(
+                    extracted, simple=self._is_simple(header + facility)
+                )
+            done += 1
+            progress.emit(
+                "partition_organized",
+                partition=done,
+                partitions=len(facilities),
+                units=sum(
+                    len(units)
+                    for units in organized.values()
+                    if isinstance(units, list)
+                ),
+            )
+            return organized
+
+        print(f"Processing {len(facilities)} facility partition(s)...")
+        extracted = await asyncio.gather(*(extract_partition(f) for f in facilities))
+        await self._organize_cooldown()
+        results = await asyncio.gather(
+            *(organize_partition(f, units) for f, units in zip(facilities, extracted))
+        )
+
+        return results[0] if len(results) == 1 else merge_json_batches(results)
+
+    def _is_simple(self, csv_text: str) -> bool:
+        return estimate_tokens(csv_text) <= self.config.light_model_max_data_tokens
+
+    async def _organize_cooldown(self):
+        # Sleep to avoid Gemini rate limits; once between the extraction and
+        # organization rounds, not once per partition
+        print("Cool down before making ai request....")
+        await asyncio.sleep(self.config.organize_cooldown)
+        print("Performing ai request....")
+
+    async def _extract_service_units(self, csv_text: str) -> list:
+        extracted_data_str = await self.process_data(
+            prompt=self.context.prompts.extract_service_units.format(csv_text=csv_text),
+            simple=self._is_simple(csv_text),
+        )
+        extracted_data_clean = extract_json_payload(extracted_data_str)
+        if not extracted_data_clean:
+            raise LLMRequestError(
+                "AI returned empty response while extracting service units"
+            )
+
+        extracted_data = loads(extracted_data_clean)
+
+        if not extracted_data or not isinstance(extracted_data, list):
+            raise ValueError("Generated invalid input - expected list of service units")
+
+        # Whole arrays are only rendered when debug logging is on
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Extracted data: %s", dumps(extracted_data, indent=True))
+        return extracted_data
+
+    def _organize_prompt(self, extracted_data: list) -> tuple[str, str, Any]:
+        """The organize prompt, the units JSON it embeds, and the codec used."""
+        from workflow.service_units.compaction import CompactCodec
+
+        prompts = self.context.prompts
+        codec = CompactCodec() if self.config.compact_prompts else None
+        units_json = dumps(codec.encode(extracted_data) if codec else extracted_data)
+        prompt = prompts.organize_service_units.format(
+            service_units_json=units_json,
+            encoding_notes=prompts.compact_encoding_notes if codec else "",
+        )
+        return prompt, units_json, codec
+
+    async def _organize_service_units(self, extracted_data: list, simple: bool) -> dict:
+        from workflow.budget import merge_json_batches
+
+        # The organize prompt embeds a partition's whole extraction, so it is
+        # pre-flighted too. Parent units follow from each unit's own warehouse,
+        # so batches organize independently and merge like partitions do.
+        # Units are sized as plain JSON, which overestimates them when the
+        # compact encoding is on, so batches err on the small side.
+        prompt, units_json, codec = self._organize_prompt(extracted_data)
+        batches = await self._budget_batches(
+            prompt,
+            units_json,
+            extracted_data,
+            [dumps(unit) for unit in extracted_data],
+            "",
+            "Service unit organization",
+        )
+        if len(batches) == 1:
+            return await self._organize_batch(prompt, codec, simple)
+
+        results = []
+        for batch in batches:
+            batch_prompt, _, batch_codec = self._organize_prompt(batch)
+            results.append(
+                await self._organize_batch(batch_prompt, batch_codec, simple)
+            )
+        return merge_json_batches(results)
+
+    async def _organize_batch(
+        self, organized_prompt: str, codec: Any, simple: bool
+    ) -> dict:
+        # Request failures are retried (and fall back) inside the request
+        # policy; this loop only asks again when an answer it accepted isn't
+        # valid JSON. Organize prompts routinely outlast the hedge delay, so
+        # they aren't hedged: a duplicate would mostly just double the cost.
+        last_error: str | None = None
+        organized_data = None
+        for attempt in range(3):
+            organized_data_str = await self.process_data(
+                prompt=organized_prompt, validate=None, simple=simple, hedge=False
+            )
+            try:
+                organized_data = loads(extract_json_payload(organized_data_str))
+                break
+            except (json.JSONDecodeError, TypeError) as e:
+                last_error = (
+                    f"AI returned invalid JSON while organizing service units: {e}"
+                )
+                await asyncio.sleep(2)
+
+        if organized_data is None:
+            raise LLMRequestError(
+                last_error
+                or "AI failed to organize service units after multiple attempts"
+            )
+
+        if codec and isinstance(organized_data, dict):
+            organized_data = codec.decode(organized_data)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Organized service units: %s", dumps(organized_data, indent=True)
+            )
+        return organized_data
+
+    async def process_service_units(
+        self,
+        payload: str,
+        base_dir: str,
+        folder_name: str,
+        output_format: OutputFormat = OutputFormat.csv,
+        output_packaging: OutputPackaging = OutputPackaging.files,
+        progress: Progress | None = None,
+    ) -> dict[str, dict[str, Any]]:
+        from workflow.service_units.schema import ServiceUnitInput
+        from workflow.service_units.service import (
+            ServiceUnitService,
+            memoization_stats,
+        )
+        from workflow.utils import read_csv_text
+
+        service_class = ServiceUnitService
+        if self.config.service_unit_engine == "frame":
+            from workflow.service_units.frame import FrameServiceUnitService
+
+            service_class = FrameServiceUnitService
+
+        progress = progress or Progress()
+        service_unit_service = service_class(
+            output_format=output_format,
+            content_addressed=self.config.content_addressed_outputs,
+        )
+        service_units_data = loads(payload)
+
+        # Generate skeleton CSV
+        filepath = await self.context.to_thread(
+            service_unit_service.generate_service_unit_skeleton,
+            [ServiceUnitInput(**unit_data) for unit_data in service_units_data],
+            base_dir,
+        )
+
+        if not filepath:
+            raise ValueError("Failed to generate service unit skeleton")
+
+        # Read CSV and extract data using AI
+        csv_text, row_count = await self.context.to_thread(read_csv_text, filepath)
+        logger.debug("Service unit skeleton:\n%s", csv_text)
+        progress.emit("rows_read", rows=row_count)
+
+        extracted_data = await self._extract_and_organize_data(csv_text, progress)
+
+        generated_files = await self.context.to_thread(
+            service_unit_service.process_all_unit_types, extracted_data, base_dir
+        )
+        outputs = await self._package(
+            {file: service_unit_service.outputs[file] for file in generated_files},
+            base_dir,
+            output_packaging,
+            "service_units",
+            progress,
+        )
+
+        print("Generated files: ", list(outputs))
+        # Shared by concurrent jobs, so only the running total is meaningful
+        print("Service unit memoization stats (process total): ", memoization_stats())
+        return outputs
+
+    def _persist_validation_cache(self):
+        self.validation_cache.save()
+        if self.commit:
+            self.commit()
+
+    async def _validate_users(
+        self, csv_data: str, progress: Progress | None = None
+    ) -> dict:
+        """
+        Validate user rows with the model, reusing cached results for rows that
+        are unchanged since a previous submission.
+        """
+        from workflow.budget import merge_json_batches
+        from workflow.utils import format_csv_rows, number_csv_rows, parse_csv_rows
+
+        # Number rows up front so results stay traceable across split requests
+        header, rows = parse_csv_rows(number_csv_rows(csv_data))
+        progress = progress or Progress()
+        progress.emit("rows_read", rows=len(rows))
+        cache = self.validation_cache
+        use_cache = cache is not None and cache.max_entries > 0
+
+        cached: dict[str, list] = {"valid_users": [], "errors": []}
+        pending_keys: dict[int, str] = {}
+        pending_rows = []
+        for row in rows:
+            key = ValidationCache.row_key(header[1:], row[1:])
+            entry = cache.get(key) if use_cache else None
+            if entry:
+                bucket = "valid_users" if entry["kind"] == "valid" else "errors"
+                cached[bucket].append({"row_index": int(row[0]), **entry["record"]})
+            else:
+                pending_keys[int(row[0])] = key
+                pending_rows.append(row)
+
+        print(
+            f"User validation cache: {len(rows) - len(pending_rows)} hit(s), "
+            f"{len(pending_rows)} row(s) to validate"
+        )
+        progress.emit(
+            "cache_checked",
+            cached=len(rows) - len(pending_rows),
+            pending=len(pending_rows),
+        )
+
+        validated_batches = [cached]
+        if pending_rows:
+            header_text = format_csv_rows([header])
+            batches = await self._split_for_budget(
+                header_text,
+                [format_csv_rows([row]) for row in pending_rows],
+                self.context.prompts.validate_users.format(
+                    users_json=dumps(header_text + format_csv_rows(pending_rows))
+                ),
+                "User validation",
+            )
+
+            for batch_number, batch in enumerate(batches, start=1):
+                response_data = await self.process_data(
+                    prompt=self.context.prompts.validate_users.format(
+                        users_json=dumps(batch)
+                    )
+                )
+
+                logger.debug("Validated users %s", response_data)
+
+                valid_users_clean = extract_json_payload(response_data)
+                result = loads(valid_users_clean)
+                validated_batches.append(result)
+                progress.emit(
+                    "chunk_validated",
+                    chunk=batch_number,
+                    chunks=len(batches),
+                    valid=len(result.get("valid_users", [])),
+                    errors=len(result.get("errors", [])),
+                )
+
+                if use_cache:
+                    for bucket, kind in (("valid_users", "valid"), ("errors", "error")):
+                        for record in result.get(bucket, []):
+                            key = pending_keys.get(row_index_of(record))
+                            if key:
+                                cache.put(key, kind, record)
+
+            if use_cache:
+                await self.context.to_thread(self._persist_validation_cache)
+
+        # Cached and fresh results interleave, so restore the sheet's row order
+        validated_data = merge_json_batches(validated_batches)
+        for bucket in ("valid_users", "errors"):
+            validated_data[bucket] = sorted(
+                validated_data.get(bucket, []), key=row_index_of
+            )
+        return validated_data
+
+    async def process_users(
+        self,
+        payload: str,
+        base_dir: str,
+        folder_name: str,
+        output_format: OutputFormat = OutputFormat.csv,
+        output_packaging: OutputPackaging = OutputPackaging.files,
+        progress: Progress | None = None,
+    ) -> dict[str, dict[str, Any]]:
+        from workflow.users.service import UserService
+        from workflow.utils import read_file_to_csv
+
+        service_class = UserService
+        if self.config.user_engine == "frame":
+            from workflow.users.frame import FrameUserService
+
+            service_class = FrameUserService
+
+        progress = progress or Progress()
+        user_service = service_class(
+            output_format=output_format,
+            content_addressed=self.config.content_addressed_outputs,
+            shard_by_company=self.config.user_shard_by_company,
+            shard_rows=self.config.user_shard_rows,
+        )
+        user_data = loads(payload)
+
+        # download_file
+        file_path = await self.storage.download(
+            user_data["file_name"], base_dir, folder_name
+        )
+        print("File downloaded ", file_path)
+        progress.emit(
+            "downloaded",
+            file=user_data["file_name"],
+            bytes=await self.context.to_thread(os.path.getsize, file_path),
+        )
+
+        # Read CSV and extract data using AI
+        csv_data = await self.context.to_thread(read_file_to_csv, file_path=file_path)
+        logger.debug("User sheet:\n%s", csv_data)
+
+        validated_data = await self._validate_users(csv_data, progress)
+        valid_users = validated_data.get("valid_users", [])
+        # errors = validated_data.get("errors", [])
+
+        result = await user_service.create_users_from_validation(valid_users, base_dir)
+        print(result)
+        outputs = await self._package(
+            result["outputs"], base_dir, output_packaging, "users", progress
+        )
+
+        print("Generated files: ", list(outputs))
+        return outputs
+
+    async def _package(
+        self,
+        outputs: dict[str, dict[str, Any]],
+        base_dir: str,
+        output_packaging: OutputPackaging,
+        prefix: str,
+        progress: Progress | None = None,
+    ) -> dict[str, dict[str, Any]]:
+        """Bundle outputs per ``output_packaging``, keeping action and row counts."""
+        progress = progress or Progress()
+        for file, output in outputs.items():
+            progress.emit("file_written", file=file, **output)
+
+        files = await self.context.to_thread(
+            package_outputs, list(outputs), base_dir, output_packaging, prefix
+        )
+        if output_packaging == OutputPackaging.files:
+            return outputs
+
+        rows = sum(output["rows"] for output in outputs.values())
+        packaged = {file: {"action": prefix, "rows": rows} for file in files}
+        for file, output in packaged.items():
+            progress.emit("file_packaged", file=file, **output)
+        return packaged
+
+    async def _deliver(
+        self,
+        outputs: dict[str, dict[str, Any]],
+        base_dir: str,
+        folder_name: str,
+        workflow_type: WorkflowType,
+        progress: Progress | None = None,
+    ) -> dict[str, Any]:
+        """Upload outputs, then write and upload the manifest describing them."""
+        progress = progress or Progress()
+        files = list(outputs)
+
+        # Hashed while they were written; packaged artifacts are hashed below
+        written = {
+            file: (output["bytes"], output["sha256"])
+            for file, output in outputs.items()
+            if "sha256" in output
+        }
+        checksums = (
+            {file: sha256 for file, (_, sha256) in written.items()}
+            if self.config.content_addressed_outputs
+            else {}
+        )
+
+        # One upload per file, so each is reported as soon as it lands
+        async def upload(file: str) -> dict[str, str]:
+            etags = await self.storage.upload([file], base_dir, folder_name, checksums)
+            progress.emit(
+                "file_uploaded",
+                key=f"{folder_name}/{file}",
+                etag=etags.get(file),
+                **outputs[file],
+            )
+            return etags
+
+        print("Uploading files...")
+        uploads, digests = await asyncio.gather(
+            asyncio.gather(*(upload(file) for file in files)),
+            asyncio.gather(
+                *(
+                    self.context.to_thread(file_digest, os.path.join(base_dir, file))
+                    for file in files
+                    if file not in written
+                )
+            ),
+        )
+        digests = iter(digests)
+        print("Uploaded files...")
+
+        manifest = build_manifest(
+            os.path.basename(base_dir),
+            workflow_type.value,
+            folder_name,
+            outputs,
+            {file: written.get(file) or next(digests) for file in files},
+            {file: etag for etags in uploads for file, etag in etags.items()},
+        )
+        manifest_file = await self.context.to_thread(write_manifest, manifest, base_dir)
+        uploads.append(
+            await self.storage.upload([manifest_file], base_dir, folder_name)
+        )
+        print("Uploaded manifest ", manifest["manifest_key"])
+        # This job's files only; the storage backend's counters span all jobs
+        skipped = sum(len(getattr(etags, "skipped", ())) for etags in uploads)
+        print(
+            "Uploads:",
+            {
+                "uploaded": sum(len(etags) for etags in uploads) - skipped,
+                "skipped_unchanged": skipped,
+            },
+        )
+        progress.emit("manifest_uploaded", key=manifest["manifest_key"])
+        return manifest
+
+    async def run(
+        self,
+        workflow_type: WorkflowType,
+        payload: str,
+        folder_id: str,
+        output_format: OutputFormat = OutputFormat.csv,
+        output_packaging: OutputPackaging = OutputPackaging.files,
+        progress: Progress | None = None,
+    ) -> dict[str, Any]:
+        """
+        Run one job in a scratch directory of its own; returns its manifest.
+        Stage events go to ``progress``, ending with "completed" or "failed".
+        """
+        progress = progress or Progress()
+        # make base_dir, unique per job so concurrent jobs for the same folder
+        # never share (or clean up) each other's files. It sits directly in
+        # work_dir, so cleaning it up leaves no empty per-folder directory.
+        base_dir = pathlib.Path(self.work_dir, f"{folder_id}-{uuid.uuid4().hex}")
+        base_dir.mkdir(parents=True, exist_ok=True)
+        print("Generated base_dir directory ", str(base_dir))
+        progress.emit("started", workflow_type=workflow_type.value, folder_id=folder_id)
+
+        try:
+            if workflow_type == WorkflowType.service_units:
+                process = self.process_service_units
+            elif workflow_type == WorkflowType.users:
+                process = self.process_users
+            else:
+                raise ValueError(f"Unsupported workflow type: {workflow_type}")
+
+            outputs = await process(
+                payload,
+                str(base_dir),
+                folder_id,
+                output_format,
+                output_packaging,
+                progress,
+            )
+            manifest = await self._deliver(
+                outputs, str(base_dir), folder_id, workflow_type, progress
+            )
+            progress.emit("completed", manifest=manifest)
+            return manifest
+
+        except Exception as e:
+            progress.emit("failed", error=str(e))
+            raise
+
+        finally:
+            # clean up base_dir
+            if base_dir.exists() and base_dir.is_dir():
+                print(f"Cleaning up base dir {base_dir}....")
+                shutil.rmtree(base_dir, ignore_errors=True)
+                print(f"✓ Successfully cleaned up {base_dir}")
@@ -0,0 +1,51 @@
+import asyncio
+import json
+import time
+from collections.abc import AsyncIterator
+from typing import Any
+
+
+class Progress:
+    """
+    Stage events of one job, each stamped with the seconds since it started.
+    The base class discards them; ``ProgressStream`` hands them to a client.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+
+    def emit(self, stage: str, **fields: Any) -> dict[str, Any]:
+        event = {
+            "stage": stage,
+            "elapsed": round(time.perf_counter() - self.started, 3),
+            **fields,
+        }
+        self.publish(event)
+        return event
+
+    def publish(self, event: dict[str, Any]):
+        pass
+
+
+class ProgressStream(Progress):
+    """Queues events for a streaming response until ``close`` is called."""
+
+    def __init__(self):
+        super().__init__()
+        self.queue: asyncio.Queue[dict[str, Any] | None] = asyncio.Queue()
+
+    def publish(self, event: dict[str, Any]):
+        self.queue.put_nowait(event)
+
+    def close(self):
+        self.queue.put_nowait(None)
+
+    async def events(self) -> AsyncIterator[dict[str, Any]]:
+        while (event := await self.queue.get()) is not None:
+            yield event
+
+    async def encode(self, sse: bool = False) -> AsyncIterator[str]:
+        """Events as NDJSON lines, or as server-sent events when ``sse`` is set."""
+        async for event in self.events():
+            data = json.dumps(event)
+            yield f"event: {event['stage']}\ndata: {data}\n\n" if sse else data + "\n"
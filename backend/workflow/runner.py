@@ -0,0 +1,301 @@
+"""
+Run workflows in-process, without Modal.
+
+Run from the backend directory, e.g.::
+
+    python -m workflow.runner users --payload '{"file_name": "staff.xlsx"}' \\
+        --folder-id demo --storage-root runs --llm record --llm-cache runs/llm.json
+
+With local storage, inputs are read from and outputs written to
+``<storage-root>/<folder-id>/``. ``--llm record`` calls Gemini and saves every
+response; ``--llm replay`` serves them back offline, which is what profiling
+and load-test runs should use.
+"""
+
+import argparse
+import asyncio
+import cProfile
+import json
+import logging
+import os
+import pstats
+import time
+from dataclasses import dataclass
+
+from workflow.budget import TokenBudget
+from workflow.context import WorkflowContext
+from workflow.llm import RecordedLLM, RequestPolicy
+from workflow.pipeline import (
+    LLMBackend,
+    PipelineConfig,
+    StorageBackend,
+    WorkflowPipeline,
+    WorkflowType,
+)
+from workflow.storage import LocalStorage, S3Storage
+from workflow.users.cache import ValidationCache, validation_fingerprint
+from workflow.utils import OutputFormat, OutputPackaging
+
+MODEL_NAME = "gemini-2.5-flash"
+
+
+@dataclass
+class Job:
+    workflow_type: WorkflowType
+    payload: str
+    folder_id: str = "local"
+    output_format: OutputFormat = OutputFormat.csv
+    output_packaging: OutputPackaging = OutputPackaging.files
+
+
+def gemini_backend(max_concurrent_requests: int = 8) -> RequestPolicy:
+    from workflow.lazy import genai
+
+    client = genai.Client(api_key=os.environ["GEMINI_API_KEY"])
+    return RequestPolicy.from_env(
+        client, MODEL_NAME, semaphore=asyncio.Semaphore(max_concurrent_requests)
+    )
+
+
+def s3_backend() -> S3Storage:
+    from workflow.lazy import boto3
+
+    return S3Storage(boto3.client("s3"), os.environ["S3_BUCKET_NAME"])
+
+
+def build_pipeline(
+    llm: LLMBackend | None = None,
+    storage: StorageBackend | None = None,
+    storage_root: str = "runs",
+    validation_cache_path: str | None = None,
+    work_dir: str | None = None,
+    context: WorkflowContext | None = None,
+) -> WorkflowPipeline:
+    """Pipeline with the same env-driven tuning as the Modal deployment."""
+    llm = llm or gemini_backend()
+    # A RecordedLLM's answers come from the policy it wraps, if any
+    policy = getattr(llm, "inner", llm)
+    return WorkflowPipeline(
+        llm,
+        storage or LocalStorage(storage_root),
+        config=PipelineConfig.from_env(),
+        token_budget=TokenBudget.from_env(),
+        validation_cache=ValidationCache(
+            validation_cache_path,
+            fingerprint=validation_fingerprint(
+                MODEL_NAME, getattr(policy, "fallback_model", None)
+            ),
+        )
+        if validation_cache_path
+        else None,
+        work_dir=work_dir or os.path.join(storage_root, "tmp"),
+        context=context,
+    )
+
+
+async def run_jobs(
+    pipeline: WorkflowPipeline, jobs: list[Job], parallel: int = 1
+) -> list[dict]:
+    """Run jobs with at most ``parallel`` in flight; a failed job doesn't stop the rest."""
+    semaphore = asyncio.Semaphore(max(1, parallel))
+
+    async def run_job(job: Job) -> dict:
+        async with semaphore:
+            started = time.perf_counter()
+            result = {
+                "workflow_type": job.workflow_type.value,
+                "folder_id": job.folder_id,
+            }
+            try:
+                result["manifest"] = await pipeline.run(
+                    job.workflow_type,
+                    job.payload,
+                    job.folder_id,
+                    job.output_format,
+                    job.output_packaging,
+                )
+            except Exception as e:
+                print(f"✗ Job for {job.folder_id} failed: {e}")
+                result["error"] = str(e)
+            result["seconds"] = round(time.perf_counter() - started, 3)
+            return result
+
+    return await asyncio.gather(*(run_job(job) for job in jobs))
+
+
+def run_workflow(
+    workflow_type: WorkflowType | str,
+    payload: str | dict | list,
+    folder_id: str = "local",
+    pipeline: WorkflowPipeline | None = None,
+    output_format: OutputFormat = OutputFormat.csv,
+    output_packaging: OutputPackaging = OutputPackaging.files,
+) -> dict:
+    """Run a single job to completion and return its output manifest."""
+    if not isinstance(payload, str):
+        payload = json.dumps(payload)
+
+    pipeline = pipeline or build_pipeline()
+    return asyncio.run(
+        pipeline.run(
+            WorkflowType(workflow_type),
+            payload,
+            folder_id,
+            output_format,
+            output_packaging,
+        )
+    )
+
+
+def read_payload(value: str) -> str:
+    """The JSON payload of a ``--payload`` argument: inline, or ``@path`` to a file."""
+    if value.startswith("@"):
+        with open(value[1:], "r", encoding="utf-8") as f:
+            return f.read()
+    return value
+
+
+def _profiled(profile: str | None, output: str | None, run):
+    if profile == "cprofile":
+        profiler = cProfile.Profile()
+        result = profiler.runcall(run)
+        if output:
+            profiler.dump_stats(output)
+            print(f"cProfile stats written to {output}")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(30)
+        return result
+
+    if profile == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise SystemExit("--profile pyinstrument needs `pip install pyinstrument`")
+
+        profiler = Profiler(async_mode="enabled")
+        profiler.start()
+        try:
+            return run()
+        finally:
+            profiler.stop()
+            if output:
+                with open(output, "w", encoding="utf-8") as f:
+                    f.write(profiler.output_html())
+                print(f"pyinstrument report written to {output}")
+            else:
+                print(profiler.output_text(unicode=True, color=False))
+
+    return run()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("workflow_type", choices=[t.value for t in WorkflowType])
+    parser.add_argument(
+        "--payload",
+        action="append",
+        required=True,
+        help="job payload as JSON, or @path to a file; repeat for several jobs",
+    )
+    parser.add_argument("--folder-id", default="local")
+    parser.add_argument(
+        "--jobs", type=int, default=1, help="number of jobs run in parallel"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=1, help="submit every payload this many times"
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=[f.value for f in OutputFormat],
+        default=OutputFormat.csv.value,
+    )
+    parser.add_argument(
+        "--output-packaging",
+        choices=[p.value for p in OutputPackaging],
+        default=OutputPackaging.files.value,
+    )
+    parser.add_argument(
+        "--llm", choices=["gemini", "record", "replay"], default="gemini"
+    )
+    parser.add_argument(
+        "--llm-cache",
+        default="runs/llm_responses.json",
+        help="recorded responses for --llm record/replay",
+    )
+    parser.add_argument("--storage", choices=["local", "s3"], default="local")
+    parser.add_argument("--storage-root", default="runs")
+    parser.add_argument(
+        "--validation-cache", help="directory of a user validation cache"
+    )
+    parser.add_argument("--profile", choices=["cprofile", "pyinstrument"])
+    parser.add_argument(
+        "--profile-output", help="cProfile .prof file or pyinstrument .html report"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=os.environ.get("WORKFLOW_LOG_LEVEL", "INFO"))
+
+    context = WorkflowContext.create(max_workers=max(4, args.jobs * 4))
+
+    recorded = None
+    if args.llm == "gemini":
+        llm = gemini_backend()
+    else:
+        inner = gemini_backend() if args.llm == "record" else None
+        llm = recorded = RecordedLLM(args.llm_cache, inner=inner)
+
+    pipeline = build_pipeline(
+        llm=llm,
+        storage=s3_backend() if args.storage == "s3" else None,
+        storage_root=args.storage_root,
+        validation_cache_path=args.validation_cache,
+        context=context,
+    )
+    jobs = [
+        Job(
+            WorkflowType(args.workflow_type),
+            read_payload(payload),
+            args.folder_id,
+            OutputFormat(args.output_format),
+            OutputPackaging(args.output_packaging),
+        )
+        for payload in args.payload
+        for _ in range(args.repeat)
+    ]
+
+    started = time.perf_counter()
+    try:
+        results = _profiled(
+            args.profile,
+            args.profile_output,
+            lambda: asyncio.run(run_jobs(pipeline, jobs, args.jobs)),
+        )
+    finally:
+        if recorded and recorded.stats["recorded"]:
+            recorded.save()
+        if pipeline.validation_cache:
+            pipeline.validation_cache.save()
+    elapsed = time.perf_counter() - started
+
+    for result in results:
+        print(json.dumps(result))
+    failed = sum(1 for result in results if "error" in result)
+    print(
+        f"{len(results) - failed}/{len(results)} job(s) succeeded in {elapsed:.1f}s "
+        f"with {args.jobs} in parallel"
+    )
+    print("LLM backend stats:", llm.report())
+    print(
+        "Storage uploads (all jobs):",
+        {
+            "uploaded": pipeline.storage.uploads,
+            "skipped_unchanged": pipeline.storage.uploads_skipped,
+        },
+    )
+    print("Context init:", context.report())
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+JSON for the pipeline's large payloads: orjson when it is installed, the json
+module otherwise.
+
+Both encoders write compact JSON and, like ``json.dumps``, escape non-ASCII
+characters unless told not to, so prompts come out the same whichever one is
+in use (only float exponents are spelled differently, e.g. 1e20 and 1e+20).
+"""
+
+import json
+import re
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speed-up
+    orjson = None
+
+
+def loads(data: str | bytes) -> Any:
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson rejects NaN/Infinity and lone surrogates; json doesn't
+            pass
+    return json.loads(data)
+
+
+_NON_ASCII = re.compile(r"[^\x00-\x7f]")
+
+
+def _escape(match: re.Match) -> str:
+    # The \uXXXX escapes json.dumps writes, as a surrogate pair past U+FFFF
+    code = ord(match.group())
+    if code > 0xFFFF:
+        code -= 0x10000
+        return f"\\u{0xD800 | code >> 10:04x}\\u{0xDC00 | code & 0x3FF:04x}"
+    return f"\\u{code:04x}"
+
+
+def dumps(obj: Any, indent: bool = False, ensure_ascii: bool = True) -> str:
+    """Compact JSON text, or indented by two spaces for debug output."""
+    if orjson is not None:
+        text = orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode()
+        # Non-ASCII characters only occur inside strings, so escaping them
+        # afterwards yields what json.dumps would have written
+        if ensure_ascii and not text.isascii():
+            text = _NON_ASCII.sub(_escape, text)
+        return text
+    if indent:
+        return json.dumps(obj, ensure_ascii=ensure_ascii, indent=2)
+    return json.dumps(obj, ensure_ascii=ensure_ascii, separators=(",", ":"))
+
+
+def load_file(path: str) -> Any:
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+def dump_file(obj: Any, path: str, indent: bool = False):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(dumps(obj, indent=indent, ensure_ascii=False))
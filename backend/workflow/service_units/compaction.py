@@ -0,0 +1,142 @@
+import csv
+import io
+import re
+from dataclasses import dataclass, field
+from typing import Any
+
+# Fields whose values repeat on nearly every row of a batch; these are sent once
+# in a lookup table and referenced by index from each row.
+DICTIONARY_FIELDS = {"company", "warehouse"}
+
+EMPTY_VALUES = (None, "", [], {})
+
+
+def _normalize_field(name: str) -> str:
+    return re.sub(r"[\s_]+", "_", name.strip().lower())
+
+
+def _short_key(name: str, taken: set[str]) -> str:
+    """Build a short key from the initials of a field name, e.g. Service Unit -> su."""
+    words = [w for w in re.split(r"[\s_()]+", name) if w]
+    base = "".join(w[0] for w in words).lower() or "k"
+    key, suffix = base, 2
+    while key in taken:
+        key = f"{base}{suffix}"
+        suffix += 1
+    taken.add(key)
+    return key
+
+
+def compact_skeleton_csv(csv_text: str) -> str:
+    """Drop columns that are empty on every row of the skeleton CSV."""
+    rows = list(csv.DictReader(io.StringIO(csv_text)))
+    if not rows:
+        return csv_text
+
+    headers = [h for h in rows[0] if any(row.get(h) for row in rows)]
+
+    output = io.StringIO()
+    writer = csv.DictWriter(
+        output, fieldnames=headers, extrasaction="ignore", lineterminator="\n"
+    )
+    writer.writeheader()
+    writer.writerows(rows)
+    return output.getvalue()
+
+
+@dataclass
+class CompactCodec:
+    """Describes how a unit list was compacted so model output can be expanded."""
+
+    keys: dict[str, str] = field(default_factory=dict)  # short key -> field name
+    values: dict[str, list[Any]] = field(default_factory=dict)  # field -> lookup
+    dropped: dict[str, Any] = field(default_factory=dict)  # all-empty fields
+
+    def encode(self, units: list[dict[str, Any]]) -> dict[str, Any]:
+        field_names: list[str] = []
+        for unit in units:
+            for name in unit:
+                if name not in field_names:
+                    field_names.append(name)
+
+        taken: set[str] = set()
+        short_keys: dict[str, str] = {}
+        for name in field_names:
+            column = [unit.get(name) for unit in units]
+            if all(value in EMPTY_VALUES for value in column):
+                self.dropped[name] = column[0]
+                continue
+
+            short_keys[name] = _short_key(name, taken)
+            self.keys[short_keys[name]] = name
+
+            if _normalize_field(name) in DICTIONARY_FIELDS:
+                self.values[name] = list(
+                    dict.fromkeys(v for v in column if isinstance(v, str))
+                )
+
+        indexes = {
+            name: {value: i for i, value in enumerate(lookup)}
+            for name, lookup in self.values.items()
+        }
+        rows = []
+        for unit in units:
+            row = {}
+            for name, value in unit.items():
+                if name not in short_keys:
+                    continue
+                if name in indexes and isinstance(value, str):
+                    value = indexes[name][value]
+                row[short_keys[name]] = value
+            rows.append(row)
+
+        return {
+            "keys": self.keys,
+            "values": {short_keys[name]: v for name, v in self.values.items()},
+            "rows": rows,
+        }
+
+    def _expand_row(self, row: dict[str, Any]) -> dict[str, Any]:
+        expanded: dict[str, Any] = {}
+        is_encoded = False
+        for key, value in row.items():
+            name = self.keys.get(key, key)
+            is_encoded = is_encoded or key in self.keys
+
+            lookup = self.values.get(name)
+            if lookup is None:
+                # Parent objects use plain names, e.g. "company" for "Company"
+                lookup = next(
+                    (
+                        v
+                        for n, v in self.values.items()
+                        if _normalize_field(n) == _normalize_field(name)
+                    ),
+                    None,
+                )
+            if (
+                lookup is not None
+                and isinstance(value, int)
+                and not isinstance(value, bool)
+                and 0 <= value < len(lookup)
+            ):
+                value = lookup[value]
+
+            expanded[name] = value
+
+        if is_encoded:
+            for name, empty in self.dropped.items():
+                expanded.setdefault(name, empty)
+
+        return expanded
+
+    def decode(self, organized: dict[str, Any]) -> dict[str, Any]:
+        """Expand short keys and lookup indexes in the organized model output."""
+        return {
+            array_name: [
+                self._expand_row(row) if isinstance(row, dict) else row for row in rows
+            ]
+            if isinstance(rows, list)
+            else rows
+            for array_name, rows in organized.items()
+        }
@@ -0,0 +1,281 @@
+import numpy as np
+import pandas as pd
+
+from workflow.utils import SavedFile, save_frame_file
+
+from .schema import ServiceUnitRow, ServiceUnitRowList
+from .service import (
+    BILLING_ITEM_COLUMNS,
+    EMPTY_SERVICE_POINT_COLUMNS,
+    ServiceUnitService,
+    classify_point_name,
+)
+
+UNIT_BASE_COLUMNS = [
+    "ID",
+    "Service Unit",
+    "Company",
+    "Is Group",
+    "Service Unit Type",
+    *BILLING_ITEM_COLUMNS,
+    "Allow Appointments",
+    "Is MCH",
+    "Warehouse",
+    "Parent Service Unit",
+    "Service Unit Capacity",
+    "Inpatient Occupancy",
+]
+SERVICE_POINT_COLUMNS = list(EMPTY_SERVICE_POINT_COLUMNS)
+UNIT_COLUMNS = UNIT_BASE_COLUMNS + SERVICE_POINT_COLUMNS
+UNIT_FIELDS = list(ServiceUnitRow.model_fields)
+
+# Service point fields, and the flat row fields used for units without points
+SERVICE_POINT_FIELDS = {
+    "id": "id_service_points",
+    "point_name": "point_name_service_points",
+    "point_type": "point_type_service_points",
+    "service_stage": "service_stage_service_points",
+}
+
+
+def _blank_missing(frame: pd.DataFrame) -> pd.DataFrame:
+    # Cells absent from a row are None, as DictWriter/parquet see them
+    frame = frame.astype(object)
+    return frame.where(frame.notna(), None)
+
+
+def classify_point_names(names: np.ndarray, is_mch: np.ndarray) -> np.ndarray:
+    """``classify_point_name`` over whole columns, computed once per distinct name."""
+    codes, uniques = pd.factorize(names)
+    service_types = np.array(
+        [classify_point_name(name, True) for name in uniques] + [""], dtype=object
+    )
+    return np.where(is_mch, service_types[codes], "")
+
+
+class FrameServiceUnitService(ServiceUnitService):
+    """
+    ``ServiceUnitService`` with unit generation done column-wise on pandas
+    DataFrames instead of row by row. It writes byte-identical files; rows are
+    passed between the orchestration steps as frames rather than dict lists.
+    """
+
+    def create_parent_service_units(
+        self,
+        units: list,
+        is_parent: bool = False,
+        inpatient: bool = False,
+        allow_appointments: bool = False,
+    ) -> pd.DataFrame:
+        source = pd.DataFrame(
+            {
+                key: [unit.get(key, "") for unit in units]
+                for key in ("service_unit", "company", "type", "parent_service_unit")
+            },
+            dtype=object,
+        )
+        service_unit = source["service_unit"]
+        if is_parent:
+            service_unit = service_unit.str.split(" - ").str[0]
+
+        unit_type = source["type"]
+        n = len(source)
+        return pd.DataFrame(
+            {
+                "ID": [""] * n,
+                "Service Unit": service_unit,
+                "Company": source["company"],
+                "Is Group": [1] * n,
+                "Service Unit Type": np.where(
+                    unit_type == "Maternity Ward",
+                    "Inpatient Service Unit",
+                    unit_type + " Service Unit",
+                ),
+                "Allow Appointments": [1 if allow_appointments else 0] * n,
+                "Is MCH": [0] * n,
+                "Warehouse": [None] * n,
+                "Parent Service Unit": source["parent_service_unit"],
+                "Service Unit Capacity": [0] * n,
+                "Inpatient Occupancy": [1 if inpatient else 0] * n,
+                "ID (Service Points)": [""] * n,
+                "Point Name (Service Points)": [""] * n,
+                "Point Type (Service Points)": [""] * n,
+                "Service Stage (Service Points)": [""] * n,
+            },
+        ).astype(object)
+
+    def generate_frame(
+        self,
+        units: pd.DataFrame,
+        bedstart: int | None = None,
+        allow_appointments: bool = False,
+    ) -> pd.DataFrame:
+        """
+        Frame version of ``generate_service_units``: one organized unit per row,
+        ``ServiceUnitRow`` field names as columns.
+        """
+        n = len(units)
+        unit_type = units["service_unit_type"].fillna("")
+        is_inpatient = unit_type.str.lower().str.contains("inpatient", regex=False)
+        warehouse = units["warehouse"].fillna("").to_numpy(dtype=object)
+        company = units["company"].to_numpy(dtype=object)
+        service_unit = units["service_unit"].to_numpy(dtype=object)
+
+        unit_columns = {
+            "ID": np.full(n, "", dtype=object),
+            "Service Unit": service_unit,
+            "Company": company,
+            "Is Group": units["is_group"].to_numpy(dtype=int),
+            "Service Unit Type": unit_type.to_numpy(dtype=object),
+            **dict.fromkeys(
+                BILLING_ITEM_COLUMNS,
+                np.where(is_inpatient, None, "General Consultation fee").astype(object),
+            ),
+            "Allow Appointments": np.full(n, 1 if allow_appointments else 0),
+            "Is MCH": units["is_mch"].to_numpy(dtype=int),
+            "Warehouse": warehouse,
+            "Parent Service Unit": units["parent_service_unit"]
+            .fillna("")
+            .to_numpy(dtype=object),
+            "Service Unit Capacity": np.where(
+                unit_type == "Inpatient Service Unit", 0, 10000
+            ),
+            "Inpatient Occupancy": np.zeros(n, dtype=int),
+        }
+
+        # Service points, one row each; units without any keep their flat fields
+        point_counts = units["service_points"].map(len).to_numpy()
+        points = units["service_points"].explode().dropna()
+        flat = units.loc[point_counts == 0, list(SERVICE_POINT_FIELDS.values())]
+        point_unit = np.concatenate([points.index.to_numpy(), flat.index.to_numpy()])
+        point_values = {
+            field: np.concatenate(
+                [
+                    np.array([getattr(p, field) or "" for p in points], dtype=object),
+                    flat[flat_field].fillna("").to_numpy(dtype=object),
+                ]
+            )
+            for field, flat_field in SERVICE_POINT_FIELDS.items()
+        }
+        # Position of each point within its unit; only the first carries the unit
+        point_order = np.concatenate(
+            [
+                np.arange(len(points))
+                - np.repeat(np.cumsum(point_counts) - point_counts, point_counts),
+                np.zeros(len(flat), dtype=int),
+            ]
+        )
+        continuation = point_order > 0
+
+        # Beds, numbered per company and continuing from earlier calls
+        beds = (
+            pd.to_numeric(units["beds"], errors="coerce")
+            .fillna(0)
+            .astype(int)
+            .clip(lower=0)
+            .to_numpy()
+        )
+        default_start = bedstart if bedstart is not None else 1
+        start = np.array(
+            [self.company_bed_counters.get(key, default_start) for key in company],
+            dtype=int,
+        )
+        beds_by_company = pd.Series(beds).groupby(company)
+        first_bed = start + beds_by_company.cumsum().to_numpy() - beds
+        self.company_bed_counters.update(
+            pd.Series(first_bed + beds).groupby(company).last().to_dict()
+        )
+
+        bed_unit = np.repeat(np.arange(n), beds)
+        bed_offset = np.arange(len(bed_unit)) - np.repeat(np.cumsum(beds) - beds, beds)
+        bed_numbers = first_bed[bed_unit] + bed_offset
+        has_suffix = np.char.find(warehouse.astype(str), " - ") >= 0
+        suffix = np.array(
+            [w.split(" - ")[1] if has else "" for w, has in zip(warehouse, has_suffix)],
+            dtype=object,
+        )
+        bed_count = len(bed_unit)
+        bed_columns = {
+            "ID": np.full(bed_count, "", dtype=object),
+            "Service Unit": np.array(
+                [f"Beds-{number:04d}" for number in bed_numbers], dtype=object
+            ),
+            "Company": company[bed_unit],
+            "Is Group": np.zeros(bed_count, dtype=int),
+            "Service Unit Type": np.full(
+                bed_count, "Inpatient Service Unit", dtype=object
+            ),
+            **dict.fromkeys(BILLING_ITEM_COLUMNS, np.full(bed_count, None)),
+            "Allow Appointments": np.zeros(bed_count, dtype=int),
+            "Is MCH": np.zeros(bed_count, dtype=int),
+            "Warehouse": warehouse[bed_unit],
+            "Parent Service Unit": (service_unit + " - " + suffix)[bed_unit],
+            "Service Unit Capacity": np.zeros(bed_count, dtype=int),
+            "Inpatient Occupancy": np.ones(bed_count, dtype=int),
+            **{
+                column: np.full(bed_count, "", dtype=object)
+                for column in SERVICE_POINT_COLUMNS
+            },
+        }
+
+        # Each unit's point rows come before its bed rows, units in input order
+        row_order = np.lexsort(
+            (
+                np.concatenate(
+                    [point_order, np.maximum(point_counts, 1)[bed_unit] + bed_offset]
+                ),
+                np.concatenate([point_unit, bed_unit]),
+            )
+        )
+        point_columns = {
+            column: np.where(continuation, "", values.astype(object)[point_unit])
+            for column, values in unit_columns.items()
+        }
+        point_columns.update(
+            zip(SERVICE_POINT_COLUMNS, point_values.values()),
+        )
+        point_columns["Service Type (Service Points)"] = classify_point_names(
+            point_values["point_name"], units["is_mch"].to_numpy(dtype=bool)[point_unit]
+        )
+        return pd.DataFrame(
+            {
+                column: np.concatenate([point_columns[column], bed_columns[column]])[
+                    row_order
+                ]
+                for column in UNIT_COLUMNS
+            }
+        )
+
+    def process_units(
+        self,
+        organized_data: dict,
+        unit_key: str,
+        filter_groups: bool = False,
+        allow_appointments: bool = False,
+    ) -> pd.DataFrame:
+        units = organized_data.get(unit_key, [])
+        if not units:
+            return pd.DataFrame(columns=UNIT_COLUMNS)
+
+        models = ServiceUnitRowList.validate_python(units)
+        rows = self.generate_frame(
+            pd.DataFrame(
+                {field: [getattr(m, field) for m in models] for field in UNIT_FIELDS}
+            ),
+            allow_appointments=allow_appointments,
+        )
+
+        return rows[rows["Is Group"] != 1] if filter_groups else rows
+
+    def _concat_rows(self, parts: list) -> pd.DataFrame:
+        parts = [part for part in parts if len(part)]
+        if not parts:
+            return pd.DataFrame()
+        return _blank_missing(pd.concat(parts, ignore_index=True))
+
+    def _write_rows(
+        self, folder_name: str, rows: pd.DataFrame, filename: str
+    ) -> SavedFile:
+        return save_frame_file(
+            folder_name, rows, filename, self.output_format, self.content_addressed
+        )
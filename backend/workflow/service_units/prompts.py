@@ -64,6 +64,7 @@ Return ONLY valid JSON array format. No markdown, no code blocks, no explanation
 ORGANIZE_SERVICE_UNITS_PROMPT = """
 Organize the following service units JSON array into 7 distinct arrays based on hierarchy and type.
 Service Units Data: {service_units_json}
+{encoding_notes}
 
 ORGANIZATION RULES:
 
@@ -162,3 +163,16 @@ Return **only** valid JSON object format with these 7 keys:
 
 Preserve all original fields from each service unit. No markdown code blocks.
 """
+
+COMPACT_ENCODING_NOTES = """
+DATA ENCODING:
+The data above is compacted to save space:
+- "keys" maps each short key to its full field name (e.g. "su" -> "service_unit").
+- "values" holds lookup lists for repeated fields; a row value for that short key is
+  an index into the list (e.g. "c": 0 means the first company in values["c"]).
+- "rows" holds the service units themselves using the short keys.
+Apply every rule below to the decoded field names and values.
+In outpatient_units, inpatient_units and maternity_wards, return each unit exactly as
+given in "rows" (same short keys, same indexes). All other arrays use the full field
+names and full string values described below.
+"""
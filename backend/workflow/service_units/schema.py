@@ -1,6 +1,25 @@
-from typing import Optional
+from typing import Any, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import AliasChoices, BaseModel, Field, TypeAdapter, field_validator
+
+FIELD_KEY_MAP: dict[str, str] = {
+    "ID": "id",
+    "Service Unit": "service_unit",
+    "Company": "company",
+    "Is Group": "is_group",
+    "Service Unit Type": "service_unit_type",
+    "Is MCH": "is_mch",
+    "Warehouse": "warehouse",
+    "Parent Service Unit": "parent_service_unit",
+    "Service Unit Capacity": "service_unit_capacity",
+    "Service Points": "service_points",
+    "Beds": "beds",
+}
+
+# Accept both the CSV column names and the field names when validating rows
+_ALIASES = {
+    field: AliasChoices(field, column) for column, field in FIELD_KEY_MAP.items()
+}
 
 
 class MaternityChildren(BaseModel):
@@ -71,18 +90,44 @@ class ServicePoint(BaseModel):
 
 
 class ServiceUnitRow(BaseModel):
-    id: str = ""
-    service_unit: str
-    company: str
-    is_group: bool = False
-    service_unit_type: Optional[str] = None
-    is_mch: bool = False
-    warehouse: Optional[str] = None
-    parent_service_unit: Optional[str] = None
-    service_unit_capacity: Optional[int] = None
-    service_points: list[ServicePoint] = []
+    id: str = Field("", validation_alias=_ALIASES["id"])
+    service_unit: str = Field(validation_alias=_ALIASES["service_unit"])
+    company: str = Field(validation_alias=_ALIASES["company"])
+    is_group: bool = Field(False, validation_alias=_ALIASES["is_group"])
+    service_unit_type: Optional[str] = Field(
+        None, validation_alias=_ALIASES["service_unit_type"]
+    )
+    is_mch: bool = Field(False, validation_alias=_ALIASES["is_mch"])
+    warehouse: Optional[str] = Field(None, validation_alias=_ALIASES["warehouse"])
+    parent_service_unit: Optional[str] = Field(
+        None, validation_alias=_ALIASES["parent_service_unit"]
+    )
+    service_unit_capacity: Optional[int] = Field(
+        None, validation_alias=_ALIASES["service_unit_capacity"]
+    )
+    service_points: list[ServicePoint] = Field(
+        [], validation_alias=_ALIASES["service_points"]
+    )
     id_service_points: Optional[str] = None
     point_name_service_points: Optional[str] = None
     point_type_service_points: Optional[str] = None
     service_stage_service_points: Optional[str] = None
-    beds: Optional[int] = None
+    beds: Optional[int] = Field(None, validation_alias=_ALIASES["beds"])
+
+    @field_validator("id", mode="before")
+    @classmethod
+    def _coerce_id(cls, value: Any) -> str:
+        return str(value) if value is not None else ""
+
+    @field_validator("is_mch", "is_group", mode="before")
+    @classmethod
+    def _coerce_flag(cls, value: Any) -> bool:
+        if isinstance(value, str):
+            return value.strip().lower() in ("1", "true", "yes")
+        if isinstance(value, (int, bool)):
+            return bool(value)
+        return False
+
+
+# Validates a whole organized array in one call instead of a model per row
+ServiceUnitRowList = TypeAdapter(list[ServiceUnitRow])
@@ -1,61 +1,120 @@
+import logging
+import os
 import uuid
+from functools import lru_cache
 from typing import Any, Dict, List
 
-from workflow.utils import save_csv_file
+from workflow.utils import OutputFormat, SavedFile, save_csv_file
 
-from .schema import ServiceUnitInput, ServiceUnitRow
+from .schema import ServiceUnitInput, ServiceUnitRow, ServiceUnitRowList
 from .units import units_template
 
-FIELD_KEY_MAP: Dict[str, str] = {
-    "ID": "id",
-    "Service Unit": "service_unit",
-    "Company": "company",
-    "Is Group": "is_group",
-    "Service Unit Type": "service_unit_type",
-    "Is MCH": "is_mch",
-    "Warehouse": "warehouse",
-    "Parent Service Unit": "parent_service_unit",
-    "Service Unit Capacity": "service_unit_capacity",
-    "Service Points": "service_points",
-    "Beds": "beds",
+logger = logging.getLogger(__name__)
+
+MCH_SERVICE_TYPES = ("ANC", "PNC", "CWC", "FP")
+
+BILLING_ITEM_COLUMNS = [
+    f"{prefix} Billing Item"
+    for prefix in [
+        "Initial Visit",
+        "Revisit",
+        "Under 5 Initial Visit",
+        "Under 5 Revisit",
+    ]
+]
+
+EMPTY_SERVICE_POINT_COLUMNS = {
+    "ID (Service Points)": "",
+    "Point Name (Service Points)": "",
+    "Point Type (Service Points)": "",
+    "Service Stage (Service Points)": "",
+    "Service Type (Service Points)": "",
 }
 
 
+@lru_cache(maxsize=4096)
+def classify_point_name(point_name: str, is_mch: bool) -> str:
+    """Service type (ANC, PNC, CWC, FP) of an MCH service point, memoized."""
+    if not is_mch or not point_name:
+        return ""
+    point_name_upper = point_name.strip().upper()
+    for service_type in MCH_SERVICE_TYPES:
+        if point_name_upper.startswith(service_type):
+            return service_type
+    return ""
+
+
+@lru_cache(maxsize=1024)
+def expand_room_points(unit_key: str, count: int) -> str:
+    """
+    Service points of an outpatient unit template with its rooms repeated
+    ``count`` times, e.g. "Consultation Room 1 - 2, Consultation Room 2 - 2".
+    """
+    service_points = units_template["outpatient"][unit_key]["service_points"]
+    if count <= 1 or not service_points:
+        return service_points
+
+    adjusted_points = []
+    for point in (p.strip() for p in service_points.split(",")):
+        point_parts = point.split(" - ")
+        if len(point_parts) == 2:
+            point_name = point_parts[0].strip()
+            stage = point_parts[1].strip()
+
+            # Keep single Triage, multiply consultation/treatment rooms
+            if "triage" in point_name.lower():
+                adjusted_points.append(f"{point_name} - {stage}")
+            else:
+                # Create multiple numbered rooms
+                for i in range(1, count + 1):
+                    adjusted_points.append(f"{point_name} {i} - {stage}")
+        else:
+            adjusted_points.append(point)
+
+    return ", ".join(adjusted_points)
+
+
+def memoization_stats() -> dict[str, dict[str, int]]:
+    """
+    Hit/miss counters of the service-unit memoization caches. The caches are
+    process-wide, so the counts span every job the process has run.
+    """
+    return {
+        cache.__name__: cache.cache_info()._asdict()
+        for cache in (classify_point_name, expand_room_points)
+    }
+
+
 class ServiceUnitService:
-    def __init__(self):
+    def __init__(
+        self,
+        output_format: OutputFormat = OutputFormat.csv,
+        content_addressed: bool = False,
+    ):
+        self.output_format = output_format
+        # Name files by a hash of their content instead of a random UUID
+        self.content_addressed = content_addressed
         self.bed_counter = 1
         self.company_bed_counters: dict[str, int] = {}
+        # Action and row count of every file written, keyed by file name
+        self.outputs: dict[str, dict[str, Any]] = {}
 
-    def _remap_keys(self, su_dict: Dict[str, Any]) -> Dict[str, Any]:
-        mapped: Dict[str, Any] = {
-            FIELD_KEY_MAP.get(k, k): v for k, v in su_dict.items()
+    def _service_point_columns(
+        self,
+        is_mch: bool,
+        sp_id: str = "",
+        point_name: str = "",
+        point_type: str = "",
+        service_stage: str = "",
+    ) -> dict[str, Any]:
+        return {
+            "ID (Service Points)": sp_id,
+            "Point Name (Service Points)": point_name,
+            "Point Type (Service Points)": point_type,
+            "Service Stage (Service Points)": service_stage,
+            "Service Type (Service Points)": classify_point_name(point_name, is_mch),
         }
 
-        if "id" in mapped:
-            mapped["id"] = str(mapped["id"]) if mapped["id"] is not None else ""
-
-        for field in ("is_mch", "is_group"):
-            raw_value = mapped.get(field, False)
-            if isinstance(raw_value, str):
-                mapped[field] = raw_value.strip().lower() in ("1", "true", "yes")
-            elif isinstance(raw_value, (int, bool)):
-                mapped[field] = bool(raw_value)
-            else:
-                mapped[field] = False
-
-        return mapped
-
-    def _extract_service_type_from_point_name(
-        self, point_name: str | None, is_mch: bool
-    ) -> str:
-        if not is_mch or not point_name:
-            return ""
-        point_name_upper = point_name.strip().upper()
-        for service_type in ["ANC", "PNC", "CWC", "FP"]:
-            if point_name_upper.startswith(service_type):
-                return service_type
-        return ""
-
     def generate_service_unit_skeleton(
         self, data_list: list[ServiceUnitInput], folder_name: str
     ) -> str | None:
@@ -86,32 +145,7 @@ class ServiceUnitService:
                         count = (data.outpatient.room_counts or {}).get(name, 1)
 
                         # Adjust service points for the count
-                        service_points = unit["service_points"]
-                        if count > 1 and service_points:
-                            points = [p.strip() for p in service_points.split(",")]
-                            adjusted_points = []
-
-                            for point in points:
-                                point_parts = point.split(" - ")
-                                if len(point_parts) == 2:
-                                    point_name = point_parts[0].strip()
-                                    stage = point_parts[1].strip()
-
-                                    # Keep single Triage, multiply consultation/treatment rooms
-                                    if "triage" in point_name.lower():
-                                        adjusted_points.append(
-                                            f"{point_name} - {stage}"
-                                        )
-                                    else:
-                                        # Create multiple numbered rooms
-                                        for i in range(1, count + 1):
-                                            adjusted_points.append(
-                                                f"{point_name} {i} - {stage}"
-                                            )
-                                else:
-                                    adjusted_points.append(point)
-
-                            service_points = ", ".join(adjusted_points)
+                        service_points = expand_room_points(name, count)
 
                         all_rows.append(
                             {
@@ -226,7 +260,9 @@ class ServiceUnitService:
             return None
 
         filename = f"service_units_skeleton_{uuid.uuid4().hex}.csv"
-        return save_csv_file(folder_name, all_rows, list(all_rows[0].keys()), filename)
+        return save_csv_file(
+            folder_name, all_rows, list(all_rows[0].keys()), filename
+        ).path
 
     def create_parent_service_units(
         self,
@@ -277,6 +313,10 @@ class ServiceUnitService:
         allow_appointments: bool = False,
     ) -> list[dict[str, Any]]:
         result = []
+        inpatient_billing = dict.fromkeys(BILLING_ITEM_COLUMNS)
+        outpatient_billing = dict.fromkeys(
+            BILLING_ITEM_COLUMNS, "General Consultation fee"
+        )
 
         for row in rows_in:
             company_key = row.company or ""
@@ -293,16 +333,7 @@ class ServiceUnitService:
             is_inpatient = (
                 row.service_unit_type and "inpatient" in row.service_unit_type.lower()
             )
-            billing_value = None if is_inpatient else "General Consultation fee"
-            billing_defaults = {
-                f"{prefix} Billing Item": billing_value
-                for prefix in [
-                    "Initial Visit",
-                    "Revisit",
-                    "Under 5 Initial Visit",
-                    "Under 5 Revisit",
-                ]
-            }
+            billing_defaults = inpatient_billing if is_inpatient else outpatient_billing
 
             # Base unit data
             base_data = {
@@ -322,28 +353,16 @@ class ServiceUnitService:
                 "Inpatient Occupancy": 0,
             }
 
-            # Service point builder
-            def build_sp_data(sp_id="", point_name="", point_type="", service_stage=""):
-                return {
-                    "ID (Service Points)": sp_id,
-                    "Point Name (Service Points)": point_name,
-                    "Point Type (Service Points)": point_type,
-                    "Service Stage (Service Points)": service_stage,
-                    "Service Type (Service Points)": self._extract_service_type_from_point_name(
-                        point_name, row.is_mch
-                    ),
-                }
-
             # Handle service points
             if row.service_points:
+                blank_unit = dict.fromkeys(base_data, "")
                 for i, sp in enumerate(row.service_points):
-                    unit_data = (
-                        base_data if i == 0 else {k: "" for k in base_data.keys()}
-                    )
+                    unit_data = base_data if i == 0 else blank_unit
                     result.append(
                         {
                             **unit_data,
-                            **build_sp_data(
+                            **self._service_point_columns(
+                                row.is_mch,
                                 sp.id or "",
                                 sp.point_name or "",
                                 sp.point_type or "",
@@ -355,7 +374,8 @@ class ServiceUnitService:
                 result.append(
                     {
                         **base_data,
-                        **build_sp_data(
+                        **self._service_point_columns(
+                            row.is_mch,
                             row.id_service_points or "",
                             row.point_name_service_points or "",
                             row.point_type_service_points or "",
@@ -385,14 +405,14 @@ class ServiceUnitService:
                             "Company": row.company,
                             "Is Group": 0,
                             "Service Unit Type": "Inpatient Service Unit",
-                            **{k: None for k in billing_defaults.keys()},
+                            **inpatient_billing,
                             "Allow Appointments": 0,
                             "Is MCH": 0,
                             "Warehouse": row.warehouse or "",
                             "Parent Service Unit": f"{row.service_unit} - {warehouse_suffix}",
                             "Service Unit Capacity": 0,
                             "Inpatient Occupancy": 1,
-                            **build_sp_data(),
+                            **EMPTY_SERVICE_POINT_COLUMNS,
                         }
                     )
                     self.bed_counter += 1
@@ -412,14 +432,11 @@ class ServiceUnitService:
         filter_groups: bool = False,
         allow_appointments: bool = False,
     ) -> list:
-        from workflow.service_units.schema import ServiceUnitRow
-
         units = organized_data.get(unit_key, [])
         if not units:
             return []
 
-        remapped = [self._remap_keys(row) for row in units]
-        models = [ServiceUnitRow(**row) for row in remapped]
+        models = ServiceUnitRowList.validate_python(units)
         rows = self.generate_service_units(
             models, allow_appointments=allow_appointments
         )
@@ -443,7 +460,35 @@ class ServiceUnitService:
                 inpatient=True,
                 allow_appointments=allow_appointments,
             )
-            rows.extend(parent_rows)
+            rows = self._concat_rows([rows, parent_rows])
+        return rows
+
+    def _concat_rows(self, parts: list) -> list:
+        # Overridden by the DataFrame engine, where rows are frames
+        return [row for part in parts for row in part]
+
+    def _write_rows(self, folder_name: str, rows: list, filename: str) -> SavedFile:
+        return save_csv_file(
+            folder_name,
+            rows,
+            list(rows[0].keys()),
+            filename,
+            self.output_format,
+            self.content_addressed,
+        )
+
+    def _save_rows(self, folder_name: str, rows: list, filename: str) -> str:
+        """Write rows in the configured output format and return the file name."""
+        saved = self._write_rows(folder_name, rows, filename)
+        name = os.path.basename(saved.path)
+        # Names are "<action>_<uuid>.csv"
+        self.outputs[name] = {
+            "action": filename.rsplit("_", 1)[0],
+            "rows": len(rows),
+            "bytes": saved.bytes,
+            "sha256": saved.sha256,
+        }
+        return name
 
     def process_all_unit_types(
         self, organized_data: dict, folder_name: str
@@ -453,37 +498,35 @@ class ServiceUnitService:
         parent_units = organized_data.get("parent_service_units", [])
         if parent_units:
             parent_rows = self.create_parent_service_units(parent_units, is_parent=True)
-            print("parent_rows", parent_rows)
+            logger.debug("parent_rows %s", parent_rows)
             filename = f"parent_service_units_{uuid.uuid4()}.csv"
-            file_path = save_csv_file(
-                folder_name, parent_rows, list(parent_rows[0].keys()), filename
-            )
-            print("parent_file_path ", file_path)
-            generated_files.append(filename)
+            generated_files.append(self._save_rows(folder_name, parent_rows, filename))
+            print("parent_file ", generated_files[-1])
 
         # 2. Outpatient units with parents
         outpatient_rows = self.process_units(
             organized_data, "outpatient_units", allow_appointments=True
         )
-        if outpatient_rows:
-            self.add_parent_units(outpatient_rows, organized_data, "inpatient_parent")
-            self.add_parent_units(
+        if len(outpatient_rows):
+            outpatient_rows = self.add_parent_units(
+                outpatient_rows, organized_data, "inpatient_parent"
+            )
+            outpatient_rows = self.add_parent_units(
                 outpatient_rows, organized_data, "maternity_ward_parent"
             )
-            print("out_patient_rows", outpatient_rows)
+            logger.debug("out_patient_rows %s", outpatient_rows)
             filename = f"outpatient_service_units_{uuid.uuid4()}.csv"
-            save_csv_file(
-                folder_name, outpatient_rows, list(outpatient_rows[0].keys()), filename
+            generated_files.append(
+                self._save_rows(folder_name, outpatient_rows, filename)
             )
-            generated_files.append(filename)
         else:
             # No outpatient units, but we might still have outpatient-related parents
-            parent_rows: list[dict[str, Any]] = []
+            parent_parts = []
 
             # Inpatient parents that are meant to parent outpatient units
             inpatient_parent_data = organized_data.get("inpatient_parent", [])
             if inpatient_parent_data:
-                parent_rows.extend(
+                parent_parts.append(
                     self.create_parent_service_units(
                         inpatient_parent_data,
                         is_parent=True,
@@ -495,7 +538,7 @@ class ServiceUnitService:
             # Maternity ward parents that can exist even without outpatient units
             maternity_ward_parent_data = organized_data.get("maternity_ward_parent", [])
             if maternity_ward_parent_data:
-                parent_rows.extend(
+                parent_parts.append(
                     self.create_parent_service_units(
                         maternity_ward_parent_data,
                         is_parent=True,
@@ -504,28 +547,27 @@ class ServiceUnitService:
                     )
                 )
 
-            if parent_rows:
-                print("outpatient_parent_rows", parent_rows)
+            parent_rows = self._concat_rows(parent_parts)
+            if len(parent_rows):
+                logger.debug("outpatient_parent_rows %s", parent_rows)
                 filename = f"outpatient_parents_{uuid.uuid4()}.csv"
-                save_csv_file(
-                    folder_name, parent_rows, list(parent_rows[0].keys()), filename
+                generated_files.append(
+                    self._save_rows(folder_name, parent_rows, filename)
                 )
-                generated_files.append(filename)
 
         # 3. Inpatient units with maternity parents
         inpatient_rows = self.process_units(
             organized_data, "inpatient_units", filter_groups=True
         )
-        if inpatient_rows:
-            self.add_parent_units(
+        if len(inpatient_rows):
+            inpatient_rows = self.add_parent_units(
                 inpatient_rows, organized_data, "maternity_parent", True
             )
-            print("in_patient_rows", inpatient_rows)
+            logger.debug("in_patient_rows %s", inpatient_rows)
             filename = f"inpatient_service_units_{uuid.uuid4()}.csv"
-            save_csv_file(
-                folder_name, inpatient_rows, list(inpatient_rows[0].keys()), filename
+            generated_files.append(
+                self._save_rows(folder_name, inpatient_rows, filename)
             )
-            generated_files.append(filename)
         else:
             # No inpatient units, but maternity parents can still exist independently
             maternity_parent_data = organized_data.get("maternity_parent", [])
@@ -536,26 +578,21 @@ class ServiceUnitService:
                     inpatient=True,
                     allow_appointments=True,
                 )
-                print("maternity_parent_rows", maternity_parent_rows)
+                logger.debug("maternity_parent_rows %s", maternity_parent_rows)
                 filename = f"maternity_parents_{uuid.uuid4()}.csv"
-                save_csv_file(
-                    folder_name,
-                    maternity_parent_rows,
-                    list(maternity_parent_rows[0].keys()),
-                    filename,
+                generated_files.append(
+                    self._save_rows(folder_name, maternity_parent_rows, filename)
                 )
-                generated_files.append(filename)
 
         # 4. Maternity wards
         maternity_rows = self.process_units(
             organized_data, "maternity_wards", filter_groups=True
         )
-        if maternity_rows:
-            print("maternity_wards", maternity_rows)
+        if len(maternity_rows):
+            logger.debug("maternity_wards %s", maternity_rows)
             filename = f"maternity_service_units_{uuid.uuid4()}.csv"
-            save_csv_file(
-                folder_name, maternity_rows, list(maternity_rows[0].keys()), filename
+            generated_files.append(
+                self._save_rows(folder_name, maternity_rows, filename)
             )
-            generated_files.append(filename)
 
         return generated_files
@@ -0,0 +1,344 @@
+import asyncio
+import functools
+import hashlib
+import os
+import re
+import shutil
+import threading
+import uuid
+from collections.abc import Callable
+from typing import Any
+
+from workflow.lazy import boto3_transfer
+from workflow.utils import output_content_headers
+
+# Outputs below this size are uploaded with one PUT (upload_file's own
+# multipart threshold); larger ones go through upload_file
+SINGLE_PUT_MAX_BYTES = 8 * 1024 * 1024
+
+
+@functools.cache
+def download_transfer_config():
+    # Large workbooks are fetched as parallel ranged GETs of this size. Built on
+    # first use so importing this module doesn't pull in boto3.
+    return boto3_transfer.TransferConfig(
+        multipart_threshold=8 * 1024 * 1024,
+        multipart_chunksize=8 * 1024 * 1024,
+        max_concurrency=8,
+    )
+
+
+class _KnownObject:
+    """
+    Transfer subscriber that hands s3transfer the size and ETag from our own
+    HEAD, so it skips its HEAD and sends IfMatch with every ranged GET.
+    """
+
+    def __init__(self, head: dict):
+        self.head = head
+
+    def on_queued(self, future, **kwargs):
+        future.meta.provide_transfer_size(self.head["ContentLength"])
+        future.meta.provide_object_etag(self.head["ETag"])
+
+
+class DownloadCache:
+    """
+    Content-addressed cache of S3 downloads keyed by the object's ETag.
+
+    Each fetch costs one HEAD request; the object itself is only transferred
+    when no cached copy with the current ETag exists, and then with IfMatch on
+    that ETag, so bytes of a newer version are never cached under an old one.
+    Least recently used entries are evicted once the cache grows past
+    ``max_bytes``.
+    """
+
+    def __init__(self, s3_client: Any, cache_dir: str, max_bytes: int):
+        self.s3_client = s3_client
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def _entry_path(self, etag: str) -> str:
+        return os.path.join(self.cache_dir, re.sub(r"[^0-9A-Za-z-]", "", etag))
+
+    def _download(self, bucket: str, key: str, dest_path: str, head: dict):
+        """Download the object version ``head`` describes, or fail with 412."""
+        config = download_transfer_config()
+        if head["ContentLength"] < config.multipart_threshold:
+            # s3transfer only sends IfMatch on ranged GETs, so fetch small
+            # objects directly
+            response = self.s3_client.get_object(
+                Bucket=bucket, Key=key, IfMatch=head["ETag"]
+            )
+            with open(dest_path, "wb") as f:
+                shutil.copyfileobj(response["Body"], f)
+            return
+
+        with boto3_transfer.create_transfer_manager(self.s3_client, config) as manager:
+            manager.download(
+                bucket, key, dest_path, subscribers=[_KnownObject(head)]
+            ).result()
+
+    @staticmethod
+    def _is_changed_error(error: Exception) -> bool:
+        # A 412 from get_object; s3transfer rewraps it as S3DownloadFailedError
+        response = getattr(error, "response", None) or {}
+        return response.get("Error", {}).get("Code") in (
+            "412",
+            "PreconditionFailed",
+        ) or "did not match expected ETag" in str(error)
+
+    def fetch(self, bucket: str, key: str, dest_path: str) -> bool:
+        """Download ``key`` to ``dest_path``; returns True on a cache hit."""
+        if self.max_bytes <= 0:
+            self.s3_client.download_file(
+                bucket, key, dest_path, Config=download_transfer_config()
+            )
+            return False
+
+        for attempt in range(2):
+            head = self.s3_client.head_object(Bucket=bucket, Key=key)
+            entry_path = self._entry_path(head["ETag"])
+
+            if os.path.exists(entry_path):
+                self.hits += 1
+                os.utime(entry_path)  # mark as recently used
+                shutil.copyfile(entry_path, dest_path)
+                return True
+
+            try:
+                self._download(bucket, key, dest_path, head)
+                break
+            except Exception as e:
+                # Replaced between the HEAD and the GET: look it up again
+                if attempt or not self._is_changed_error(e):
+                    raise
+
+        self.misses += 1
+        if head["ContentLength"] <= self.max_bytes:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{entry_path}.{uuid.uuid4().hex}.tmp"
+            shutil.copyfile(dest_path, tmp_path)
+            os.replace(tmp_path, entry_path)
+            self._evict()
+        return False
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith(".tmp") or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+class Uploads(dict):
+    """
+    ETags of the files one ``upload`` call delivered, by file name, plus the
+    names whose upload was skipped because the stored object already matched.
+    """
+
+    def __init__(self, etags: dict[str, str], skipped: set[str]):
+        super().__init__(etags)
+        self.skipped = skipped
+
+
+class UploadCounter:
+    """Lifetime upload counts of a storage backend, safe across worker threads."""
+
+    def __init__(self):
+        self.uploads = 0
+        self.uploads_skipped = 0
+        self._counter_lock = threading.Lock()
+
+    def _count_upload(self, skipped: bool):
+        with self._counter_lock:
+            if skipped:
+                self.uploads_skipped += 1
+            else:
+                self.uploads += 1
+
+
+class S3Storage(UploadCounter):
+    """Reads job inputs from and uploads generated files to an S3 bucket."""
+
+    def __init__(
+        self,
+        s3_client: Any,
+        bucket: str,
+        download_cache: DownloadCache | None = None,
+        on_cache_miss: Callable[[], None] | None = None,
+    ):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.download_cache = download_cache
+        # Called after a download is added to the cache (Modal volume commit)
+        self.on_cache_miss = on_cache_miss
+        super().__init__()
+
+    def _head(self, key: str) -> dict | None:
+        try:
+            return self.s3_client.head_object(Bucket=self.bucket, Key=key)
+        except self.s3_client.exceptions.ClientError as e:
+            # Without s3:ListBucket, S3 answers a HEAD for a missing key with
+            # 403 rather than 404; either way there is nothing to reuse
+            if e.response.get("Error", {}).get("Code") in (
+                "403",
+                "404",
+                "AccessDenied",
+                "Forbidden",
+                "NoSuchKey",
+            ):
+                return None
+            raise
+
+    def _upload_file(
+        self, file: str, base_dir: str, folder_name: str, sha256: str | None = None
+    ) -> tuple[str, bool]:
+        """Upload one file; returns its ETag and whether the upload was skipped."""
+        key = f"{folder_name}/{file}"
+        extra_args = output_content_headers(file)
+        if sha256:
+            # An object already holding this content costs one HEAD, not a PUT
+            head = self._head(key)
+            if head and head.get("Metadata", {}).get("sha256") == sha256:
+                self._count_upload(skipped=True)
+                return head["ETag"].strip('"'), True
+            extra_args = {**extra_args, "Metadata": {"sha256": sha256}}
+
+        path = f"{base_dir}/{file}"
+        if os.path.getsize(path) < SINGLE_PUT_MAX_BYTES:
+            # A plain PUT returns the ETag, so no HEAD is needed to read it
+            with open(path, "rb") as f:
+                response = self.s3_client.put_object(
+                    Bucket=self.bucket, Key=key, Body=f, **extra_args
+                )
+            etag = response["ETag"]
+        else:
+            self.s3_client.upload_file(path, self.bucket, key, ExtraArgs=extra_args)
+            # upload_file doesn't surface the ETag of a multipart upload, so
+            # large outputs pay one HEAD to read it back
+            etag = self.s3_client.head_object(Bucket=self.bucket, Key=key)["ETag"]
+        self._count_upload(skipped=False)
+        return etag.strip('"'), False
+
+    async def upload(
+        self,
+        files: list[str],
+        base_dir: str,
+        folder_name: str,
+        checksums: dict[str, str] | None = None,
+    ) -> Uploads:
+        """
+        Upload files concurrently; returns each file's ETag. Files with a
+        SHA-256 in ``checksums`` are skipped when the object already has it.
+        """
+        checksums = checksums or {}
+        results = await asyncio.gather(
+            *(
+                asyncio.to_thread(
+                    self._upload_file, file, base_dir, folder_name, checksums.get(file)
+                )
+                for file in files
+            )
+        )
+        return _uploads(files, results)
+
+    async def download(self, file_name: str, base_dir: str, folder_name: str) -> str:
+        s3_key = f"{folder_name}/{file_name}"
+        file_path = f"{base_dir}/{file_name}"
+        if self.download_cache is None:
+            await asyncio.to_thread(
+                self.s3_client.download_file,
+                self.bucket,
+                s3_key,
+                file_path,
+                Config=download_transfer_config(),
+            )
+            return file_path
+
+        cache_hit = await asyncio.to_thread(
+            self.download_cache.fetch, self.bucket, s3_key, file_path
+        )
+        print(f"Download cache {'hit' if cache_hit else 'miss'} for {s3_key}")
+        if not cache_hit and self.download_cache.max_bytes > 0 and self.on_cache_miss:
+            await asyncio.to_thread(self.on_cache_miss)
+
+        return file_path
+
+
+def _uploads(files: list[str], results: list[tuple[str, bool]]) -> Uploads:
+    return Uploads(
+        {file: etag for file, (etag, _) in zip(files, results)},
+        {file for file, (_, skipped) in zip(files, results) if skipped},
+    )
+
+
+class LocalStorage(UploadCounter):
+    """
+    Directory-backed stand-in for S3: ``<root>/<folder>/<file>`` plays the part
+    of the object key, for inputs and generated files alike.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        super().__init__()
+
+    def _copy_file(
+        self, source: str, dest: str, sha256: str | None = None
+    ) -> tuple[str, bool]:
+        if sha256 and os.path.exists(dest):
+            with open(dest, "rb") as f:
+                if hashlib.file_digest(f, "sha256").hexdigest() == sha256:
+                    self._count_upload(skipped=True)
+                    f.seek(0)
+                    return hashlib.file_digest(f, "md5").hexdigest(), True
+
+        shutil.copyfile(source, dest)
+        self._count_upload(skipped=False)
+        # Single-part S3 ETags are the MD5 of the content
+        with open(dest, "rb") as f:
+            return hashlib.file_digest(f, "md5").hexdigest(), False
+
+    async def upload(
+        self,
+        files: list[str],
+        base_dir: str,
+        folder_name: str,
+        checksums: dict[str, str] | None = None,
+    ) -> Uploads:
+        checksums = checksums or {}
+        dest_dir = os.path.join(self.root, folder_name)
+        await asyncio.to_thread(os.makedirs, dest_dir, exist_ok=True)
+        results = await asyncio.gather(
+            *(
+                asyncio.to_thread(
+                    self._copy_file,
+                    os.path.join(base_dir, file),
+                    os.path.join(dest_dir, file),
+                    checksums.get(file),
+                )
+                for file in files
+            )
+        )
+        return _uploads(files, results)
+
+    async def download(self, file_name: str, base_dir: str, folder_name: str) -> str:
+        file_path = os.path.join(base_dir, file_name)
+        await asyncio.to_thread(
+            shutil.copyfile, os.path.join(self.root, folder_name, file_name), file_path
+        )
+        return file_path
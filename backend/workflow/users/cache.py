@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any
+
+from workflow.serialization import dump_file, load_file
+
+
+def row_index_of(record: dict[str, Any]) -> int:
+    """Sort key for validation results; rows without a usable index go last."""
+    try:
+        return int(record.get("row_index"))
+    except (TypeError, ValueError):
+        return 2**31
+
+
+def validation_fingerprint(*models: str | None) -> str:
+    """
+    Short hash of the validation prompt and the models that may answer it.
+    Results cached under one fingerprint are never served under another, so
+    changing the prompt or the model starts a fresh cache.
+    """
+    from workflow.users.prompt import VALIDATE_USERS_PROMPT
+
+    digest = hashlib.sha256(VALIDATE_USERS_PROMPT.encode("utf-8"))
+    for model in models:
+        digest.update(b"\0" + (model or "").encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class ValidationCache:
+    """
+    LRU cache of validation results keyed by a hash of the normalized raw row.
+
+    Entries hold either the validated user record or its error, without the
+    row_index, so a resubmitted sheet can reuse them at whatever position the
+    unchanged row now sits. The cache is shared by all requests in a container
+    and persisted (on the Modal volume in production) as a directory of JSON
+    segments. Each save writes only the entries added since the previous one,
+    to a new segment with a unique name, so containers sharing the directory
+    never overwrite each other's results. Once more than ``max_segments`` have
+    piled up, the ones this container has seen are compacted into one.
+
+    With a ``fingerprint`` (see ``validation_fingerprint``) the segments live
+    in a subdirectory named after it. Subdirectories of other fingerprints
+    that haven't been written to for ``stale_after`` seconds are removed.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 50_000,
+        max_segments: int = 64,
+        fingerprint: str = "",
+        stale_after: float = 7 * 24 * 3600,
+    ):
+        self.root = path
+        self.path = os.path.join(path, fingerprint) if fingerprint else path
+        self.stale_after = stale_after
+        self.max_entries = max_entries
+        self.max_segments = max_segments
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, dict[str, Any]] | None = None
+        # Keys added since the last save
+        self._dirty: set[str] = set()
+        # Segment files whose entries are in memory
+        self._segments: list[str] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def row_key(header: list[str], row: list[str]) -> str:
+        normalized = {
+            re.sub(r"\s+", " ", name.strip().lower()): re.sub(
+                r"\s+", " ", value.strip()
+            )
+            for name, value in zip(header, row)
+        }
+        digest = hashlib.sha256(
+            json.dumps(normalized, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        )
+        return digest.hexdigest()
+
+    def _prune_stale(self):
+        if self.path == self.root:
+            return
+        try:
+            siblings = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return
+        cutoff = time.time() - self.stale_after
+        for sibling in siblings:
+            if (
+                sibling.is_dir()
+                and sibling.path != self.path
+                and sibling.stat().st_mtime < cutoff
+            ):
+                # Results of a previous prompt or model
+                shutil.rmtree(sibling.path, ignore_errors=True)
+
+    def _load(self) -> OrderedDict[str, dict[str, Any]]:
+        if self._entries is None:
+            self._prune_stale()
+            self._entries = OrderedDict()
+            try:
+                # Segment names start with their write time, oldest first
+                names = sorted(n for n in os.listdir(self.path) if n.endswith(".json"))
+            except FileNotFoundError:
+                names = []
+            for name in names:
+                try:
+                    segment = load_file(os.path.join(self.path, name))
+                except FileNotFoundError:
+                    # Compacted away by another container meanwhile
+                    continue
+                except (OSError, json.JSONDecodeError) as e:
+                    print(f"Ignoring unreadable validation cache segment {name}: {e}")
+                    continue
+                for key, entry in segment.items():
+                    self._entries[key] = entry
+                    self._entries.move_to_end(key)
+                self._segments.append(name)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return self._entries
+
+    def preload(self) -> int:
+        """Read the persisted entries now instead of on the first lookup."""
+        with self._lock:
+            return len(self._load())
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        with self._lock:
+            entries = self._load()
+            entry = entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, kind: str, record: dict[str, Any]):
+        """Store a "valid" or "error" result for a row (row_index is dropped)."""
+        with self._lock:
+            entries = self._load()
+            entries[key] = {
+                "kind": kind,
+                "record": {k: v for k, v in record.items() if k != "row_index"},
+            }
+            entries.move_to_end(key)
+            self._dirty.add(key)
+            while len(entries) > self.max_entries:
+                evicted, _ = entries.popitem(last=False)
+                self._dirty.discard(evicted)
+
+    def save(self):
+        with self._lock:
+            if self._entries is None or not self._dirty:
+                return
+            os.makedirs(self.path, exist_ok=True)
+            compact = len(self._segments) >= self.max_segments
+            if compact:
+                segment = self._entries
+            else:
+                segment = {key: self._entries[key] for key in self._dirty}
+
+            name = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.json"
+            tmp_path = os.path.join(self.path, f"{name}.tmp")
+            dump_file(segment, tmp_path)
+            os.replace(tmp_path, os.path.join(self.path, name))
+            self._dirty.clear()
+
+            if compact:
+                # Only segments this container read or wrote; their entries
+                # are all in the new one
+                for old in self._segments:
+                    try:
+                        os.remove(os.path.join(self.path, old))
+                    except FileNotFoundError:
+                        pass
+                self._segments = []
+            self._segments.append(name)
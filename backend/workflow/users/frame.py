@@ -0,0 +1,374 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from workflow.utils import SavedFile, save_frame_file
+
+from .repository import (
+    PRACTITIONER_COLUMNS,
+    PRACTITIONER_CONTINUATION_ROW,
+    PRACTITIONER_SERVICE_UNIT,
+)
+from .service import UserService
+
+# Fields read from each validated user, with the defaults UserService uses
+# when the model leaves one out
+USER_FIELDS: dict[str, object] = {
+    "email": "",
+    "first_name": "",
+    "phone_number": "",
+    "role": "",
+    "company": "",
+    "warehouses": [],
+    "gender": "Unknown",
+    "status": "Active",
+    "national_id": "",
+    "hwr_id": None,
+    "service_units": [],
+    "department": "",
+}
+
+# Output columns per action, as the repository's row dicts order them
+ACTION_COLUMNS = {
+    "create_user": [
+        "ID",
+        "Email",
+        "First Name",
+        "Mobile No",
+        "Set New Password",
+        "Username",
+        "Role Profile",
+    ],
+    "create_employee": [
+        "ID",
+        "Series",
+        "First Name",
+        "Gender",
+        "Date of Birth",
+        "Date of Joining",
+        "Status",
+        "Company",
+        "User ID",
+    ],
+    "create_healthcare_practitioner": PRACTITIONER_COLUMNS,
+    "create_user_permission": ["ID", "User", "Allow", "For Value", "Is Default"],
+    "create_user_warehouse": ["ID", "User", "Warehouse", "Company"],
+}
+
+# Practitioner columns filled from the user on their first row
+PRACTITIONER_FIELDS = {
+    "ID": "national_id",
+    "First Name": "first_name",
+    "Status": "status",
+    "National ID": "national_id",
+    "HWR Id": "hwr_id",
+    "User": "email",
+    "Medical Department": "department",
+}
+
+
+def _is_str(column: pd.Series) -> np.ndarray:
+    return column.map(lambda value: isinstance(value, str)).to_numpy(dtype=bool)
+
+
+def _is_str_list(column: pd.Series) -> np.ndarray:
+    is_list = column.map(lambda value: isinstance(value, list)).to_numpy(dtype=bool)
+    items = list(itertools.chain.from_iterable(column[is_list]))
+    # Usually every item is a string, which one typed pass over all of them shows
+    if pd.api.types.infer_dtype(items, skipna=False) in ("string", "empty"):
+        return is_list
+    return column.map(
+        lambda value: (
+            isinstance(value, list) and all(isinstance(item, str) for item in value)
+        )
+    ).to_numpy(dtype=bool)
+
+
+def users_frame(valid_users: list[dict]) -> pd.DataFrame:
+    """One row per validated user, one object column per ``USER_FIELDS`` key."""
+    users = pd.DataFrame(valid_users, columns=list(USER_FIELDS), dtype=object)
+    for field, default in USER_FIELDS.items():
+        values = users[field].to_numpy(copy=True)
+        # Keys absent from a user's dict come out as NaN, an explicit null as None
+        for position in np.flatnonzero(pd.isna(values) & np.not_equal(values, None)):
+            values[position] = default
+        users[field] = values
+    # "warehouses": null reads as no warehouses
+    users["warehouses"] = users["warehouses"].map(lambda value: value or [])
+    return users.reset_index(drop=True)
+
+
+def explode_practitioners(users: pd.DataFrame) -> dict[str, np.ndarray]:
+    """
+    Healthcare practitioner rows for ``users``, one per service unit, built in
+    one step for every facility: a user's first row takes their details per
+    ``PRACTITIONER_FIELDS``, the rest are ``PRACTITIONER_CONTINUATION_ROW``
+    with only the service unit set.
+    """
+    counts = users["service_units"].map(len).to_numpy(dtype=int)
+    owner = np.repeat(np.arange(len(users)), counts)
+    first = np.zeros(len(owner), dtype=bool)
+    first[(np.cumsum(counts) - counts)[counts > 0]] = True
+
+    columns = {
+        column: np.where(
+            first,
+            users[field].to_numpy(dtype=object)[owner],
+            PRACTITIONER_CONTINUATION_ROW.get(column),
+        )
+        for column, field in PRACTITIONER_FIELDS.items()
+    }
+    columns[PRACTITIONER_SERVICE_UNIT] = np.fromiter(
+        itertools.chain.from_iterable(users["service_units"]),
+        dtype=object,
+        count=len(owner),
+    )
+    for column in ("_user", "_company"):
+        columns[column] = users[column].to_numpy(dtype=object)[owner]
+    return columns
+
+
+def pack_parts(sizes: np.ndarray, limit: int) -> np.ndarray:
+    """
+    Part number of each user, filling parts of at most ``limit`` rows in order
+    without splitting a user's rows (a user larger than ``limit`` gets a part
+    of their own).
+    """
+    parts = np.zeros(len(sizes), dtype=int)
+    part = filled = 0
+    for position, size in enumerate(sizes):
+        if limit > 0 and filled and filled + size > limit:
+            part += 1
+            filled = 0
+        parts[position] = part
+        filled += size
+    return parts
+
+
+class FrameUserService(UserService):
+    """
+    ``UserService`` with the action rows built column-wise on one DataFrame of
+    the validated users: company metadata comes from a ``groupby``, the role
+    rules are boolean masks and multi-row actions are exploded. Users whose
+    fields would fail an action's row schema are left out of that action, as
+    the row engine does, and the files written are byte-identical.
+
+    Each action frame carries the user's position (``_user``) and company
+    (``_company``) so sharding can keep a user's rows together.
+    """
+
+    def _build_company_index(self, valid_users: list[dict]) -> pd.DataFrame:
+        """The users, with their company's password and role flag as columns."""
+        users = users_frame(valid_users)
+        named = users["company"].map(bool).to_numpy(dtype=bool)
+        users["_company"] = users["company"].where(named, "")
+        users["_user"] = np.arange(len(users))
+
+        users["_specialized"] = users["role"].isin(self.SPECIALIZED_ROLES)
+        users["_has_specialized_roles"] = (
+            (users["_specialized"] & named).groupby(users["_company"]).transform("any")
+        ) & named
+
+        codes, companies = pd.factorize(users["_company"])
+        passwords = np.array(
+            [self._company_password(company) for company in companies] + [""],
+            dtype=object,
+        )
+        users["_password"] = passwords[codes]
+        return users
+
+    def _create_user_rows(self, users: pd.DataFrame) -> dict:
+        users = users[
+            _is_str(users["email"])
+            & _is_str(users["first_name"])
+            & _is_str(users["role"])
+        ]
+        return {
+            "ID": "",
+            "Email": users["email"],
+            "First Name": users["first_name"],
+            "Mobile No": users["phone_number"].map(str),
+            "Set New Password": users["_password"],
+            "Username": users["email"],
+            "Role Profile": users["role"],
+            "_user": users["_user"],
+            "_company": users["_company"],
+        }
+
+    def _create_employee_rows(self, users: pd.DataFrame) -> dict:
+        # With specialized roles in the company only they get employee records
+        eligible = ~users["_has_specialized_roles"] | users["_specialized"]
+        valid = (
+            _is_str(users["first_name"])
+            & _is_str(users["gender"])
+            & _is_str(users["status"])
+            & _is_str(users["company"])
+            & _is_str(users["email"])
+        )
+        users = users[eligible.to_numpy(dtype=bool) & valid]
+        return {
+            "ID": "",
+            "Series": "",
+            "First Name": users["first_name"],
+            "Gender": users["gender"],
+            "Date of Birth": "1998-01-01",
+            "Date of Joining": "2023-01-01",
+            "Status": "Active",
+            "Company": users["company"],
+            "User ID": users["email"],
+            "_user": users["_user"],
+            "_company": users["_company"],
+        }
+
+    def _create_healthcare_practitioner_rows(self, users: pd.DataFrame) -> dict:
+        # Everyone except the specialized roles, where the company has them
+        eligible = ~users["_has_specialized_roles"] | ~users["_specialized"]
+        hwr_id = users["hwr_id"]
+        valid = (
+            _is_str(users["national_id"])
+            & _is_str(users["first_name"])
+            & _is_str(users["status"])
+            & _is_str(users["email"])
+            & _is_str(users["department"])
+            & (_is_str(hwr_id) | hwr_id.isna().to_numpy(dtype=bool))
+            & _is_str_list(users["service_units"])
+        )
+        users = users[eligible.to_numpy(dtype=bool) & valid]
+        # Filled after filtering, so an empty selection stays empty
+        hwr_id = users["hwr_id"]
+        return explode_practitioners(
+            users.assign(hwr_id=hwr_id.where(hwr_id.notna(), ""))
+        )
+
+    def _create_user_permission_rows(self, users: pd.DataFrame) -> dict:
+        # The row engine iterates whatever "warehouses" holds, so a string
+        # grants its characters and an object its keys
+        users = users.assign(
+            warehouses=users["warehouses"].map(
+                lambda value: list(value) if isinstance(value, (str, dict)) else value
+            )
+        )
+        valid = _is_str(users["email"]) & _is_str_list(users["warehouses"])
+        users = users[valid]
+
+        # The company permission first, then one per warehouse in list order
+        company_rows = users[users["_company"] != ""]
+        warehouse_rows = users.explode("warehouses").dropna(subset=["warehouses"])
+        warehouse = warehouse_rows["warehouses"]
+        rows = pd.DataFrame(
+            {
+                "User": pd.concat([company_rows["email"], warehouse_rows["email"]]),
+                "Allow": ["Company"] * len(company_rows)
+                + ["Warehouse"] * len(warehouse_rows),
+                "For Value": pd.concat([company_rows["company"], warehouse]),
+                # Main Pharmacy is always default (1), All Warehouses is always 0
+                "Is Default": [1] * len(company_rows)
+                + warehouse.str.startswith("Main").astype(int).tolist(),
+                "_user": pd.concat([company_rows["_user"], warehouse_rows["_user"]]),
+                "_order": np.concatenate(
+                    [
+                        np.full(len(company_rows), -1),
+                        warehouse_rows.groupby(level=0).cumcount().to_numpy(),
+                    ]
+                ),
+                "_company": pd.concat(
+                    [company_rows["_company"], warehouse_rows["_company"]]
+                ),
+            },
+        )
+        rows = rows.iloc[np.lexsort((rows["_order"], rows["_user"]))]
+        return {"ID": "", **{column: rows[column] for column in rows}}
+
+    def _create_user_warehouse_rows(self, users: pd.DataFrame) -> dict:
+        # Access to the first listed warehouse, for the same users as employees
+        eligible = ~users["_has_specialized_roles"] | users["_specialized"]
+        users = users.assign(
+            _warehouse=users["warehouses"].map(
+                lambda warehouses: warehouses[0] if warehouses else ""
+            )
+        )
+        valid = (
+            _is_str(users["email"])
+            & _is_str(users["_warehouse"])
+            & _is_str(users["company"])
+        )
+        selected = eligible.to_numpy(dtype=bool) & users["_warehouse"].map(
+            bool
+        ).to_numpy(dtype=bool)
+        users = users[selected & valid]
+        return {
+            "ID": "",
+            "User": users["email"],
+            "Warehouse": users["_warehouse"],
+            "Company": users["company"],
+            "_user": users["_user"],
+            "_company": users["_company"],
+        }
+
+    def _generate_action_rows(
+        self,
+        action_type: str,
+        valid_users: list[dict],
+        company_index: pd.DataFrame,
+    ) -> tuple[list[str], pd.DataFrame]:
+        builders = {
+            "create_user": self._create_user_rows,
+            "create_employee": self._create_employee_rows,
+            "create_healthcare_practitioner": self._create_healthcare_practitioner_rows,
+            "create_user_permission": self._create_user_permission_rows,
+            "create_user_warehouse": self._create_user_warehouse_rows,
+        }
+        headers = ACTION_COLUMNS[action_type]
+        columns = builders[action_type](company_index)
+        # Scalars broadcast over the rows; an empty action yields an empty frame
+        index = pd.RangeIndex(len(columns["_user"]))
+        rows = pd.DataFrame(
+            {
+                column: (
+                    values if np.ndim(values) == 0 else np.asarray(values, dtype=object)
+                )
+                for column, values in columns.items()
+                if column in headers or column in ("_user", "_company")
+            },
+            index=index,
+            dtype=object,
+        )
+        return headers, rows[[*headers, "_user", "_company"]]
+
+    def _shard_rows(
+        self, user_rows: pd.DataFrame
+    ) -> list[tuple[dict | None, pd.DataFrame]]:
+        columns = [column for column in user_rows if not column.startswith("_")]
+        if not self.shard_by_company and self.shard_rows <= 0:
+            return [(None, user_rows[columns])]
+
+        groups = (
+            user_rows.groupby("_company", sort=False)
+            if self.shard_by_company
+            else [(None, user_rows)]
+        )
+        shards = []
+        for company_name, group in groups:
+            sizes = group.groupby("_user", sort=False).size().to_numpy()
+            user_parts = pack_parts(sizes, self.shard_rows)
+            row_parts = np.repeat(user_parts, sizes)
+            parts = int(user_parts[-1]) + 1
+
+            for number in range(parts):
+                shard = {"part": number + 1, "parts": parts}
+                if self.shard_by_company:
+                    shard = {"company": company_name, **shard}
+                shards.append((shard, group.loc[row_parts == number, columns]))
+        return shards
+
+    def _write_rows(
+        self, folder_name: str, headers: list[str], rows: pd.DataFrame, filename: str
+    ) -> SavedFile:
+        return save_frame_file(
+            folder_name,
+            rows[headers],
+            filename,
+            self.output_format,
+            self.content_addressed,
+        )
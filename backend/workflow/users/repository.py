@@ -8,9 +8,26 @@ from .schema import (
     UserWareHouse,
 )
 
+PRACTITIONER_SERVICE_UNIT = "Service Unit (User Service Unit)"
+PRACTITIONER_COLUMNS = [
+    "ID",
+    "First Name",
+    "Status",
+    "National ID",
+    "HWR Id",
+    "User",
+    PRACTITIONER_SERVICE_UNIT,
+    "Medical Department",
+]
+# A practitioner's rows after the first, one per further service unit. They
+# have no HWR Id cell, which csv writes blank and parquet as null.
+PRACTITIONER_CONTINUATION_ROW = {
+    column: "" for column in PRACTITIONER_COLUMNS if column != "HWR Id"
+}
+
 
 class UsereRepository:
-    async def create_user_csv(self, data: CreateUserRequest):
+    def create_user_csv(self, data: CreateUserRequest):
         """generate user csv data"""
         return [
             {
@@ -24,7 +41,7 @@ class UsereRepository:
             }
         ]
 
-    async def generate_user_permission_csv(self, data: UserPermission):
+    def generate_user_permission_csv(self, data: UserPermission):
         """generate user permission csv data - one row per permission"""
         result = []
         for permission in data.permissions:
@@ -39,7 +56,7 @@ class UsereRepository:
             )
         return result
 
-    async def generate_user_warehouse_csv(self, data: UserWareHouse):
+    def generate_user_warehouse_csv(self, data: UserWareHouse):
         """generate user warehouse csv data"""
         return [
             {
@@ -50,49 +67,37 @@ class UsereRepository:
             }
         ]
 
-    async def generate_healthcare_practitioner_csv(
+    def generate_healthcare_practitioner_csv(
         self,
         data: UserHealthCarePractitioner,
     ):
         """generate healthcare practitioner csv data"""
-        base_data = {
-            "ID": data.national_id,
-            "First Name": data.first_name,
-            "Status": data.status,
-            "National ID": data.national_id,
-            "HWR Id": data.hwr_id or "",
-            "User": data.user,
-            "Service Unit (User Service Unit)": "",
-            "Medical Department": data.medical_department,
-        }
-
-        # Create one row per service unit
-        result = []
-        for unit in data.service_unit:
-            row = base_data.copy()
-            row["Service Unit (User Service Unit)"] = unit
-            # Only the first row gets the full details
-            if len(result) == 0:
-                result.append(row)
-            else:
-                # Subsequent rows only have service unit
-                result.append(
-                    {
-                        "ID": "",
-                        "First Name": "",
-                        "Status": "",
-                        "National ID": "",
-                        "User": "",
-                        "Service Unit (User Service Unit)": unit,
-                        "Medical Department": "",
-                    }
-                )
+        units = iter(data.service_unit)
+        first_unit = next(units, None)
+        if first_unit is None:
+            return []
 
+        # Only the first row gets the full details
+        result = [
+            {
+                "ID": data.national_id,
+                "First Name": data.first_name,
+                "Status": data.status,
+                "National ID": data.national_id,
+                "HWR Id": data.hwr_id or "",
+                "User": data.user,
+                PRACTITIONER_SERVICE_UNIT: first_unit,
+                "Medical Department": data.medical_department,
+            }
+        ]
+        # Subsequent rows only have service unit
+        result.extend(
+            {**PRACTITIONER_CONTINUATION_ROW, PRACTITIONER_SERVICE_UNIT: unit}
+            for unit in units
+        )
         return result
 
-    async def generate_employee_csv(
-        self, data: UserCreateEmployee
-    ) -> list[dict[str, Any]]:
+    def generate_employee_csv(self, data: UserCreateEmployee) -> list[dict[str, Any]]:
         """generate employee csv data"""
         return [
             {
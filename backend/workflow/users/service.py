@@ -1,6 +1,10 @@
+import asyncio
+import os
+import re
 import uuid
+from dataclasses import dataclass, field
 
-from workflow.utils import save_csv_file
+from workflow.utils import OutputFormat, SavedFile, save_csv_file
 
 from .repository import UsereRepository
 from .schema import (
@@ -15,27 +19,81 @@ from .schema import (
 user_repository = UsereRepository()
 
 
+@dataclass
+class CompanyMetadata:
+    password: str
+    has_specialized_roles: bool = False
+    company_permission: Permissions | None = None
+    # Shared by all companies; keyed by warehouse name
+    warehouse_permissions: dict[str, Permissions] = field(default_factory=dict)
+
+
 class UserService:
     SPECIALIZED_ROLES = ["Lab Technician", "Pharmacist"]
 
-    def _group_users_by_company(self, valid_users: list[dict]) -> dict:
-        companies = {}
+    def __init__(
+        self,
+        output_format: OutputFormat = OutputFormat.csv,
+        content_addressed: bool = False,
+        shard_by_company: bool = False,
+        shard_rows: int = 0,
+    ):
+        self.output_format = output_format
+        # Name files by a hash of their content instead of a random UUID
+        self.content_addressed = content_addressed
+        # Split each action's output into one file per company and/or files of
+        # at most ``shard_rows`` rows (0 = no limit), for parallel imports
+        self.shard_by_company = shard_by_company
+        self.shard_rows = shard_rows
+
+    def _company_password(self, company_name: str | None) -> str:
+        # Generate password from company name
+        raw_pass = company_name.split(" ")[0] if company_name else "Default"
+        return f"{raw_pass[0].upper()}{raw_pass[1:].lower()}@2025!"
+
+    def _build_company_index(
+        self, valid_users: list[dict]
+    ) -> dict[str, CompanyMetadata]:
+        """
+        Precompute per-company metadata once per job so the row generators
+        don't re-derive passwords, permissions and role flags per user/action.
+        Users without a company share the "" entry.
+        """
+        index: dict[str, CompanyMetadata] = {
+            "": CompanyMetadata(password=self._company_password(""))
+        }
+        warehouse_permissions: dict[str, Permissions] = {}
 
         for user in valid_users:
             company_name = user.get("company", "")
-            if not company_name:
-                continue
-
-            if company_name not in companies:
-                companies[company_name] = {"users": [], "has_specialized_roles": False}
+            if company_name and company_name not in index:
+                index[company_name] = CompanyMetadata(
+                    password=self._company_password(company_name),
+                    company_permission=Permissions(
+                        allow="Company",
+                        for_value=company_name,
+                        is_default=1,
+                    ),
+                    warehouse_permissions=warehouse_permissions,
+                )
 
-            companies[company_name]["users"].append(user)
+            if company_name and user.get("role", "") in self.SPECIALIZED_ROLES:
+                index[company_name].has_specialized_roles = True
 
-            user_role = user.get("role", "")
-            if user_role in self.SPECIALIZED_ROLES:
-                companies[company_name]["has_specialized_roles"] = True
+            for warehouse in user.get("warehouses", None) or []:
+                if (
+                    isinstance(warehouse, str)
+                    and warehouse not in warehouse_permissions
+                ):
+                    # Main Pharmacy is always default (1), All Warehouses is always 0
+                    warehouse_permissions[warehouse] = Permissions(
+                        allow="Warehouse",
+                        for_value=warehouse,
+                        is_default=1 if warehouse.startswith("Main") else 0,
+                    )
 
-        return companies
+        index[""].warehouse_permissions = warehouse_permissions
+        return index
 
     def _should_create_employee(self, user: dict, has_specialized_roles: bool) -> bool:
         """Determine if user should get employee record."""
@@ -78,6 +136,195 @@ class UserService:
             # Everyone gets warehouse access
             return True
 
+    def _generate_action_rows(
+        self,
+        action_type: str,
+        valid_users: list[dict],
+        company_index: dict[str, CompanyMetadata],
+    ) -> tuple[list[str], list[tuple[str, list[dict]]]]:
+        """
+        Build the rows of a single action. Returns the headers and, per user,
+        the company and that user's rows, so shards never split a user.
+        """
+        user_rows = []
+        headers = []
+
+        for user in valid_users:
+            email = user.get("email", "")
+            company_name = user.get("company", "")
+            warehouses = user.get("warehouses", [])
+
+            company = company_index.get(company_name) or company_index[""]
+            has_specialized_roles = company.has_specialized_roles
+
+            try:
+                rows = None
+
+                if action_type == "create_user":
+                    # Everyone gets user record
+                    payload = CreateUserRequest(
+                        email=email,
+                        first_name=user.get("first_name", ""),
+                        mobile_no=str(user.get("phone_number", "")),
+                        password=company.password,
+                        role_profile=user.get("role", ""),
+                    )
+                    rows = user_repository.create_user_csv(payload)
+
+                elif action_type == "create_user_permission":
+                    # Everyone gets permissions: company first, then warehouses
+                    permissions = []
+                    if company.company_permission:
+                        permissions.append(company.company_permission)
+                    for warehouse in warehouses or []:
+                        permissions.append(company.warehouse_permissions[warehouse])
+
+                    if permissions:
+                        payload = UserPermission(user=email, permissions=permissions)
+                        rows = user_repository.generate_user_permission_csv(payload)
+                    else:
+                        rows = None
+
+                elif action_type == "create_employee":
+                    # Check if this user should get employee record
+                    if not self._should_create_employee(user, has_specialized_roles):
+                        continue
+
+                    payload = UserCreateEmployee(
+                        first_name=user.get("first_name", ""),
+                        gender=user.get("gender", "Unknown"),
+                        date_of_birth="1998-01-01",  # Default
+                        date_of_joining="2023-01-01",  # Default
+                        status=user.get("status", "Active"),
+                        company=company_name,
+                        email=email,
+                    )
+                    rows = user_repository.generate_employee_csv(payload)
+
+                elif action_type == "create_healthcare_practitioner":
+                    # Check if this user should get healthcare practitioner record
+                    if not self._should_create_healthcare_practitioner(
+                        user, has_specialized_roles
+                    ):
+                        continue
+
+                    payload = UserHealthCarePractitioner(
+                        national_id=user.get("national_id", ""),
+                        first_name=user.get("first_name", ""),
+                        status=user.get("status", "Active"),
+                        hwr_id=user.get("hwr_id"),
+                        user=email,
+                        service_unit=user.get("service_units", []),
+                        medical_department=user.get("department", ""),
+                    )
+                    rows = user_repository.generate_healthcare_practitioner_csv(payload)
+
+                elif action_type == "create_user_warehouse":
+                    # Check if this user should get warehouse access
+                    if not self._should_create_user_warehouse(
+                        user, has_specialized_roles
+                    ):
+                        continue
+
+                    # Select first warehouse from user's warehouse list
+                    selected_warehouse = warehouses[0] if warehouses else ""
+                    if not selected_warehouse:
+                        continue
+
+                    payload = UserWareHouse(
+                        user=email,
+                        warehouse=selected_warehouse,
+                        company=company_name,
+                    )
+                    rows = user_repository.generate_user_warehouse_csv(payload)
+
+                if rows:
+                    # Users without a company shard together, as in the index
+                    user_rows.append((company_name or "", rows))
+                    if not headers:
+                        headers = list(rows[0].keys())
+
+            except Exception as e:
+                print(f"✗ Error generating {action_type} for {email}: {e}")
+                continue
+
+        return headers, user_rows
+
+    def _shard_rows(
+        self, user_rows: list[tuple[str, list[dict]]]
+    ) -> list[tuple[dict | None, list[dict]]]:
+        """Split an action's rows per the sharding settings, keeping user order."""
+        if not self.shard_by_company and self.shard_rows <= 0:
+            return [(None, [row for _, rows in user_rows for row in rows])]
+
+        by_company: dict[str | None, list[list[dict]]] = {}
+        for company_name, rows in user_rows:
+            key = company_name if self.shard_by_company else None
+            by_company.setdefault(key, []).append(rows)
+
+        shards = []
+        for company_name, groups in by_company.items():
+            parts: list[list[dict]] = [[]]
+            for rows in groups:
+                if (
+                    self.shard_rows > 0
+                    and parts[-1]
+                    and len(parts[-1]) + len(rows) > self.shard_rows
+                ):
+                    parts.append([])
+                parts[-1].extend(rows)
+
+            for number, part in enumerate(parts, start=1):
+                shard = {"part": number, "parts": len(parts)}
+                if self.shard_by_company:
+                    shard = {"company": company_name, **shard}
+                shards.append((shard, part))
+        return shards
+
+    def _write_rows(
+        self, folder_name: str, headers: list[str], rows: list, filename: str
+    ) -> SavedFile:
+        return save_csv_file(
+            folder_name,
+            rows,
+            headers,
+            filename,
+            self.output_format,
+            self.content_addressed,
+        )
+
+    def _write_action_file(
+        self,
+        action_type: str,
+        headers: list[str],
+        rows: list[dict],
+        folder_name: str,
+        shard: dict | None = None,
+    ) -> dict:
+        """Save one action file (or shard of one), returning its file info."""
+        name = action_type
+        if shard:
+            if "company" in shard:
+                slug = re.sub(r"[^0-9a-z]+", "-", shard["company"].lower()).strip("-")
+                name += f"_{slug or 'no-company'}"
+            if shard["parts"] > 1:
+                name += f"_part{shard['part']:03d}"
+
+        saved = self._write_rows(
+            folder_name, headers, rows, f"{name}_{uuid.uuid4()}.csv"
+        )
+        filename = os.path.basename(saved.path)
+        print(f"✓ Generated {action_type} CSV: {filename} ({len(rows)} rows)")
+
+        return {
+            "file_path": saved.path,
+            "filename": filename,
+            "rows_count": len(rows),
+            "bytes": saved.bytes,
+            "sha256": saved.sha256,
+            "shard": shard,
+        }
+
     async def create_users_from_validation(
         self,
         valid_users: list[dict],
@@ -95,172 +342,51 @@ class UserService:
         else:
             actions = [action]
 
-        # Group users by company and check for specialized roles
-        companies_data = self._group_users_by_company(valid_users)
+        # One pass over the users to precompute everything shared per company
+        company_index = self._build_company_index(valid_users)
 
-        # Create a lookup map for quick access
-        company_specialization_map = {
-            company: data["has_specialized_roles"]
-            for company, data in companies_data.items()
-        }
-
-        results = {}
-        files_created = []
-
-        for action_type in actions:
-            all_rows = []
-            headers = []
-
-            for user in valid_users:
-                email = user.get("email", "")
-                company_name = user.get("company", "")
-                warehouses = user.get("warehouses", [])
-
-                # Get the specialization status for this user's company
-                has_specialized_roles = company_specialization_map.get(
-                    company_name, False
+        # Actions are independent, so build their rows concurrently off the
+        # event loop instead of blocking it on each one in turn
+        action_rows = await asyncio.gather(
+            *(
+                asyncio.to_thread(
+                    self._generate_action_rows, action_type, valid_users, company_index
                 )
-
-                # Generate password from company name
-                raw_pass = company_name.split(" ")[0] if company_name else "Default"
-                password = f"{raw_pass[0].upper()}{raw_pass[1:].lower()}@2025!"
-
-                try:
-                    rows = None
-
-                    if action_type == "create_user":
-                        # Everyone gets user record
-                        payload = CreateUserRequest(
-                            email=email,
-                            first_name=user.get("first_name", ""),
-                            mobile_no=str(user.get("phone_number", "")),
-                            password=password,
-                            role_profile=user.get("role", ""),
-                        )
-                        rows = await user_repository.create_user_csv(payload)
-
-                    elif action_type == "create_user_permission":
-                        # Everyone gets permissions
-                        permissions = []
-
-                        # Company permission
-                        if company_name:
-                            permissions.append(
-                                Permissions(
-                                    allow="Company",
-                                    for_value=company_name,
-                                    is_default=1,
-                                )
-                            )
-
-                        # Warehouse permissions for all users
-                        if warehouses:
-                            for warehouse in warehouses:
-                                # Main Pharmacy is always default (1), All Warehouses is always 0
-                                is_default = 1 if warehouse.startswith("Main") else 0
-
-                                permissions.append(
-                                    Permissions(
-                                        allow="Warehouse",
-                                        for_value=warehouse,
-                                        is_default=is_default,
-                                    )
-                                )
-
-                        if permissions:
-                            payload = UserPermission(
-                                user=email, permissions=permissions
-                            )
-                            rows = await user_repository.generate_user_permission_csv(
-                                payload
-                            )
-                        else:
-                            rows = None
-
-                    elif action_type == "create_employee":
-                        # Check if this user should get employee record
-                        if not self._should_create_employee(
-                            user, has_specialized_roles
-                        ):
-                            continue
-
-                        payload = UserCreateEmployee(
-                            first_name=user.get("first_name", ""),
-                            gender=user.get("gender", "Unknown"),
-                            date_of_birth="1998-01-01",  # Default
-                            date_of_joining="2023-01-01",  # Default
-                            status=user.get("status", "Active"),
-                            company=company_name,
-                            email=email,
-                        )
-                        rows = await user_repository.generate_employee_csv(payload)
-
-                    elif action_type == "create_healthcare_practitioner":
-                        # Check if this user should get healthcare practitioner record
-                        if not self._should_create_healthcare_practitioner(
-                            user, has_specialized_roles
-                        ):
-                            continue
-
-                        payload = UserHealthCarePractitioner(
-                            national_id=user.get("national_id", ""),
-                            first_name=user.get("first_name", ""),
-                            status=user.get("status", "Active"),
-                            hwr_id=user.get("hwr_id"),
-                            user=email,
-                            service_unit=user.get("service_units", []),
-                            medical_department=user.get("department", ""),
-                        )
-                        rows = (
-                            await user_repository.generate_healthcare_practitioner_csv(
-                                payload
-                            )
-                        )
-
-                    elif action_type == "create_user_warehouse":
-                        # Check if this user should get warehouse access
-                        if not self._should_create_user_warehouse(
-                            user, has_specialized_roles
-                        ):
-                            continue
-
-                        # Select first warehouse from user's warehouse list
-                        selected_warehouse = warehouses[0] if warehouses else ""
-                        if not selected_warehouse:
-                            continue
-
-                        payload = UserWareHouse(
-                            user=email,
-                            warehouse=selected_warehouse,
-                            company=company_name,
-                        )
-                        rows = await user_repository.generate_user_warehouse_csv(
-                            payload
-                        )
-
-                    if rows:
-                        all_rows.extend(rows)
-                        if not headers:
-                            headers = list(rows[0].keys())
-
-                except Exception as e:
-                    print(f"✗ Error generating {action_type} for {email}: {e}")
-                    continue
-
-            # Save CSV file if we have rows
-            if all_rows:
-                file_uuid = uuid.uuid4()
-                filename = f"{action_type}_{file_uuid}.csv"
-                filepath = save_csv_file(folder_name, all_rows, headers, filename)
-
-                results[action_type] = {
-                    "file_path": filepath,
-                    "filename": filename,
-                    "rows_count": len(all_rows),
-                }
-                files_created.append(filename)
-                print(
-                    f"✓ Generated {action_type} CSV: {filename} ({len(all_rows)} rows)"
+                for action_type in actions
+            )
+        )
+
+        # Then write every file (or shard) in parallel
+        files = [
+            (action_type, headers, rows, shard)
+            for action_type, (headers, user_rows) in zip(actions, action_rows)
+            if len(user_rows)
+            for shard, rows in self._shard_rows(user_rows)
+        ]
+        results = await asyncio.gather(
+            *(
+                asyncio.to_thread(
+                    self._write_action_file,
+                    action_type,
+                    headers,
+                    rows,
+                    folder_name,
+                    shard,
                 )
-
-        return {"files_created": files_created}
+                for action_type, headers, rows, shard in files
+            )
+        )
+
+        files_created = [result["filename"] for result in results]
+        outputs = {}
+        for (action_type, *_), result in zip(files, results):
+            outputs[result["filename"]] = {
+                "action": action_type,
+                "rows": result["rows_count"],
+                "bytes": result["bytes"],
+                "sha256": result["sha256"],
+            }
+            if result["shard"]:
+                outputs[result["filename"]]["shard"] = result["shard"]
+
+        return {"files_created": files_created, "outputs": outputs}
@@ -1,30 +1,316 @@
+import contextlib
 import csv
+import gzip
+import hashlib
+import io
 import logging
 import os
 import pathlib
-from typing import Any
-
-import pandas as pd
+import re
+import uuid
+import zipfile
+from collections.abc import Callable
+from enum import Enum
+from typing import Any, NamedTuple
 
 logger = logging.getLogger(__name__)
 
 
+class OutputFormat(Enum):
+    csv = "csv"
+    csv_gz = "csv_gz"
+    parquet = "parquet"
+
+
+class OutputPackaging(Enum):
+    files = "files"  # one upload per generated table
+    xlsx = "xlsx"  # one workbook, one sheet per table
+    zip = "zip"  # one archive holding every generated file
+
+
+# S3 object headers for each generated file extension
+OUTPUT_CONTENT_HEADERS: dict[str, dict[str, str]] = {
+    ".csv": {"ContentType": "text/csv"},
+    ".gz": {"ContentType": "text/csv", "ContentEncoding": "gzip"},
+    ".parquet": {"ContentType": "application/vnd.apache.parquet"},
+    ".xlsx": {
+        "ContentType": (
+            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
+    },
+    ".zip": {"ContentType": "application/zip"},
+}
+
+
+def output_content_headers(filename: str) -> dict[str, str]:
+    """Return the S3 ExtraArgs describing a generated output file."""
+    return OUTPUT_CONTENT_HEADERS.get(pathlib.Path(filename).suffix.lower(), {})
+
+
+class SavedFile(NamedTuple):
+    path: str
+    bytes: int
+    sha256: str
+
+
+class _DigestWriter(io.RawIOBase):
+    """Binary sink that hashes and counts bytes on their way into ``file``."""
+
+    def __init__(self, file: Any):
+        self.file = file
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.digest.update(data)
+        self.size += len(data)
+        self.file.write(data)
+        return len(data)
+
+
+@contextlib.contextmanager
+def _open_output(filepath: str, text: bool = True, compress: bool = False):
+    """
+    Open an output for writing and yield ``(stream, sink)``; once the block
+    exits, ``sink`` holds the size and SHA-256 of the bytes on disk. Gzip
+    headers carry no name or timestamp, so equal content gives equal bytes.
+    """
+    with open(filepath, "wb") as f:
+        sink = _DigestWriter(f)
+        buffered = io.BufferedWriter(sink)
+        stream = buffered
+        if compress:
+            stream = gzip.GzipFile(filename="", mode="wb", fileobj=buffered, mtime=0)
+        if text:
+            stream = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+        yield stream, sink
+        stream.close()
+        buffered.close()
+
+
+def _saved_file(
+    filepath: str, filename: str, sink: _DigestWriter, content_addressed: bool
+) -> SavedFile:
+    sha256 = sink.digest.hexdigest()
+    if content_addressed:
+        # "<action>_<uuid>.csv" -> "<action>_<sha256 prefix>.csv": re-running a
+        # job with the same result produces the same object key
+        name = os.path.basename(filepath)
+        extension = name[len(pathlib.Path(filename).stem) :]
+        stable_path = os.path.join(
+            os.path.dirname(filepath),
+            f"{filename.rsplit('_', 1)[0]}_{sha256[:16]}{extension}",
+        )
+        os.replace(filepath, stable_path)
+        filepath = stable_path
+    return SavedFile(filepath, sink.size, sha256)
+
+
+def _output_path(folder_name: str, filename: str, output_format: OutputFormat) -> str:
+    if output_format == OutputFormat.parquet:
+        filename = str(pathlib.Path(filename).with_suffix(".parquet"))
+    elif output_format == OutputFormat.csv_gz:
+        filename = f"{filename}.gz"
+    return os.path.join(folder_name, filename)
+
+
+def _write_parquet(file: Any, rows: list[dict[str, Any]], headers: list[str]):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("Parquet output requires pyarrow to be installed") from e
+
+    # Keep every column as string so mixed blank/int cells don't break the schema
+    columns = {
+        header: [
+            None if row.get(header) is None else str(row.get(header)) for row in rows
+        ]
+        for header in headers
+    }
+    pq.write_table(pa.table(columns), file, compression="zstd")
+
+
 def save_csv_file(
-    folder_name: str, rows: list[dict[str, Any]], headers: list[str], filename: str
-) -> str:
+    folder_name: str,
+    rows: list[dict[str, Any]],
+    headers: list[str],
+    filename: str,
+    output_format: OutputFormat = OutputFormat.csv,
+    content_addressed: bool = False,
+) -> SavedFile:
+    """
+    Write rows and return the file's path, size and SHA-256, hashed while
+    writing. With ``content_addressed`` the name's trailing "_<uuid>" is
+    replaced by a prefix of the hash.
+    """
     os.makedirs(folder_name, exist_ok=True)
-    filepath = os.path.join(folder_name, filename)
+    filepath = _output_path(folder_name, filename, output_format)
+
+    if output_format == OutputFormat.parquet:
+        with _open_output(filepath, text=False) as (stream, sink):
+            _write_parquet(stream, rows, headers)
+    else:
+        compress = output_format == OutputFormat.csv_gz
+        with _open_output(filepath, compress=compress) as (stream, sink):
+            writer = csv.DictWriter(stream, fieldnames=headers)
+            writer.writeheader()
+            writer.writerows(rows)
+
+    return _saved_file(filepath, filename, sink, content_addressed)
+
+
+def save_frame_file(
+    folder_name: str,
+    frame: Any,
+    filename: str,
+    output_format: OutputFormat = OutputFormat.csv,
+    content_addressed: bool = False,
+) -> SavedFile:
+    """
+    DataFrame counterpart of ``save_csv_file``. Missing cells (None) are written
+    blank with the csv module's CRLF line endings, so a frame holding the same
+    rows produces the same bytes.
+    """
+    os.makedirs(folder_name, exist_ok=True)
+    filepath = _output_path(folder_name, filename, output_format)
+
+    if output_format == OutputFormat.parquet:
+        with _open_output(filepath, text=False) as (stream, sink):
+            _write_parquet(stream, frame.to_dict("records"), list(frame.columns))
+    else:
+        compress = output_format == OutputFormat.csv_gz
+        with _open_output(filepath, compress=compress) as (stream, sink):
+            frame.to_csv(stream, index=False, lineterminator="\r\n")
+
+    return _saved_file(filepath, filename, sink, content_addressed)
+
 
-    with open(filepath, "w", newline="", encoding="utf-8") as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=headers)
-        writer.writeheader()
-        writer.writerows(rows)
+def iter_output_rows(filepath: str):
+    """Yield the header and data rows of a generated output file."""
+    if filepath.endswith(".parquet"):
+        import pyarrow.parquet as pq
 
-    return filepath
+        table = pq.read_table(filepath)
+        yield table.column_names
+        for batch in table.to_batches():
+            yield from zip(*(column.to_pylist() for column in batch.columns))
+        return
+
+    opener = gzip.open if filepath.endswith(".gz") else open
+    with opener(filepath, "rt", newline="", encoding="utf-8") as f:
+        yield from csv.reader(f)
+
+
+# Excel's row limit per sheet, header included; longer tables continue on
+# further sheets
+XLSX_MAX_ROWS = 1_048_576
+
+# Output columns that hold counts or 0/1 flags, written to xlsx as numbers.
+# Every other column stays text: IDs, phone numbers and amounts such as
+# "12.50" must reach the workbook exactly as generated.
+XLSX_NUMERIC_COLUMNS = frozenset(
+    {
+        "Allow Appointments",
+        "Beds",
+        "Inpatient Occupancy",
+        "Is Default",
+        "Is Group",
+        "Is MCH",
+        "Service Unit Capacity",
+    }
+)
+
+INTEGER_CELL = re.compile(r"-?(?:0|[1-9][0-9]{0,14})")
+
+
+def _xlsx_cell(value: Any) -> Any:
+    """A numeric column's cell as an int when it holds a plain integer."""
+    if isinstance(value, str) and INTEGER_CELL.fullmatch(value):
+        return int(value)
+    return value
+
+
+def _sheet_title(filename: str, taken: set[str]) -> str:
+    # "create_user_<uuid or hash>.csv.gz" -> "create_user"; Excel caps titles
+    # at 31 chars
+    stem = filename.split(".")[0]
+    stem = re.sub(
+        r"_([0-9a-f]{8}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{12}"
+        r"|[0-9a-f]{16})$",
+        "",
+        stem,
+    )
+    title = stem[:31] or "Sheet"
+    suffix = 2
+    while title in taken:
+        title = f"{stem[: 31 - len(str(suffix)) - 1]}_{suffix}"
+        suffix += 1
+    taken.add(title)
+    return title
+
+
+def package_outputs(
+    files: list[str], folder_name: str, packaging: OutputPackaging, prefix: str
+) -> list[str]:
+    """
+    Bundle generated files into a single artifact so a job uploads one object.
+    Returns the file names to upload (unchanged for ``OutputPackaging.files``).
+    """
+    if packaging == OutputPackaging.files or not files:
+        return files
+
+    artifact = f"{prefix}_{uuid.uuid4()}.{packaging.value}"
+    artifact_path = os.path.join(folder_name, artifact)
+
+    if packaging == OutputPackaging.zip:
+        with zipfile.ZipFile(
+            artifact_path, "w", compression=zipfile.ZIP_DEFLATED
+        ) as zf:
+            for file in files:
+                zf.write(os.path.join(folder_name, file), arcname=file)
+        return [artifact]
+
+    from openpyxl import Workbook
+
+    # Write-only mode streams rows to disk instead of building the sheet in memory
+    workbook = Workbook(write_only=True)
+    taken: set[str] = set()
+    for file in files:
+        rows = iter_output_rows(os.path.join(folder_name, file))
+        header = next(rows, None)
+        sheet = workbook.create_sheet(title=_sheet_title(file, taken))
+        sheet_rows = 0
+        if header is not None:
+            sheet.append(list(header))
+            sheet_rows += 1
+        numeric = [
+            index
+            for index, name in enumerate(header or [])
+            if name in XLSX_NUMERIC_COLUMNS
+        ]
+        for row in rows:
+            if sheet_rows == XLSX_MAX_ROWS:
+                sheet = workbook.create_sheet(title=_sheet_title(file, taken))
+                sheet.append(list(header))
+                sheet_rows = 1
+            row = list(row)
+            for index in numeric:
+                if index < len(row):
+                    row[index] = _xlsx_cell(row[index])
+            sheet.append(row)
+            sheet_rows += 1
+    workbook.save(artifact_path)
+    return [artifact]
 
 
 def read_file_to_csv(file_path: str) -> str:
     """Read spreadsheet file and return as CSV string."""
+    from workflow.lazy import pandas as pd
+
     ext = pathlib.Path(file_path).suffix.lower()
 
     try:
@@ -39,3 +325,82 @@ def read_file_to_csv(file_path: str) -> str:
     except Exception as e:
         print(f"Error: {e}")
         raise
+
+
+def parse_csv_rows(csv_text: str) -> tuple[list[str], list[list[str]]]:
+    """Parse CSV text into its header and non-blank data rows."""
+    reader = csv.reader(io.StringIO(csv_text))
+    header = next(reader, [])
+    return header, [row for row in reader if any(row)]
+
+
+def read_csv_text(file_path: str) -> tuple[str, int]:
+    """Read a CSV file, counting its non-blank data rows in the same pass."""
+    lines: list[str] = []
+
+    def record(handle):
+        for line in handle:
+            lines.append(line)
+            yield line
+
+    with open(file_path, encoding="utf-8") as handle:
+        reader = csv.reader(record(handle))
+        next(reader, None)
+        rows = sum(1 for row in reader if any(row))
+    return "".join(lines), rows
+
+
+def format_csv_rows(rows: list[list[Any]]) -> str:
+    output = io.StringIO()
+    csv.writer(output, lineterminator="\n").writerows(rows)
+    return output.getvalue()
+
+
+def split_csv_groups(
+    csv_text: str,
+    column: str | None = None,
+    key: Callable[[str], Any] | None = None,
+) -> tuple[str, list[str]]:
+    """Split CSV text into its header line and row groups.
+
+    Rows are grouped by the value of ``column`` (optionally mapped through
+    ``key``) in order of first appearance, or kept one per group when no column
+    is given. Each group is CSV text without the header, so groups can be
+    re-joined under the header in batches.
+    """
+    reader = csv.reader(io.StringIO(csv_text))
+    header = next(reader, None)
+    if header is None:
+        return "", []
+
+    key_index = header.index(column) if column and column in header else None
+    groups: dict[Any, io.StringIO] = {}
+    for position, row in enumerate(reader):
+        if not any(row):
+            continue
+        if key_index is not None:
+            group_key = key(row[key_index]) if key else row[key_index]
+        else:
+            # Without the grouping column everything stays together
+            group_key = None if column else position
+        buffer = groups.setdefault(group_key, io.StringIO())
+        csv.writer(buffer, lineterminator="\n").writerow(row)
+
+    header_buffer = io.StringIO()
+    csv.writer(header_buffer, lineterminator="\n").writerow(header)
+    return header_buffer.getvalue(), [g.getvalue() for g in groups.values()]
+
+
+def number_csv_rows(csv_text: str, column: str = "row_index") -> str:
+    """Prefix each data row with its 1-based position so results can be traced back."""
+    reader = csv.reader(io.StringIO(csv_text))
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator="\n")
+    header = next(reader, None)
+    if header is None:
+        return csv_text
+
+    writer.writerow([column, *header])
+    for position, row in enumerate(reader, start=1):
+        writer.writerow([position, *row])
+    return output.getvalue()